@@ -1,26 +1,23 @@
-from urllib2 import urlopen, URLError
-from bs4 import BeautifulSoup
-from os.path import join, dirname, basename
-from os import makedirs
-from errno import EEXIST
-from threading import Thread
-from Queue import Queue
-from re import compile, sub
+from os.path import join, dirname, basename, exists, getsize, getmtime
+from os import rename, remove
+from threading import Lock
+from hashlib import md5
+from multiprocessing import Pool, cpu_count
 from sys import stderr, stdout
-from itertools import takewhile
 import argparse
-from json import dump, load
+from json import dumps, load
 from zipfile import ZipFile
 from tempfile import gettempdir
 import warnings
 from distutils.version import LooseVersion
 
-from tools.flash_algo import PackFlashAlgo
+from tools.arm_pack_manager.downloader import Downloader, do_queue, \
+    strip_protocol
+from tools.arm_pack_manager.pdsc import parse_pdsc
+from tools.arm_pack_manager.lookup import device_lookup
 
 warnings.filterwarnings("ignore")
 
-from fuzzywuzzy import process
-
 RootPackURL = "http://www.keil.com/pack/index.idx"
 
 LocalPackDir = dirname(__file__)
@@ -28,35 +25,18 @@ LocalPackIndex = join(LocalPackDir, "index.json")
 LocalPackAliases = join(LocalPackDir, "aliases.json")
 
 
-protocol_matcher = compile("\w*://")
-def strip_protocol(url) :
-    return protocol_matcher.sub("", str(url))
+# Timeout, in seconds, of connecting and of every read while downloading
+DownloadTimeout = 60
+
+# The index of every cached PDSC file, kept in the cache so that only the
+# PDSC files that changed are indexed again
+IndexFragments = "index_fragments.json"
+IndexFragmentsVersion = 1
 
 def largest_version(content) :
     return sorted([t['version'] for t in content.package.releases('release')],
                   reverse=True, key=lambda v: LooseVersion(v))[0]
 
-def do_queue(Class, function, interable) :
-    q = Queue()
-    threads = [Class(q, function) for each in range(20)]
-    for each in threads :
-        each.setDaemon(True)
-        each.start()
-    for thing in interable :
-        q.put(thing)
-    q.join()
-
-class Reader (Thread) :
-    def __init__(self, queue, func) :
-        Thread.__init__(self)
-        self.queue = queue
-        self.func = func
-    def run(self) :
-        while True :
-            url = self.queue.get()
-            self.func(url)
-            self.queue.task_done()
-
 
 class Cache () :
     """ The Cache object is the only relevant API object at the moment
@@ -68,8 +48,10 @@ class Cache () :
     :type silent: bool
     :param no_timeouts: A boolean that, when True, disables the default connection timeout and low speed timeout for downloading things.
     :type no_timeouts: bool
+    :param jobs: The number of files downloaded or parsed at once.
+    :type jobs: int
     """
-    def __init__ (self, silent, no_timeouts) :
+    def __init__ (self, silent, no_timeouts, jobs=20) :
         self.silent = silent
         self.counter = 0
         self.total = 1
@@ -77,7 +59,25 @@ class Cache () :
         self._aliases = {}
         self.urls = None
         self.no_timeouts = no_timeouts
+        self.jobs = jobs
         self.data_path = gettempdir()
+        self._downloader = None
+        self._counter_lock = Lock()
+        self._fragments = None
+
+    @property
+    def downloader (self) :
+        """The Downloader of files into the cache, at data_path"""
+        if self._downloader is None or self._downloader.data_path != self.data_path :
+            self._downloader = Downloader(
+                self.data_path, self.jobs,
+                timeout=None if self.no_timeouts else DownloadTimeout)
+        return self._downloader
+
+    def count (self, message) :
+        with self._counter_lock :
+            self.counter += 1
+            self.display_counter(message)
 
     def display_counter (self, message) :
         stdout.write("{} {}/{}\r".format(message, self.counter, self.total))
@@ -86,24 +86,16 @@ class Cache () :
     def cache_file (self, url) :
         """Low level interface to caching a single file.
 
+        The file is only downloaded when it changed since it was cached.
+
         :param url: The URL to cache.
         :type url: str
         :rtype: None
         """
         if not self.silent : print("Caching {}...".format(url))
-        dest = join(self.data_path, strip_protocol(url))
-        try :
-            makedirs(dirname(dest))
-        except OSError as exc :
-            if exc.errno == EEXIST : pass
-            else : raise
-        try:
-            with open(dest, "wb+") as fd :
-                fd.write(urlopen(url).read())
-        except URLError as e:
-            stderr.write(e.reason)
-        self.counter += 1
-        self.display_counter("Caching Files")
+        self.downloader.fetch(url)
+        self._fragments = None
+        self.count("Caching Files")
 
     def pdsc_to_pack (self, url) :
         """Find the URL of the specified pack file described by a PDSC.
@@ -115,7 +107,10 @@ class Cache () :
         :return: The url of the PACK file.
         :rtype: str
         """
-        content = self.pdsc_from_cache(url)
+        return self._pack_url(self.pdsc_from_cache(url))
+
+    @staticmethod
+    def _pack_url (content) :
         new_url = content.package.url.get_text()
         if not new_url.endswith("/") :
             new_url = new_url + "/"
@@ -127,9 +122,9 @@ class Cache () :
         self.cache_file(url)
         try :
             self.cache_file(self.pdsc_to_pack(url))
-        except AttributeError :
+        except (AttributeError, IOError) :
             stderr.write("[ ERROR ] {} does not appear to be a conforming .pdsc file\n".format(url))
-            self.counter += 1
+            self.count("Caching Files")
 
     def get_urls(self):
         """Extract the URLs of all know PDSC files.
@@ -160,6 +155,7 @@ class Cache () :
             algo_itr = (pack.open(path) for path in device['algorithm'].keys())
             algo_bin = algo_itr.next()
             flm_file = algo_bin.read()
+            from tools.flash_algo import PackFlashAlgo
             return PackFlashAlgo(flm_file).sector_sizes
         except:
             return None
@@ -246,30 +242,125 @@ class Cache () :
 
         return to_ret
 
-    def _generate_index_helper(self, d) :
+    def _index_pdsc (self, url) :
+        """Index the devices and boards of a single PDSC file.
+
+        :param url: The URL of the PDSC file.
+        :type url: str
+        :return: The fragment of the index and of the aliases from this file
+        :rtype: dict
+        """
+        fragment = dict(hash=self._pdsc_hash(url), devices={}, aliases={},
+                        pack=None, pack_stamp=None)
+        try :
+            content = self.pdsc_from_cache(url)
+        except IOError as e :
+            stderr.write("[ ERROR ] file {}\n".format(url))
+            return fragment
         try :
-            pack = self.pdsc_to_pack(d)
-            self._index.update(dict([(dev['dname'], self._extract_dict(dev, d, pack)) for dev in
-                                    (self.pdsc_from_cache(d)("device"))]))
-        except AttributeError as e :
-            stderr.write("[ ERROR ] file {}\n".format(d))
+            pack = self._pack_url(content)
+            fragment["pack"] = pack
+            fragment["pack_stamp"] = self._pack_stamp(pack)
+            fragment["devices"] = dict([(dev['dname'], self._extract_dict(dev, url, pack))
+                                        for dev in content("device")])
+        except (AttributeError, IndexError) as e :
+            stderr.write("[ ERROR ] file {}\n".format(url))
             print(e)
-        self.counter += 1
-        self.display_counter("Generating Index")
-
-    def _generate_aliases_helper(self, d) :
         try :
             mydict = []
-            for dev in self.pdsc_from_cache(d)("board"):
+            for dev in content("board"):
                 try :
                     mydict.append((dev['name'], dev.mounteddevice['dname']))
                 except (KeyError, TypeError, IndexError) as e:
                     pass
-            self._aliases.update(dict(mydict))
+            fragment["aliases"] = dict(mydict)
         except (AttributeError, TypeError) as e :
             pass
-        self.counter += 1
-        self.display_counter("Scanning for Aliases")
+        return fragment
+
+    def _pdsc_hash (self, url) :
+        try :
+            with open(join(self.data_path, strip_protocol(url)), "rb") as fd :
+                return md5(fd.read()).hexdigest()
+        except IOError :
+            return None
+
+    def _pack_stamp (self, pack) :
+        """The size and modification time of a cached PACK file; the flash
+        sectors of the index are read from it"""
+        dest = join(self.data_path, strip_protocol(pack))
+        try :
+            return [getsize(dest), getmtime(dest)]
+        except OSError :
+            return None
+
+    def _is_current (self, fragment, url) :
+        return (fragment is not None and fragment["hash"] is not None and
+                fragment["hash"] == self._pdsc_hash(url) and
+                (fragment["pack"] is None or
+                 fragment["pack_stamp"] == self._pack_stamp(fragment["pack"])))
+
+    def _load_fragments (self) :
+        try :
+            with open(join(self.data_path, IndexFragments)) as fd :
+                data = load(fd)
+            if data["version"] == IndexFragmentsVersion :
+                return data["fragments"]
+        except (IOError, ValueError, KeyError) :
+            pass
+        return {}
+
+    def _save_fragments (self, fragments) :
+        filename = join(self.data_path, IndexFragments)
+        try :
+            with open(filename + ".tmp", "w") as fd :
+                fd.write(dumps(dict(version=IndexFragmentsVersion,
+                                    fragments=fragments)))
+            if exists(filename) :
+                remove(filename)
+            rename(filename + ".tmp", filename)
+        except (IOError, OSError) :
+            # Only an optimization; the index is generated anyway
+            pass
+
+    def index_fragments (self, message) :
+        """Index every cached PDSC file, reusing the index of the files that
+        did not change since they were last indexed.
+
+        The files that changed are parsed by a pool of processes.
+
+        :param message: Shown with the progress.
+        :type message: str
+        :return: The fragment of the index of every PDSC file, in the order of get_urls
+        :rtype: [dict]
+        """
+        if self._fragments is None :
+            urls = self.get_urls()
+            fragments = self._load_fragments()
+            changed = [url for url in urls
+                       if not self._is_current(fragments.get(url), url)]
+            self.counter = len(urls) - len(changed)
+            self.total = len(urls)
+            self.display_counter(message)
+            jobs = min(self.jobs, cpu_count(), len(changed))
+            if jobs > 1 :
+                pool = Pool(jobs)
+                try :
+                    results = pool.imap_unordered(
+                        _index_pdsc, [(self.data_path, url) for url in changed])
+                    for url, fragment in results :
+                        fragments[url] = fragment
+                        self.count(message)
+                finally :
+                    pool.terminate()
+                    pool.join()
+            else :
+                for url in changed :
+                    fragments[url] = self._index_pdsc(url)
+                    self.count(message)
+            self._fragments = [fragments[url] for url in urls]
+            self._save_fragments(dict(zip(urls, self._fragments)))
+        return self._fragments
 
     def get_flash_algorthim_binary(self, device_name, all=False) :
         """Retrieve the flash algorithm file for a particular part.
@@ -305,30 +396,48 @@ class Cache () :
 
     def generate_index(self) :
         self._index = {}
-        self.counter = 0
-        do_queue(Reader, self._generate_index_helper, self.get_urls())
+        for fragment in self.index_fragments("Generating Index") :
+            self._index.update(fragment["devices"])
         with open(LocalPackIndex, "wb+") as out:
             self._index["version"] = "0.1.0"
-            dump(self._index, out)
+            # dumps encodes in C, where dump writes every token from Python
+            out.write(dumps(self._index))
         stdout.write("\n")
 
     def generate_aliases(self) :
         self._aliases = {}
-        self.counter = 0
-        do_queue(Reader, self._generate_aliases_helper, self.get_urls())
+        for fragment in self.index_fragments("Scanning for Aliases") :
+            self._aliases.update(fragment["aliases"])
         with open(LocalPackAliases, "wb+") as out:
-            dump(self._aliases, out)
+            out.write(dumps(self._aliases))
         stdout.write("\n")
 
     def find_device(self, match) :
-        choices = process.extract(match, self.index.keys(), limit=len(self.index))
-        choices = sorted([(v, k) for k, v in choices], reverse=True)
-        if choices : choices = list(takewhile(lambda t: t[0] == choices[0][0], choices))
-        return [(v, self.index[v]) for k,v in choices]
+        """Find the devices best matching a name, with the lookup.
+
+        :param match: A device name, or part of one.
+        :type match: str
+        :return: The name and index entry of every device found
+        :rtype: [(str, dict)]
+        """
+        return self.lookup.find(match)
+
+    @property
+    def lookup(self) :
+        """A lookup of the devices of the index, without loading the index.
+
+        :Example:
+
+        >>> from ArmPackManager import Cache
+        >>> a = Cache()
+        >>> a.lookup.get("LPC1768")["debug"]
+        u'SVD/LPC176x5x.svd'
+        """
+        return device_lookup(LocalPackIndex)
 
     def dump_index_to_file(self, file) :
         with open(file, "wb+") as out:
-            dump(self.index, out)
+            out.write(dumps(self.index))
 
     @property
     def index(self) :
@@ -388,7 +497,8 @@ class Cache () :
     def cache_everything(self) :
         """Cache every PACK and PDSC file known.
 
-        Generates an index afterwards.
+        Generates an index afterwards. Files that did not change since they
+        were cached are not downloaded again.
 
         .. note:: This process may use 4GB of drive space and take upwards of 10 minutes to complete.
         """
@@ -415,8 +525,9 @@ class Cache () :
         """
         self.total = len(list)
         self.display_counter("Caching Files")
-        do_queue(Reader, self.cache_file, list)
+        do_queue(self.cache_file, list, self.jobs)
         stdout.write("\n")
+        self.display_download_stats()
 
     def cache_pack_list(self, list) :
         """Cache a list of PACK files, referenced by their PDSC URL
@@ -426,8 +537,14 @@ class Cache () :
         """
         self.total = len(list) * 2
         self.display_counter("Caching Files")
-        do_queue(Reader, self.cache_pdsc_and_pack, list)
+        do_queue(self.cache_pdsc_and_pack, list, self.jobs)
         stdout.write("\n")
+        self.display_download_stats()
+
+    def display_download_stats (self) :
+        if not self.silent :
+            print(", ".join("{} {}".format(count, outcome) for outcome, count
+                            in sorted(self.downloader.stats.iteritems())))
 
     def pdsc_from_cache(self, url) :
         """Low level inteface for extracting a PDSC file from the cache.
@@ -437,11 +554,10 @@ class Cache () :
         :param url: The URL of a PDSC file.
         :type url: str
         :return: A parsed representation of the PDSC file.
-        :rtype: BeautifulSoup
+        :rtype: XmlElement, or BeautifulSoup if the file is not well formed
         """
         dest = join(self.data_path, strip_protocol(url))
-        with open(dest, "r") as fd :
-            return BeautifulSoup(fd, "html.parser")
+        return parse_pdsc(dest)
 
     def pack_from_cache(self, device) :
         """Low level inteface for extracting a PACK file from the cache.
@@ -465,7 +581,15 @@ class Cache () :
         :param url: The URL of the PDSC file.
         :type url: str
         :return: A parsed representation of the PDSC file.
-        :rtype: BeautifulSoup
+        :rtype: XmlElement, or BeautifulSoup if the file is not well formed
         """
         self.cache_file(url)
         return self.pdsc_from_cache(url)
+
+
+def _index_pdsc (args) :
+    """Index a PDSC file in a worker process of Cache.index_fragments"""
+    data_path, url = args
+    cache = Cache(True, False)
+    cache.data_path = data_path
+    return url, cache._index_pdsc(url)
@@ -0,0 +1,221 @@
+from urllib2 import urlopen, Request, URLError, HTTPError
+from httplib import HTTPException
+from os.path import join, dirname, exists, getsize
+from os import makedirs, rename, remove
+from errno import EEXIST
+from threading import Thread, Lock
+from Queue import Queue
+from socket import error as SocketError
+from json import dump, load
+from sys import stderr
+import re
+
+
+def strip_protocol(url) :
+    return re.sub(r"\w*://", "", str(url))
+
+
+class Downloader (object) :
+    """ Downloads files into a directory tree mirroring their URLs
+
+    Files are streamed to a ``.part`` file next to their destination and
+    renamed into place once complete, so an interrupted download never
+    leaves a truncated file behind. The ``.part`` file is resumed with a
+    range request by the next download of the same URL.
+
+    The ETag and Last-Modified headers of every file are kept in a
+    ``.headers`` file next to it. They are sent back with the next download,
+    so that the server may answer that the file did not change, instead of
+    sending it again.
+
+    :param data_path: The directory that files are downloaded into.
+    :type data_path: str
+    :param jobs: The number of downloads, and so of connections, at once.
+    :type jobs: int
+    :param timeout: The connection and read timeout in seconds, or None.
+    :type timeout: float
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    # Outcomes of a download
+    DOWNLOADED = "downloaded"
+    RESUMED = "resumed"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+    def __init__ (self, data_path, jobs=20, timeout=None) :
+        self.data_path = data_path
+        self.jobs = jobs
+        self.timeout = timeout
+        self.stats = dict((outcome, 0) for outcome in
+                          (self.DOWNLOADED, self.RESUMED, self.UNCHANGED,
+                           self.FAILED))
+        self._lock = Lock()
+
+    def destination (self, url) :
+        """The file that the contents of *url* are downloaded to"""
+        return join(self.data_path, strip_protocol(url))
+
+    @staticmethod
+    def _read_headers (filename) :
+        try :
+            with open(filename) as fd :
+                return load(fd)
+        except (IOError, ValueError) :
+            return {}
+
+    @staticmethod
+    def _write_headers (filename, response) :
+        headers = dict((name, response.info().getheader(name))
+                       for name in ("ETag", "Last-Modified"))
+        headers = dict((k, v) for k, v in headers.iteritems() if v)
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, "w") as fd :
+            dump(headers, fd)
+        _replace(tmp_file, filename)
+
+    def _urlopen (self, request) :
+        if self.timeout is None :
+            return urlopen(request)
+        return urlopen(request, timeout=self.timeout)
+
+    def _request (self, url, dest, part) :
+        """Build the request for *url*, conditional on the cached file, or
+        resuming the partial download *part*"""
+        request = Request(url)
+        resume_from = 0
+        if exists(part) :
+            validator = self._read_headers(part + ".headers")
+            validator = validator.get("ETag") or validator.get("Last-Modified")
+            if validator :
+                resume_from = getsize(part)
+                request.add_header("Range", "bytes=%d-" % resume_from)
+                request.add_header("If-Range", validator)
+        elif exists(dest) :
+            cached = self._read_headers(dest + ".headers")
+            if "ETag" in cached :
+                request.add_header("If-None-Match", cached["ETag"])
+            if "Last-Modified" in cached :
+                request.add_header("If-Modified-Since", cached["Last-Modified"])
+        return request, resume_from
+
+    def fetch (self, url) :
+        """Download a single file, unless it did not change
+
+        :param url: The URL to download.
+        :type url: str
+        :return: One of DOWNLOADED, RESUMED, UNCHANGED or FAILED
+        :rtype: str
+        """
+        dest = self.destination(url)
+        part = dest + ".part"
+        try :
+            makedirs(dirname(dest))
+        except OSError as exc :
+            if exc.errno != EEXIST : raise
+        request, resume_from = self._request(url, dest, part)
+        try :
+            try :
+                response = self._urlopen(request)
+            except HTTPError as e :
+                if e.code == 304 :
+                    return self._count(self.UNCHANGED)
+                if e.code == 416 and resume_from :
+                    # The partial download does not match the file any more
+                    _remove(part)
+                    request, resume_from = self._request(url, dest, part)
+                    response = self._urlopen(request)
+                else :
+                    raise
+            resumed = resume_from and response.getcode() == 206
+            self._write_headers(part + ".headers", response)
+            length = response.info().getheader("Content-Length")
+            received = 0
+            with open(part, "ab" if resumed else "wb") as fd :
+                while True :
+                    chunk = response.read(self.CHUNK_SIZE)
+                    if not chunk :
+                        break
+                    fd.write(chunk)
+                    received += len(chunk)
+            if length is not None and received != int(length) :
+                raise IOError("connection closed after {} of {} bytes"
+                              .format(received, length))
+            _replace(part + ".headers", dest + ".headers")
+            _replace(part, dest)
+            return self._count(self.RESUMED if resumed else self.DOWNLOADED)
+        except HTTPError as e :
+            _remove(part)
+            _remove(part + ".headers")
+            return self._failed(url, e)
+        except (URLError, HTTPException, SocketError, IOError) as e :
+            # The partial download is kept, to be resumed next time
+            return self._failed(url, e)
+
+    def _count (self, outcome) :
+        with self._lock :
+            self.stats[outcome] += 1
+        return outcome
+
+    def _failed (self, url, error) :
+        reason = getattr(error, "reason", None) or str(error)
+        stderr.write("[ ERROR ] {}: {}\n".format(url, reason))
+        return self._count(self.FAILED)
+
+    def fetch_all (self, urls, function=None) :
+        """Download many files, at most *jobs* at once
+
+        :param urls: The URLs to download.
+        :type urls: [str]
+        :param function: Called with every URL instead of fetch, e.g. to
+                         download more than one file per URL.
+        """
+        do_queue(function or self.fetch, urls, self.jobs)
+
+
+def _replace (source, dest) :
+    """Rename *source* to *dest*, replacing *dest*"""
+    try :
+        rename(source, dest)
+    except OSError :
+        # Windows does not replace existing files
+        _remove(dest)
+        rename(source, dest)
+
+
+def _remove (filename) :
+    try :
+        remove(filename)
+    except OSError :
+        pass
+
+
+def do_queue (function, iterable, jobs) :
+    """Call *function* with every item of *iterable*, on at most *jobs*
+    threads. The first exception raised by *function*, if any, is raised
+    again once all items are done."""
+    q = Queue()
+    for thing in iterable :
+        q.put(thing)
+    errors = []
+
+    def work () :
+        while True :
+            thing = q.get()
+            try :
+                if thing is None :
+                    return
+                function(thing)
+            except Exception as e :
+                errors.append(e)
+            finally :
+                q.task_done()
+
+    threads = [Thread(target=work) for _ in range(max(1, min(jobs, q.qsize())))]
+    for thread in threads :
+        q.put(None)
+        thread.setDaemon(True)
+        thread.start()
+    q.join()
+    if errors :
+        raise errors[0]
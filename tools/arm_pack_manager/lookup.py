@@ -0,0 +1,289 @@
+from os import stat, rename, remove, getpid
+from os.path import exists
+from json import load, loads, dumps
+from struct import Struct
+from zlib import crc32
+from mmap import mmap, ACCESS_READ
+from threading import Lock
+import re
+
+
+def normalize (name) :
+    """The upper case letters and digits of a device name, so that
+    "stm32f407vg" and "STM32F407-VG" are the same device"""
+    return str(re.sub(r"[^0-9A-Z]", "", name.upper()))
+
+
+def ngrams (name, n=3) :
+    """The distinct n-grams of a normalized name; names shorter than *n* are
+    a single gram"""
+    if len(name) <= n :
+        return set([name]) if name else set()
+    return set(name[i:i + n] for i in range(len(name) - n + 1))
+
+
+def _hash (key) :
+    return crc32(key) & 0xffffffff
+
+
+def _slots (count) :
+    """A power of two at least twice *count*, so that the hash tables are at
+    most half full"""
+    slots = 8
+    while slots < 2 * count :
+        slots *= 2
+    return slots
+
+
+class DeviceLookup (object) :
+    """ A read only lookup of the devices of the pack index, stored in a
+    memory mapped file
+
+    Looking up a device does not parse the index; only the JSON of the
+    devices that are found is decoded. The file holds:
+
+    * the table of entries, with the name and the JSON of every device
+    * a hash table from the exact name to the entry
+    * a hash table from the normalized name to the entries
+    * a hash table from every trigram of the normalized names to the entries
+      containing it, used to narrow down fuzzy searches
+
+    The hash tables use open addressing with linear probing, and are indexed
+    by the CRC32 of the key.
+
+    :param data: The contents of a lookup file, e.g. an mmap.
+    """
+    MAGIC = "MBEDDEV1"
+    HEADER = Struct("<8sQdIIIIIII")
+    ENTRY = Struct("<IIII")
+    SLOT = Struct("<I")
+    GRAM = Struct("<IIII")
+
+    # Number of candidates sharing the most trigrams that are scored by a
+    # fuzzy search
+    FUZZY_CANDIDATES = 64
+
+    def __init__ (self, data) :
+        self._data = data
+        (magic, self.source_size, self.source_mtime, self._count,
+         self._entries, self._exact, self._exact_slots, self._normal,
+         self._normal_slots, self._grams) = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC :
+            raise ValueError("not a device lookup file")
+        self._gram_slots = self.SLOT.unpack_from(data, self._grams)[0]
+        self._grams += self.SLOT.size
+
+    def __len__ (self) :
+        return self._count
+
+    def _entry (self, number) :
+        return self.ENTRY.unpack_from(self._data,
+                                      self._entries + number * self.ENTRY.size)
+
+    def _name (self, number) :
+        offset, size, _, _ = self._entry(number)
+        return self._data[offset:offset + size].decode("utf-8")
+
+    def _record (self, number) :
+        _, _, offset, size = self._entry(number)
+        return loads(self._data[offset:offset + size])
+
+    def _probe (self, table, slots, key) :
+        """The entries in the hash *table* stored under the hash of *key*,
+        which may include entries of other keys"""
+        mask = slots - 1
+        slot = _hash(key) & mask
+        while True :
+            number = self.SLOT.unpack_from(self._data,
+                                           table + slot * self.SLOT.size)[0]
+            if not number :
+                return
+            yield number - 1
+            slot = (slot + 1) & mask
+
+    def names (self) :
+        """All device names, sorted"""
+        return [self._name(number) for number in range(self._count)]
+
+    def get (self, name, default=None) :
+        """The index entry of the device named exactly *name*"""
+        key = name.encode("utf-8")
+        for number in self._probe(self._exact, self._exact_slots, key) :
+            if self._name(number) == name :
+                return self._record(number)
+        return default
+
+    def __contains__ (self, name) :
+        return self.get(name) is not None
+
+    def __getitem__ (self, name) :
+        record = self.get(name)
+        if record is None :
+            raise KeyError(name)
+        return record
+
+    def find_normalized (self, name) :
+        """The names of the devices with the same normalized name as *name*"""
+        key = normalize(name)
+        return [self._name(number) for number
+                in self._probe(self._normal, self._normal_slots, key)
+                if normalize(self._name(number)) == key]
+
+    def _postings (self, gram) :
+        mask = self._gram_slots - 1
+        slot = _hash(gram) & mask
+        while True :
+            offset, size, postings, count = self.GRAM.unpack_from(
+                self._data, self._grams + slot * self.GRAM.size)
+            if not size :
+                return ()
+            if self._data[offset:offset + size] == gram :
+                return Struct("<%dI" % count).unpack_from(self._data, postings)
+            slot = (slot + 1) & mask
+
+    def candidates (self, query, limit=None) :
+        """The names of the devices sharing the most trigrams with *query*,
+        best first"""
+        shared = {}
+        for gram in ngrams(normalize(query)) :
+            for number in self._postings(gram) :
+                shared[number] = shared.get(number, 0) + 1
+        ranked = sorted(shared.iteritems(), key=lambda (n, c): (-c, n))
+        return [self._name(number) for number, _ in ranked[:limit]]
+
+    def find (self, query) :
+        """Find the devices best matching *query*
+
+        An exact match is the only result. Otherwise the devices with the
+        same normalized name are the results, and failing that the fuzzy
+        matches with the highest score. Only the devices sharing the most
+        trigrams with *query* are scored, unless none share any.
+
+        :param query: A device name, or part of one.
+        :type query: str
+        :return: The name and index entry of every device found
+        :rtype: [(str, dict)]
+        """
+        record = self.get(query)
+        if record is not None :
+            return [(query, record)]
+        names = self.find_normalized(query)
+        if not names :
+            from fuzzywuzzy import process
+            names = self.candidates(query, self.FUZZY_CANDIDATES) or self.names()
+            choices = process.extract(query, names, limit=len(names))
+            best = max(score for _, score in choices) if choices else None
+            names = sorted((name for name, score in choices if score == best),
+                           reverse=True)
+        return [(name, self[name]) for name in names]
+
+    @classmethod
+    def build (cls, index, source_size=0, source_mtime=0.0) :
+        """Build the contents of a lookup file
+
+        :param index: The pack index, as in index.json
+        :type index: dict
+        :param source_size: The size of the index file it is built from
+        :param source_mtime: The modification time of that index file
+        :return: The contents of the lookup file
+        :rtype: bytearray
+        """
+        names = sorted(name for name in index if name != "version")
+        exact_slots = _slots(len(names))
+        normal_slots = _slots(len(names))
+        grams = {}
+        for number, name in enumerate(names) :
+            for gram in ngrams(normalize(name)) :
+                grams.setdefault(gram, []).append(number)
+        gram_slots = _slots(len(grams))
+
+        entries = cls.HEADER.size
+        exact = entries + len(names) * cls.ENTRY.size
+        normal = exact + exact_slots * cls.SLOT.size
+        gram_table = normal + normal_slots * cls.SLOT.size
+        strings = gram_table + cls.SLOT.size + gram_slots * cls.GRAM.size
+        data = bytearray(strings)
+        cls.HEADER.pack_into(data, 0, cls.MAGIC, source_size, source_mtime,
+                             len(names), entries, exact, exact_slots, normal,
+                             normal_slots, gram_table)
+        cls.SLOT.pack_into(data, gram_table, gram_slots)
+
+        def insert (table, slots, key, number) :
+            mask = slots - 1
+            slot = _hash(key) & mask
+            while cls.SLOT.unpack_from(data, table + slot * cls.SLOT.size)[0] :
+                slot = (slot + 1) & mask
+            cls.SLOT.pack_into(data, table + slot * cls.SLOT.size, number + 1)
+
+        for number, name in enumerate(names) :
+            key = name.encode("utf-8")
+            record = dumps(index[name])
+            cls.ENTRY.pack_into(data, entries + number * cls.ENTRY.size,
+                                len(data), len(key), len(data) + len(key),
+                                len(record))
+            data += key
+            data += record
+            insert(exact, exact_slots, key, number)
+            insert(normal, normal_slots, normalize(name), number)
+
+        mask = gram_slots - 1
+        slots = gram_table + cls.SLOT.size
+        for gram, numbers in sorted(grams.iteritems()) :
+            slot = _hash(gram) & mask
+            while cls.GRAM.unpack_from(data, slots + slot * cls.GRAM.size)[1] :
+                slot = (slot + 1) & mask
+            cls.GRAM.pack_into(data, slots + slot * cls.GRAM.size, len(data),
+                               len(gram), len(data) + len(gram), len(numbers))
+            data += gram
+            data += Struct("<%dI" % len(numbers)).pack(*numbers)
+        return data
+
+
+_lookups = {}
+_lookups_lock = Lock()
+
+
+def device_lookup (index_file) :
+    """The DeviceLookup of the pack index *index_file*
+
+    The lookup is kept in a file next to the index, named as the index with
+    the extension ".lookup", and built again whenever the index changes.
+    When that file can not be written, the lookup is built in memory. The
+    lookup of every index is only opened once per process.
+
+    :param index_file: The path of index.json
+    :type index_file: str
+    :rtype: DeviceLookup
+    """
+    info = stat(index_file)
+    with _lookups_lock :
+        lookup = _lookups.get(index_file)
+        if (lookup is None or lookup.source_size != info.st_size or
+            lookup.source_mtime != info.st_mtime) :
+            lookup = _lookups[index_file] = _open_lookup(index_file, info)
+        return lookup
+
+
+def _open_lookup (index_file, info) :
+    filename = index_file.rsplit(".", 1)[0] + ".lookup"
+    if exists(filename) :
+        try :
+            with open(filename, "rb") as fd :
+                lookup = DeviceLookup(mmap(fd.fileno(), 0, access=ACCESS_READ))
+            if (lookup.source_size == info.st_size and
+                lookup.source_mtime == info.st_mtime) :
+                return lookup
+        except (IOError, ValueError, EnvironmentError) :
+            pass
+    with open(index_file) as fd :
+        data = DeviceLookup.build(load(fd), info.st_size, info.st_mtime)
+    try :
+        tmp_file = "%s.%d.tmp" % (filename, getpid())
+        with open(tmp_file, "wb") as fd :
+            fd.write(data)
+        if exists(filename) :
+            remove(filename)
+        rename(tmp_file, filename)
+    except (IOError, OSError) :
+        pass
+    return DeviceLookup(str(data))
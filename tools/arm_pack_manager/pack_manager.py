@@ -27,13 +27,14 @@ def subcommand(name, *args, **kwargs):
         subparser.add_argument("-v", "--verbose", action="store_true", dest="verbose", help="Verbose diagnostic output")
         subparser.add_argument("-vv", "--very_verbose", action="store_true", dest="very_verbose", help="Very verbose diagnostic output")
         subparser.add_argument("--no-timeouts", action="store_true", help="Remove all timeouts and try to download unconditionally")
+        subparser.add_argument("-j", "--jobs", type=int, default=20, help="Number of files downloaded at once")
         subparser.add_argument("--and", action="store_true", dest="intersection", help="combine search terms as if with an and")
         subparser.add_argument("--or", action="store_false", dest="intersection", help="combine search terms as if with an or")
         subparser.add_argument("--union", action="store_false", dest="intersection", help="combine search terms as if with a set union")
         subparser.add_argument("--intersection", action="store_true", dest="intersection", help="combine search terms as if with a set intersection")
         
         def thunk(parsed_args):
-            cache = Cache(not parsed_args.verbose, parsed_args.no_timeouts)
+            cache = Cache(not parsed_args.verbose, parsed_args.no_timeouts, parsed_args.jobs)
             argv = [arg['dest'] if 'dest' in arg else arg['name'] for arg in args]
             argv = [(arg if isinstance(arg, basestring) else arg[-1]).strip('-')
                     for arg in argv]
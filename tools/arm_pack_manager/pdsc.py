@@ -0,0 +1,133 @@
+from xml.etree.cElementTree import iterparse, Element, ParseError
+from bisect import bisect_right
+
+
+class _Document (object) :
+    """ The elements of a parsed document, numbered in document order
+
+    Elements are numbered when they start, so the descendants of an element
+    are the elements numbered after it, up to the last number given out before
+    it ended. Every tag name keeps the numbers of its elements, sorted; finding
+    the descendants with a tag name is then a binary search.
+    """
+    __slots__ = ("parents", "spans", "tags")
+
+    def __init__ (self) :
+        self.parents = {}
+        self.spans = {}
+        self.tags = {}
+
+    def descendants (self, element, name) :
+        first, last = self.spans[element]
+        numbers, elements = self.tags.get(name, ((), ()))
+        return elements[bisect_right(numbers, first):bisect_right(numbers, last)]
+
+
+class XmlElement (object) :
+    """ A read only view of an ElementTree element, with the parts of the
+    BeautifulSoup Tag interface that the pack manager uses
+
+    Like BeautifulSoup with "html.parser", tag and attribute names are
+    lower case: ``device["dname"]`` reads the Dname attribute.
+
+    * ``element("tag")`` and ``element.find_all("tag")`` are all descendants
+      named "tag", in document order
+    * ``element.tag`` and ``element.find("tag")`` are the first of them, or
+      None
+    * ``element["attr"]`` and ``element.get("attr")`` are attributes
+    * ``element.parent`` is the parent element, and None for the document
+    """
+    __slots__ = ("_element", "_document")
+
+    def __init__ (self, element, document) :
+        self._element = element
+        self._document = document
+
+    def _wrap (self, element) :
+        return XmlElement(element, self._document) if element is not None else None
+
+    def find_all (self, name) :
+        return [XmlElement(e, self._document) for e
+                in self._document.descendants(self._element, name)]
+
+    __call__ = find_all
+
+    def find (self, name) :
+        found = self._document.descendants(self._element, name)
+        return XmlElement(found[0], self._document) if found else None
+
+    def __getattr__ (self, name) :
+        if name.startswith("__") :
+            raise AttributeError(name)
+        return self.find(name)
+
+    @property
+    def parent (self) :
+        return self._wrap(self._document.parents.get(self._element))
+
+    def __getitem__ (self, key) :
+        return self._element.attrib[key]
+
+    def get (self, key, default=None) :
+        return self._element.attrib.get(key, default)
+
+    def get_text (self) :
+        return "".join(self._element.itertext())
+
+
+def parse_xml (source) :
+    """Parse the XML file *source*, a file name or file object, in one pass
+    with the C parser
+
+    :return: The document, or None if *source* is not well formed XML
+    :rtype: XmlElement
+    """
+    root = Element("[document]")
+    document = _Document()
+    parents = document.parents
+    spans = document.spans
+    tags = document.tags
+    stack = [root]
+    number = 0
+    try :
+        for event, element in iterparse(source, events=("start", "end")) :
+            if event == "start" :
+                number += 1
+                tag = element.tag = element.tag.lower()
+                if element.attrib :
+                    element.attrib = dict((k.lower(), v) for k, v
+                                          in element.attrib.iteritems())
+                if len(stack) == 1 :
+                    root.append(element)
+                parents[element] = stack[-1]
+                spans[element] = number
+                if tag not in tags :
+                    tags[tag] = ([], [])
+                numbers, elements = tags[tag]
+                numbers.append(number)
+                elements.append(element)
+                stack.append(element)
+            else :
+                stack.pop()
+                spans[element] = (spans[element], number)
+    except (ParseError, SyntaxError) :
+        return None
+    spans[root] = (0, number)
+    return XmlElement(root, document)
+
+
+def parse_pdsc (filename) :
+    """Parse a PDSC, or another XML file of the pack index
+
+    Files that are not well formed XML are parsed with BeautifulSoup, which
+    is more forgiving, but much slower.
+
+    :return: The parsed document
+    :rtype: XmlElement or BeautifulSoup
+    """
+    document = parse_xml(filename)
+    if document is None :
+        from bs4 import BeautifulSoup
+        with open(filename, "r") as fd :
+            document = BeautifulSoup(fd, "html.parser")
+    return document
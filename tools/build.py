@@ -105,6 +105,10 @@ if __name__ == '__main__':
 
     parser.add_argument("-j", "--jobs", type=int, dest="jobs",
                       default=0, help="Number of concurrent jobs. Default: 0/auto (based on host machine's number of CPUs)")
+    parser.add_argument("--compile-timeout", type=float, dest="compile_timeout",
+                      default=None, help="Abort if compiling takes longer than this many seconds. Default: no limit")
+    parser.add_argument("--scan-jobs", type=int, dest="scan_jobs",
+                      default=1, help="Number of threads that scan source directories and features. Default: 1")
     parser.add_argument("-N", "--artifact-name", dest="artifact_name",
                       default=None, help="The built project's name")
 
@@ -200,7 +204,9 @@ if __name__ == '__main__':
                                                     archive=(not options.no_archive),
                                                     macros=options.macros,
                                                     name=options.artifact_name,
-                                                    build_profile=profile)
+                                                    build_profile=profile,
+                                                    compile_timeout=options.compile_timeout,
+                                                    scan_jobs=options.scan_jobs)
                     else:
                         lib_build_res = build_mbed_libs(mcu, toolchain,
                                                     extra_verbose=options.extra_verbose_notify,
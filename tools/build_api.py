@@ -18,18 +18,16 @@ limitations under the License.
 import re
 import tempfile
 import datetime
-import uuid
 from types import ListType
 from shutil import rmtree
 from os.path import join, exists, dirname, basename, abspath, normpath, splitext
 from os.path import relpath
 from os import linesep, remove, makedirs
 from time import time
-from intelhex import IntelHex
 from json import load, dump
 
 from tools.utils import mkdir, run_cmd, run_cmd_ext, NotSupportedException,\
-    ToolException, InvalidReleaseTargetException, intelhex_offset
+    ToolException, InvalidReleaseTargetException
 from tools.paths import MBED_CMSIS_PATH, MBED_TARGETS_PATH, MBED_LIBRARIES,\
     MBED_HEADER, MBED_DRIVERS, MBED_PLATFORM, MBED_HAL, MBED_CONFIG_FILE,\
     MBED_LIBRARIES_DRIVERS, MBED_LIBRARIES_PLATFORM, MBED_LIBRARIES_HAL,\
@@ -37,9 +35,9 @@ from tools.paths import MBED_CMSIS_PATH, MBED_TARGETS_PATH, MBED_LIBRARIES,\
 from tools.targets import TARGET_NAMES, TARGET_MAP
 from tools.libraries import Library
 from tools.toolchains import TOOLCHAIN_CLASSES
-from jinja2 import FileSystemLoader
-from jinja2.environment import Environment
 from tools.config import Config
+from tools.templates import get_template
+from tools.memory_image import MemoryImage, load_image
 
 RELEASE_VERSIONS = ['2', '5']
 
@@ -107,6 +105,7 @@ def add_result_to_report(report, result):
     result - the result to append
     """
     result["date"] = datetime.datetime.utcnow().isoformat()
+    import uuid
     result["uuid"] = str(uuid.uuid1())
     target = result["target_name"]
     toolchain = result["toolchain_name"]
@@ -313,7 +312,8 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
                       macros=None, clean=False, jobs=1,
                       notify=None, silent=False, verbose=False,
                       extra_verbose=False, config=None,
-                      app_config=None, build_profile=None):
+                      app_config=None, build_profile=None,
+                      compile_timeout=None):
     """ Prepares resource related objects - toolchain, target, config
 
     Positional arguments:
@@ -332,6 +332,7 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
     config - a Config object to use instead of creating one
     app_config - location of a chosen mbed_app.json file
     build_profile - a list of mergeable build profiles
+    compile_timeout - wall clock time limit, in seconds, for parallel compiles
     """
 
     # We need to remove all paths which are repeated to avoid
@@ -359,6 +360,7 @@ def prepare_toolchain(src_paths, build_dir, target, toolchain_name,
 
     toolchain.config = config
     toolchain.jobs = jobs
+    toolchain.compile_timeout = compile_timeout
     toolchain.build_all = clean
     toolchain.VERBOSE = verbose
 
@@ -372,7 +374,7 @@ def merge_region_list(region_list, destination, padding=b'\xFF'):
     destination - file name to write all regions to
     padding - bytes to fill gapps with
     """
-    merged = IntelHex()
+    merged = MemoryImage()
 
     print("Merging Regions:")
 
@@ -381,7 +383,7 @@ def merge_region_list(region_list, destination, padding=b'\xFF'):
             raise ToolException("Active region has no contents: No file found.")
         if region.filename:
             print("  Filling region %s with %s" % (region.name, region.filename))
-            part = intelhex_offset(region.filename, offset=region.start)
+            part = load_image(region.filename, offset=region.start)
             part_size = (part.maxaddr() - part.minaddr()) + 1
             if part_size > region.size:
                 raise ToolException("Contents of region %s does not fit"
@@ -390,17 +392,18 @@ def merge_region_list(region_list, destination, padding=b'\xFF'):
             pad_size = region.size - part_size
             if pad_size > 0 and region != region_list[-1]:
                 print("  Padding region %s with 0x%x bytes" % (region.name, pad_size))
-                merged.puts(merged.maxaddr() + 1, padding * pad_size)
+                merged.put(merged.maxaddr() + 1, padding * pad_size)
 
     if not exists(dirname(destination)):
         makedirs(dirname(destination))
     print("Space used after regions merged: 0x%x" %
           (merged.maxaddr() - merged.minaddr() + 1))
     with open(destination, "wb+") as output:
-        merged.tofile(output, format='bin')
+        merged.tobinfile(output)
 
 def scan_resources(src_paths, toolchain, dependencies_paths=None,
-                   inc_dirs=None, base_path=None, collect_ignores=False):
+                   inc_dirs=None, base_path=None, collect_ignores=False,
+                   scan_jobs=1):
     """ Scan resources using initialized toolcain
 
     Positional arguments
@@ -409,20 +412,34 @@ def scan_resources(src_paths, toolchain, dependencies_paths=None,
     dependencies_paths - dependency paths that we should scan for include dirs
     inc_dirs - additional include directories which should be added to
                the scanner resources
+    scan_jobs - the number of threads that scan the source directories,
+                dependency paths and enabled features. When above 1, each
+                directory tree is scanned with only its own .mbedignore files
     """
+    dependencies_paths = list(dependencies_paths or [])
+    with toolchain.timer.span("scan"):
+        if scan_jobs > 1 and len(src_paths) + len(dependencies_paths) > 1:
+            scanned = toolchain.scan_trees(
+                [(path, base_path, collect_ignores) for path in src_paths] +
+                [(path, None, False) for path in dependencies_paths],
+                scan_jobs)
+            src_resources = scanned[:len(src_paths)]
+            dep_resources = scanned[len(src_paths):]
+        else:
+            src_resources = [toolchain.scan_resources(
+                path, base_path=base_path, collect_ignores=collect_ignores)
+                             for path in src_paths]
+            dep_resources = [toolchain.scan_resources(path)
+                             for path in dependencies_paths]
 
-    # Scan src_path
-    resources = toolchain.scan_resources(src_paths[0], base_path=base_path,
-                                         collect_ignores=collect_ignores)
-    for path in src_paths[1:]:
-        resources.add(toolchain.scan_resources(path, base_path=base_path,
-                                               collect_ignores=collect_ignores))
+    # Merge the source paths in order
+    resources = src_resources[0]
+    for path_resources in src_resources[1:]:
+        resources.add(path_resources)
 
-    # Scan dependency paths for include dirs
-    if dependencies_paths is not None:
-        for path in dependencies_paths:
-            lib_resources = toolchain.scan_resources(path)
-            resources.inc_dirs.extend(lib_resources.inc_dirs)
+    # Only the include dirs of dependency paths are used
+    for lib_resources in dep_resources:
+        resources.inc_dirs.extend(lib_resources.inc_dirs)
 
     # Add additional include directories if passed
     if inc_dirs:
@@ -433,10 +450,16 @@ def scan_resources(src_paths, toolchain, dependencies_paths=None,
 
     # Load resources into the config system which might expand/modify resources
     # based on config data
-    resources = toolchain.config.load_resources(resources)
-
-    # Set the toolchain's configuration data
-    toolchain.set_config_data(toolchain.config.get_config_data())
+    scan_features = None
+    if scan_jobs > 1:
+        scan_features = lambda res, names: toolchain.scan_features(
+            res, names, scan_jobs)
+    with toolchain.timer.span("config"):
+        resources = toolchain.config.load_resources(
+            resources, scan_features=scan_features)
+
+        # Set the toolchain's configuration data
+        toolchain.set_config_data(toolchain.config.get_config_data())
 
     if  (hasattr(toolchain.target, "release_versions") and
             "5" not in toolchain.target.release_versions and
@@ -458,7 +481,8 @@ def build_project(src_paths, build_path, target, toolchain_name,
                   macros=None, inc_dirs=None, jobs=1, silent=False,
                   report=None, properties=None, project_id=None,
                   project_description=None, extra_verbose=False, config=None,
-                  app_config=None, build_profile=None, stats_depth=None):
+                  app_config=None, build_profile=None, stats_depth=None,
+                  compile_timeout=None, scan_jobs=1):
     """ Build a project. A project may be a test or a user program.
 
     Positional arguments:
@@ -488,6 +512,8 @@ def build_project(src_paths, build_path, target, toolchain_name,
     app_config - location of a chosen mbed_app.json file
     build_profile - a dict of flags that will be passed to the compiler
     stats_depth - depth level for memap to display file/dirs
+    compile_timeout - wall clock time limit, in seconds, for parallel compiles
+    scan_jobs - the number of threads that scan the sources
     """
 
     # Convert src_path to a list if needed
@@ -506,7 +532,7 @@ def build_project(src_paths, build_path, target, toolchain_name,
         src_paths, build_path, target, toolchain_name, macros=macros,
         clean=clean, jobs=jobs, notify=notify, silent=silent, verbose=verbose,
         extra_verbose=extra_verbose, config=config, app_config=app_config,
-        build_profile=build_profile)
+        build_profile=build_profile, compile_timeout=compile_timeout)
 
     # The first path will give the name to the library
     name = (name or toolchain.config.name or
@@ -530,7 +556,8 @@ def build_project(src_paths, build_path, target, toolchain_name,
 
     try:
         # Call unified scan_resources
-        resources = scan_resources(src_paths, toolchain, inc_dirs=inc_dirs)
+        resources = scan_resources(src_paths, toolchain, inc_dirs=inc_dirs,
+                                   scan_jobs=scan_jobs)
 
         # Change linker script if specified
         if linker_script is not None:
@@ -547,7 +574,8 @@ def build_project(src_paths, build_path, target, toolchain_name,
             region_list = [r._replace(filename=res) if r.active else r
                            for r in region_list]
             res = join(build_path, name) + ".bin"
-            merge_region_list(region_list, res)
+            with toolchain.timer.span("merge regions"):
+                merge_region_list(region_list, res)
         else:
             res, _ = toolchain.link_program(resources, build_path, name)
 
@@ -570,6 +598,10 @@ def build_project(src_paths, build_path, target, toolchain_name,
 
         resources.detect_duplicates(toolchain)
 
+        # Write the timing of the build as a Chrome trace and as a table
+        toolchain.timer.write_trace(join(build_path, name + "_trace.json"))
+        toolchain.timer.write_summary(join(build_path, name + "_timing.txt"))
+
         if report != None:
             end = time()
             cur_result["elapsed_time"] = end - start
@@ -611,7 +643,7 @@ def build_library(src_paths, build_path, target, toolchain_name,
                   inc_dirs=None, jobs=1, silent=False, report=None,
                   properties=None, extra_verbose=False, project_id=None,
                   remove_config_header_file=False, app_config=None,
-                  build_profile=None):
+                  build_profile=None, compile_timeout=None, scan_jobs=1):
     """ Build a library
 
     Positional arguments:
@@ -639,6 +671,8 @@ def build_library(src_paths, build_path, target, toolchain_name,
     remove_config_header_file - delete config header file when done building
     app_config - location of a chosen mbed_app.json file
     build_profile - a dict of flags that will be passed to the compiler
+    compile_timeout - wall clock time limit, in seconds, for parallel compiles
+    scan_jobs - the number of threads that scan the sources
     """
 
     # Convert src_path to a list if needed
@@ -663,7 +697,7 @@ def build_library(src_paths, build_path, target, toolchain_name,
         src_paths, build_path, target, toolchain_name, macros=macros,
         clean=clean, jobs=jobs, notify=notify, silent=silent,
         verbose=verbose, extra_verbose=extra_verbose, app_config=app_config,
-        build_profile=build_profile)
+        build_profile=build_profile, compile_timeout=compile_timeout)
 
     # The first path will give the name to the library
     if name is None:
@@ -699,7 +733,7 @@ def build_library(src_paths, build_path, target, toolchain_name,
         # Call unified scan_resources
         resources = scan_resources(src_paths, toolchain,
                                    dependencies_paths=dependencies_paths,
-                                   inc_dirs=inc_dirs)
+                                   inc_dirs=inc_dirs, scan_jobs=scan_jobs)
 
 
         # Copy headers, objects and static libraries - all files needed for
@@ -1385,9 +1419,10 @@ def write_build_report(build_report, template_filename, filename):
         else:
             build_report_passing.append(report)
 
-    env = Environment(extensions=['jinja2.ext.with_'])
-    env.loader = FileSystemLoader('ci_templates')
-    template = env.get_template(template_filename)
+    from jinja2 import Undefined
+    template = get_template('ci_templates', template_filename,
+                            extensions=['jinja2.ext.with_'],
+                            undefined=Undefined)
 
     with open(filename, 'w+') as placeholder:
         placeholder.write(template.render(
@@ -0,0 +1,626 @@
+#! /usr/bin/env python2
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Run make.py and build.py in a build server that keeps the tools loaded
+
+The server keeps the modules of the tools, the targets and the scan caches
+and dependency databases of the build directories in memory between builds.
+It is started on first use, and listens on a Unix socket. Every build runs
+in a process forked from the server, so a build never changes the state of
+the next one, and its output is streamed back unchanged.
+
+The socket is in a directory of the user, ~/.mbed/build_server by default,
+and the server only serves, and the client only talks to, processes of the
+same user.
+"""
+import sys
+import os
+import json
+import struct
+import socket
+import signal
+import select
+import runpy
+import traceback
+from time import time, sleep
+from errno import ENOENT, ECONNREFUSED, EINTR
+from hashlib import md5
+from subprocess import Popen
+from argparse import ArgumentParser
+from os.path import join, abspath, dirname, exists, splitext
+from SocketServer import UnixStreamServer, StreamRequestHandler
+
+# Be sure that the tools directory is in the search path
+ROOT = abspath(join(dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+TOOLS = join(ROOT, "tools")
+
+# The scripts that the server runs
+SCRIPTS = {"make": "make.py", "build": "build.py"}
+
+# The build_api functions that the server calls
+FUNCTIONS = ["build_project", "build_library"]
+
+# Seconds between two checks of the watched files while the server is idle
+WATCH_INTERVAL = 1.0
+
+# Seconds to wait for a new server to listen
+START_TIMEOUT = 60.0
+
+# Directory of the sockets of the build servers of the user
+SOCKET_DIR = join(os.path.expanduser("~"), ".mbed", "build_server")
+
+# The environment variables sent with a build: those the tools and the
+# toolchains read
+ENVIRONMENT = ["PATH", "HOME", "LANG", "TMPDIR", "TEMP", "TMP", "PYTHONPATH",
+               "LM_LICENSE_FILE"]
+ENVIRONMENT_PREFIXES = ["MBED_", "LC_", "ARM", "IAR"]
+
+
+class BuildServerError(Exception):
+    """A request that the build server could not serve"""
+    pass
+
+
+def default_socket():
+    """The socket of the build server of this tree, in SOCKET_DIR
+
+    The directory is created with mode 0700, and must only be writable by
+    the user, so that nobody else may bind the socket.
+    """
+    try:
+        if not os.path.isdir(SOCKET_DIR):
+            os.makedirs(SOCKET_DIR, 0700)
+        info = os.stat(SOCKET_DIR)
+    except OSError as exc:
+        raise BuildServerError("Can not create %s: %s" % (SOCKET_DIR, exc))
+    if info.st_uid != os.getuid() or info.st_mode & 0077:
+        raise BuildServerError("%s must belong to the user, with mode 0700"
+                               % SOCKET_DIR)
+    return join(SOCKET_DIR, "%s.sock" % md5(ROOT).hexdigest()[:12])
+
+
+def _build_environment(environ):
+    """The environment variables of *environ* that a build needs"""
+    return dict((k, v) for k, v in environ.iteritems()
+                if k in ENVIRONMENT or
+                any(k.startswith(prefix) for prefix in ENVIRONMENT_PREFIXES))
+
+
+def _peer_uid(connection):
+    """The user of the process at the other end of a Unix socket, or None
+    where the system does not tell"""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                        struct.calcsize("3i"))
+    return struct.unpack("3i", credentials)[1]
+
+
+def _settings_environment(environ):
+    """The environment variables that change the settings of the tools"""
+    return dict((k, v) for k, v in environ.iteritems() if k.startswith("MBED_"))
+
+
+class TreeWatcher(object):
+    """Notices changes of a set of files, by their modification time
+
+    Positional arguments:
+    filenames - the files to watch; files that do not exist yet are watched
+                for their creation
+    """
+    def __init__(self, filenames):
+        self.mtimes = dict((f, self._mtime(f)) for f in filenames)
+
+    @staticmethod
+    def _mtime(filename):
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def changed(self):
+        """The files that changed since the last call, or since the watcher
+        was created"""
+        changed = []
+        for filename, mtime in self.mtimes.iteritems():
+            current = self._mtime(filename)
+            if current != mtime:
+                self.mtimes[filename] = current
+                changed.append(filename)
+        return changed
+
+
+def _loaded_sources():
+    """The source files of the modules of this tree that are loaded"""
+    sources = set()
+    for module in sys.modules.values():
+        filename = getattr(module, "__file__", None)
+        if filename and abspath(filename).startswith(ROOT + os.sep):
+            sources.add(splitext(abspath(filename))[0] + ".py")
+    return sources
+
+
+class BuildServer(UnixStreamServer):
+    """Serves builds on a Unix socket, one at a time
+
+    Requests and replies are JSON objects, one per line. A request is one of:
+
+    {"command": "run", "script": "make", "argv": [...], "cwd": ..., "env": ...}
+        Run a script, replying with its output as {"stdout": ...} and
+        {"stderr": ...}, then {"exit": <exit status>}
+    {"command": "build_project", "args": [...], "kwargs": {...}, "cwd": ...,
+     "env": ...}
+        Call a function of build_api, replying with its output as above, then
+        {"exit": 0, "result": ..., "report": ...}, where "report" is the
+        "report" keyword argument once updated. Failures reply with
+        {"exit": 1, "error": ...}
+    {"command": "status"}
+    {"command": "stop"}
+
+    When the tools or the settings changed since the server started, it
+    replies {"restart": true} to any build and stops; the client starts a
+    new server. A change of the targets only loads the targets again.
+
+    Positional arguments:
+    socket_path - the Unix socket to listen on
+
+    Keyword arguments:
+    watch - files whose change stops the server, by default the sources of
+            the loaded modules of the tools and mbed_settings.py
+    """
+    def __init__(self, socket_path, watch=None):
+        from tools.toolchains import mbedToolchain
+        from tools.toolchains.scan_cache import ScanCache
+        from tools.toolchains.dependency_db import DependencyDB
+
+        # Load the scripts and everything they import
+        sys.path.insert(0, TOOLS)
+        for script in SCRIPTS.values():
+            runpy.run_path(join(TOOLS, script), run_name="__build_server__")
+
+        mbedToolchain.shared_caches = self.caches = {}
+        self.cache_classes = dict((cls.__name__, cls)
+                                  for cls in (ScanCache, DependencyDB))
+        self.cache_mtimes = {}
+        if watch is None:
+            watch = _loaded_sources() | set([join(ROOT, "mbed_settings.py")])
+        self.watcher = TreeWatcher(watch)
+        self.targets_watcher = TreeWatcher([join(ROOT, "targets",
+                                                 "targets.json")])
+        self.environment = _settings_environment(os.environ)
+        self.started = time()
+        self.builds = 0
+        self.stale = False
+        self.stopped = False
+        self.timeout = WATCH_INTERVAL
+        if exists(socket_path):
+            os.remove(socket_path)
+        umask = os.umask(0077)
+        try:
+            UnixStreamServer.__init__(self, socket_path, BuildRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def verify_request(self, request, client_address):
+        # Builds run as the user of the server, for that user only
+        return _peer_uid(request) in (None, os.getuid())
+
+    def serve(self):
+        """Serve requests until stopped"""
+        try:
+            while not self.stopped:
+                self.handle_request()
+        finally:
+            self.server_close()
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+
+    def handle_timeout(self):
+        # A stale server stops as soon as it is idle
+        if not self.check():
+            self.stopped = True
+
+    def check(self):
+        """Check the watched files, and whether the server is stale"""
+        if self.watcher.changed():
+            self.stale = True
+        if self.targets_watcher.changed():
+            from tools.targets import set_targets_json_location
+            set_targets_json_location()
+        return not self.stale
+
+    def refresh_caches(self, used):
+        """Load again the caches that a build wrote, so that the next builds
+        start from them"""
+        for class_name, filename in used:
+            try:
+                mtime = os.stat(filename).st_mtime
+            except OSError:
+                continue
+            key = (self.cache_classes[class_name], filename)
+            if self.cache_mtimes.get(key) != mtime:
+                self.caches[key] = key[0](filename)
+                self.cache_mtimes[key] = mtime
+
+    def status(self):
+        return {"pid": os.getpid(), "root": ROOT,
+                "uptime": time() - self.started, "builds": self.builds,
+                "caches": sorted(filename for _, filename in self.caches)}
+
+
+class BuildRequestHandler(StreamRequestHandler):
+    """Handles a single request of a client, see BuildServer"""
+
+    def reply(self, **message):
+        self.wfile.write(json.dumps(message) + "\n")
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # A client checking that the server listens
+            return
+        try:
+            request = _encode(json.loads(line))
+            command = request["command"]
+        except (ValueError, KeyError, TypeError):
+            self.reply(exit=1, error="Malformed request")
+            return
+        server = self.server
+        if command == "status":
+            self.reply(exit=0, result=server.status())
+        elif command == "stop":
+            server.stopped = True
+            self.reply(exit=0)
+        elif command not in ["run"] + FUNCTIONS:
+            self.reply(exit=1, error="Unknown command %s" % command)
+        elif (not server.check() or _settings_environment(
+                request.get("env", {})) != server.environment):
+            server.stopped = True
+            self.reply(restart=True)
+        else:
+            server.builds += 1
+            self.build(request)
+
+    def build(self, request):
+        """Run the request in a child process, forwarding its output"""
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        result_r, result_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(stdout_r)
+                os.close(stderr_r)
+                os.close(result_r)
+                self.connection.close()
+                self.server.socket.close()
+                os.setpgid(0, 0)
+                os.dup2(stdout_w, 1)
+                os.dup2(stderr_w, 2)
+                result = _child_build(request)
+                with os.fdopen(result_w, "w") as result_file:
+                    result_file.write(json.dumps(result))
+            finally:
+                os._exit(0)
+        for pipe in (stdout_w, stderr_w, result_w):
+            os.close(pipe)
+        streams = {stdout_r: "stdout", stderr_r: "stderr", result_r: None}
+        result = []
+        try:
+            while streams:
+                try:
+                    readable, _, _ = select.select(
+                        list(streams) + [self.connection], [], [])
+                except select.error as exc:
+                    if exc.args[0] == EINTR:
+                        continue
+                    raise
+                if self.connection in readable and not self.connection.recv(1):
+                    raise socket.error("client disconnected")
+                for pipe in readable:
+                    if pipe not in streams:
+                        continue
+                    data = os.read(pipe, 65536)
+                    if not data:
+                        del streams[pipe]
+                        os.close(pipe)
+                    elif streams[pipe]:
+                        # Output is not necessarily UTF-8; latin-1 carries
+                        # any byte
+                        self.reply(**{streams[pipe]: data.decode("latin-1")})
+                    else:
+                        result.append(data)
+            os.waitpid(pid, 0)
+            result = (json.loads("".join(result)) if result
+                      else {"exit": 1, "error": "The build process died"})
+            used = result.pop("caches", [])
+            self.reply(**result)
+        except (socket.error, IOError):
+            # The client is gone, e.g. interrupted: so is its build
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            os.waitpid(pid, 0)
+            for pipe in streams:
+                os.close(pipe)
+            return
+        self.server.refresh_caches(used)
+
+
+def _encode(obj):
+    """Convert the unicode strings produced by the JSON decoder into the byte
+    strings that the tools expect"""
+    if isinstance(obj, dict):
+        return dict((_encode(k), _encode(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return [_encode(e) for e in obj]
+    elif isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    else:
+        return obj
+
+
+def _child_build(request):
+    """Serve a build request in the child process
+
+    Return value:
+    The reply to the request, and the caches used as "caches"
+    """
+    from tools.toolchains import mbedToolchain
+    sys.stdout = os.fdopen(1, "w", 1)
+    sys.stderr = os.fdopen(2, "w", 0)
+    os.environ.clear()
+    os.environ.update(request.get("env", {}))
+    result = {"exit": 0}
+    try:
+        os.chdir(request.get("cwd", os.getcwd()))
+        if request["command"] == "run":
+            script = join(TOOLS, SCRIPTS[request["script"]])
+            sys.argv = [script] + request.get("argv", [])
+            try:
+                runpy.run_path(script, run_name="__main__")
+            except SystemExit as exc:
+                result["exit"] = _exit_status(exc.code)
+        else:
+            import tools.build_api
+            function = getattr(tools.build_api, request["command"])
+            kwargs = request.get("kwargs", {})
+            result["result"] = function(*request.get("args", []), **kwargs)
+            if kwargs.get("report") is not None:
+                result["report"] = kwargs["report"]
+    except Exception as exc:
+        if request["command"] == "run":
+            # As Python does for an uncaught exception
+            traceback.print_exc()
+        result = {"exit": 1, "error": "%s: %s" % (exc.__class__.__name__, exc)}
+    sys.stdout.flush()
+    sys.stderr.flush()
+    result["caches"] = [(cls.__name__, filename) for cls, filename
+                        in mbedToolchain.shared_caches]
+    return result
+
+
+def _exit_status(code):
+    """The exit status of a process exiting with SystemExit(code)"""
+    if code is None:
+        return 0
+    if isinstance(code, (int, long)):
+        return code
+    sys.stderr.write("%s\n" % code)
+    return 1
+
+
+def serve(socket_path=None, watch=None):
+    """Run a build server in this process until it is stopped"""
+    BuildServer(socket_path or default_socket(), watch=watch).serve()
+
+
+def start_server(socket_path=None):
+    """Start a build server in the background and wait until it listens
+
+    Its output is written to the socket file name with the extension ".log"
+    """
+    socket_path = socket_path or default_socket()
+    log_file = splitext(socket_path)[0] + ".log"
+    with open(log_file, "a") as log:
+        server = Popen([sys.executable, abspath(__file__), "--socket",
+                        socket_path, "serve"], stdin=open(os.devnull),
+                       stdout=log, stderr=log, close_fds=True,
+                       preexec_fn=os.setsid, cwd=ROOT)
+    deadline = time() + START_TIMEOUT
+    while time() < deadline and server.poll() is None:
+        connection = _connect(socket_path)
+        if connection:
+            connection.close()
+            return
+        sleep(0.05)
+    raise BuildServerError("The build server did not start, see %s"
+                           % log_file)
+
+
+def _connect(socket_path):
+    """A connection to the server on *socket_path*, or None when there is
+    no server
+
+    Raises BuildServerError when the server is not run by the user
+    """
+    try:
+        if os.stat(socket_path).st_uid != os.getuid():
+            raise BuildServerError("%s does not belong to the user"
+                                   % socket_path)
+    except OSError as exc:
+        if exc.errno == ENOENT:
+            return None
+        raise
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except socket.error as exc:
+        connection.close()
+        if exc.errno in (ENOENT, ECONNREFUSED):
+            return None
+        raise
+    if _peer_uid(connection) not in (None, os.getuid()):
+        connection.close()
+        raise BuildServerError("The server on %s is not run by the user"
+                               % socket_path)
+    return connection
+
+
+def _wait_stopped(socket_path):
+    deadline = time() + START_TIMEOUT
+    while exists(socket_path) and time() < deadline:
+        sleep(0.05)
+
+
+def request(message, socket_path=None, start=True, stdout=None, stderr=None):
+    """Send a request to the build server, writing its output to *stdout*
+    and *stderr*
+
+    Keyword arguments:
+    socket_path - the socket of the server, by default that of this tree
+    start - start a server when there is none, or when it must restart
+
+    Return value:
+    The last reply of the server
+    """
+    socket_path = socket_path or default_socket()
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    message = dict(message, cwd=os.getcwd(),
+                   env=_build_environment(os.environ))
+    for _ in range(2):
+        connection = _connect(socket_path)
+        if connection is None:
+            if not start:
+                raise BuildServerError("No build server listens on %s"
+                                       % socket_path)
+            start_server(socket_path)
+            connection = _connect(socket_path)
+        try:
+            connection.sendall(json.dumps(message) + "\n")
+            for line in connection.makefile("r"):
+                reply = json.loads(line)
+                if "stdout" in reply:
+                    stdout.write(reply["stdout"].encode("latin-1"))
+                    stdout.flush()
+                elif "stderr" in reply:
+                    stderr.write(reply["stderr"].encode("latin-1"))
+                    stderr.flush()
+                else:
+                    break
+            else:
+                raise BuildServerError("The build server closed the connection")
+        finally:
+            connection.close()
+        if not reply.get("restart"):
+            return reply
+        if not start:
+            break
+        _wait_stopped(socket_path)
+    raise BuildServerError("The build server must be restarted")
+
+
+def run_script(script, argv, socket_path=None):
+    """Run make.py or build.py in the build server
+
+    Positional arguments:
+    script - "make" or "build"
+    argv - the command line arguments of the script
+
+    Return value:
+    The exit status of the script
+    """
+    reply = request({"command": "run", "script": script, "argv": argv},
+                    socket_path)
+    return reply["exit"]
+
+
+def call(function, *args, **kwargs):
+    """Call build_project or build_library in the build server
+
+    The arguments must be JSON serializable: the target and toolchain are
+    given by name, and there is no notify function. The output of the build
+    is written to sys.stdout and sys.stderr. A "report" keyword argument is
+    updated as build_api updates it.
+
+    Positional arguments:
+    function - "build_project" or "build_library"
+
+    Keyword arguments:
+    socket_path - the socket of the server, by default that of this tree
+
+    Return value:
+    What the function returned
+    """
+    socket_path = kwargs.pop("socket_path", None)
+    reply = request({"command": function, "args": args, "kwargs": kwargs},
+                    socket_path)
+    if kwargs.get("report") is not None and "report" in reply:
+        kwargs["report"].clear()
+        kwargs["report"].update(reply["report"])
+    if reply["exit"]:
+        raise BuildServerError(reply.get("error", "%s failed" % function))
+    return reply.get("result")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("--socket", default=None,
+                        help="The socket of the server. Default: a socket in "
+                        "%s, for this tree" % SOCKET_DIR)
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run a server in the foreground")
+    commands.add_parser("start", help="Start a server in the background")
+    commands.add_parser("stop", help="Stop the server")
+    commands.add_parser("status", help="Print the state of the server")
+    for name, script in sorted(SCRIPTS.items()):
+        # Every argument after the command is one of the script
+        commands.add_parser(name, add_help=False,
+                            help="Run %s in the server, starting it if "
+                            "needed" % script)
+    options, argv = parser.parse_known_args()
+    if argv and options.command not in SCRIPTS:
+        parser.error("unrecognized arguments: %s" % " ".join(argv))
+    try:
+        socket_path = options.socket or default_socket()
+        if options.command == "serve":
+            serve(socket_path)
+        elif options.command == "start":
+            start_server(socket_path)
+        elif options.command in ("stop", "status"):
+            reply = request({"command": options.command}, socket_path,
+                            start=False)
+            if options.command == "stop":
+                _wait_stopped(socket_path)
+            else:
+                print json.dumps(reply["result"], indent=4, sort_keys=True)
+        else:
+            return run_script(options.command, argv, socket_path)
+    except BuildServerError as exc:
+        print >> sys.stderr, "[ERROR] %s" % exc
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,12 +21,10 @@ from os.path import dirname, abspath, exists, join
 import sys
 from collections import namedtuple
 from os.path import splitext, relpath
-from intelhex import IntelHex
-from jinja2 import FileSystemLoader, StrictUndefined
-from jinja2.environment import Environment
 # Implementation of mbed configuration mechanism
-from tools.utils import json_file_to_dict, intelhex_offset
-from tools.arm_pack_manager import Cache
+from tools.utils import json_file_to_dict
+from tools.templates import render
+from tools.memory_image import load_image
 from tools.targets import CUMULATIVE_ATTRIBUTES, TARGET_MAP, \
     generate_py_target, get_resolution_order
 
@@ -500,12 +498,12 @@ class Config(object):
         if not hasattr(self.target, "device_name"):
             raise ConfigException("Bootloader not supported on this target: "
                                   "targets.json `device_name` not specified.")
-        cache = Cache(False, False)
-        if self.target.device_name not in cache.index:
+        from tools.arm_pack_manager import Cache
+        cmsis_part = Cache(False, False).lookup.get(self.target.device_name)
+        if cmsis_part is None:
             raise ConfigException("Bootloader not supported on this target: "
                                   "targets.json `device_name` not found in "
                                   "arm_pack_manager index.")
-        cmsis_part = cache.index[self.target.device_name]
         target_overrides = self.app_config_data['target_overrides'].get(
             self.target.name, {})
         if  (('target.bootloader_img' in target_overrides or
@@ -545,7 +543,7 @@ class Config(object):
             filename = join(basedir, target_overrides['target.bootloader_img'])
             if not exists(filename):
                 raise ConfigException("Bootloader %s not found" % filename)
-            part = intelhex_offset(filename, offset=rom_start)
+            part = load_image(filename, offset=rom_start)
             if part.minaddr() != rom_start:
                 raise ConfigException("bootloader executable does not "
                                       "start at 0x%x" % rom_start)
@@ -875,12 +873,17 @@ class Config(object):
         else:
             return None
 
-    def load_resources(self, resources):
+    def load_resources(self, resources, scan_features=None):
         """ Load configuration data from a Resources instance and expand it
         based on defined features.
 
         Positional arguments:
         resources - the resources object to load from and expand
+
+        Keyword arguments:
+        scan_features - a function called with the resources and the names of
+                        the features about to be added, that may scan them
+                        all at once
         """
         # Update configuration files until added features creates no changes
         prev_features = set()
@@ -895,6 +898,8 @@ class Config(object):
             if features == prev_features:
                 break
 
+            if scan_features:
+                scan_features(resources, features - prev_features)
             for feature in features:
                 if feature in resources.features:
                     resources.add(resources.features[feature])
@@ -934,10 +939,7 @@ class Config(object):
                             [len(m.macro_value or "") for m in macros.values()]
                             + [0]),
         }
-        jinja_loader = FileSystemLoader(dirname(abspath(__file__)))
-        jinja_environment = Environment(loader=jinja_loader,
-                                        undefined=StrictUndefined)
-        header_data = jinja_environment.get_template("header.tmpl").render(ctx)
+        header_data = render(dirname(abspath(__file__)), "header.tmpl", ctx)
         # If fname is given, write "header_data" to it
         if fname:
             with open(fname, "w+") as file_desc:
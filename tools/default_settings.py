@@ -43,3 +43,10 @@ from os.path import join, abspath, dirname
 
 # mbed.org username
 #MBED_ORG_USER = ""
+
+# Compile cache shared between build directories
+#COMPILE_CACHE_DIR = ""
+#COMPILE_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+# Bytecode cache of the compiled templates of the exporters
+#TEMPLATE_CACHE_DIR = ""
@@ -0,0 +1,138 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark of generating the project files of every exporter
+
+A small program is exported to every IDE that supports its target, in a new
+process for every measurement: with a new jinja2 environment for every
+generated file, as the exporters did, with the shared environments of
+tools/templates.py, and with a bytecode cache of precompiled templates.
+"""
+import sys
+from os import makedirs
+from os.path import join, abspath, dirname
+from argparse import ArgumentParser
+from tempfile import mkdtemp
+from shutil import rmtree
+from subprocess import check_output
+from StringIO import StringIO
+from time import time
+from mock import patch
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+MODES = [
+    ("fresh", "New environment per file"),
+    ("shared", "Shared environments"),
+    ("bytecode", "Precompiled bytecode"),
+]
+
+
+def fresh_template(search_path, name, **options):
+    """tools.templates.get_template, as the exporters did before it"""
+    from jinja2 import FileSystemLoader, StrictUndefined
+    from jinja2.environment import Environment
+    environment = Environment(loader=FileSystemLoader(search_path),
+                              undefined=StrictUndefined, **options)
+    return environment.get_template(name)
+
+
+def export_all(source, export_dir, target):
+    """Export *source* to every IDE, returning the total time and the time
+    spent generating files"""
+    from tools.export import export_project, EXPORTERS
+    from tools.export.exporters import Exporter
+    gen_file = Exporter.gen_file
+    spent = [0.0]
+
+    def timed_gen_file(self, *args, **kwargs):
+        start = time()
+        try:
+            return gen_file(self, *args, **kwargs)
+        finally:
+            spent[0] += time() - start
+
+    start = time()
+    with patch.object(Exporter, "gen_file", timed_gen_file):
+        for ide in sorted(EXPORTERS):
+            stdout, sys.stdout = sys.stdout, StringIO()
+            try:
+                export_project([source, ROOT], join(export_dir, ide), target,
+                               ide, name="benchmark", silent=True)
+            except Exception:
+                # Not every IDE supports the target
+                pass
+            finally:
+                sys.stdout = stdout
+    return time() - start, spent[0]
+
+
+def measure(mode, source, export_dir, target, rounds):
+    import tools.settings
+    if mode == "bytecode":
+        from tools.templates import precompile_all
+        tools.settings.TEMPLATE_CACHE_DIR = join(export_dir, "bytecode")
+        precompile_all()
+        # Only the bytecode is kept
+        import tools.templates
+        tools.templates._environments.clear()
+    for round in range(rounds):
+        if mode == "fresh":
+            with patch("tools.export.exporters.get_template", fresh_template):
+                total, templates = export_all(source, export_dir, target)
+        else:
+            total, templates = export_all(source, export_dir, target)
+        print "%d %f %f" % (round, total, templates)
+
+
+def benchmark(target, rounds):
+    tmp = mkdtemp()
+    try:
+        source = join(tmp, "source")
+        makedirs(source)
+        with open(join(source, "main.cpp"), "w") as fd:
+            fd.write("int main() { return 0; }\n")
+        for mode, name in MODES:
+            output = check_output([sys.executable, __file__, "--measure", mode,
+                                   "--mcu", target, "--rounds", str(rounds),
+                                   "--dir", join(tmp, mode), "--source",
+                                   source])
+            for line in output.splitlines():
+                round, total, templates = line.split()
+                print "%-28s round %d: %.2fs, %.3fs generating files" % (
+                    name, int(round) + 1, float(total), float(templates))
+    finally:
+        rmtree(tmp)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("-m", "--mcu", dest="target", default="K64F",
+                        help="The target to export to. Default: K64F")
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="Number of exports to all IDEs per process. "
+                        "Default: 2")
+    parser.add_argument("--measure", choices=[mode for mode, _ in MODES],
+                        help="Measure a single mode, in this process")
+    parser.add_argument("--dir", help="The export directory of --measure")
+    parser.add_argument("--source", help="The program exported by --measure")
+    options = parser.parse_args()
+    if options.measure:
+        measure(options.measure, options.source, options.dir, options.target,
+                options.rounds)
+    else:
+        benchmark(options.target, options.rounds)
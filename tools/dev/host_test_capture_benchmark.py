@@ -0,0 +1,58 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Throughput benchmark of the capture of host test output
+
+A process printing many lines, followed by the end of test marker, stands in
+for a host test. Its output is captured as run_host_test does.
+"""
+import sys
+from os.path import join, abspath, dirname
+from argparse import ArgumentParser
+from subprocess import Popen, PIPE
+from time import time
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from tools.test_api import SingleTestRunner, ProcessObserver
+
+HOST_TEST = """
+import sys
+for i in range(%d):
+    sys.stdout.write("{{test line %%d with some payload}}\\n" %% i)
+sys.stdout.write("{{success}}\\n{{end}}\\n")
+"""
+
+
+def benchmark(lines):
+    proc = Popen([sys.executable, "-c", HOST_TEST % lines], stdout=PIPE)
+    obs = ProcessObserver(proc)
+    start = time()
+    output, _, _ = SingleTestRunner().get_host_test_output(obs, 60)
+    elapsed = time() - start
+    obs.stop()
+    print "Captured: %d lines, %.1fKB in %.3fs" % (
+        output.count("\n"), len(output) / 1024.0, elapsed)
+    print "Rate:     %.1fMB/s" % (len(output) / 1024.0 ** 2 / elapsed)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("-l", "--lines", type=int, default=200000,
+                        help="Number of lines printed. Default: 200000")
+    options = parser.parse_args()
+    benchmark(options.lines)
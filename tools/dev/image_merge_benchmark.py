@@ -0,0 +1,116 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark of merging a bootloader and an application image
+
+The regions are merged as merge_region_list does, with MemoryImage and with
+the IntelHex implementation it replaced. Each merge runs in its own process,
+so that the peak memory of each can be reported.
+"""
+import sys
+import resource
+from os import urandom
+from os.path import join, abspath, dirname
+from argparse import ArgumentParser
+from multiprocessing import Process, Queue
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import time
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from intelhex import IntelHex
+from tools.build_api import merge_region_list
+from tools.config import Region
+
+
+def merge_intelhex(region_list, destination, padding=b'\xFF'):
+    """merge_region_list, as implemented with IntelHex"""
+    merged = IntelHex()
+    for region in region_list:
+        if region.filename:
+            part = IntelHex()
+            if region.filename.endswith(".hex"):
+                part.loadhex(region.filename)
+            else:
+                part.loadbin(region.filename, offset=region.start)
+            part_size = (part.maxaddr() - part.minaddr()) + 1
+            merged.merge(part)
+            pad_size = region.size - part_size
+            if pad_size > 0 and region != region_list[-1]:
+                merged.puts(merged.maxaddr() + 1, padding * pad_size)
+    with open(destination, "wb+") as output:
+        merged.tofile(output, format='bin')
+
+
+def run(merge, regions, destination, results):
+    start = time()
+    merge(regions, destination)
+    results.put((time() - start,
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def benchmark(bootloader_size, application_size, hex_bootloader):
+    tmp = mkdtemp()
+    try:
+        bootloader = IntelHex()
+        bootloader.puts(0, urandom(bootloader_size))
+        if hex_bootloader:
+            bootloader_file = join(tmp, "bootloader.hex")
+            bootloader.tofile(bootloader_file, format="hex")
+        else:
+            bootloader_file = join(tmp, "bootloader.bin")
+            bootloader.tofile(bootloader_file, format="bin")
+        application_file = join(tmp, "application.bin")
+        with open(application_file, "wb") as fd:
+            fd.write(urandom(application_size))
+        bootloader_region = 2 * bootloader_size
+        regions = [
+            Region("bootloader", 0, bootloader_region, False,
+                   bootloader_file),
+            Region("application", bootloader_region, application_size, True,
+                   application_file)]
+
+        outputs = []
+        for name, merge in (("IntelHex", merge_intelhex),
+                            ("MemoryImage", merge_region_list)):
+            destination = join(tmp, name + ".bin")
+            results = Queue()
+            process = Process(target=run,
+                              args=(merge, regions, destination, results))
+            process.start()
+            duration, max_rss = results.get()
+            process.join()
+            print "%-12s %.2fs, peak memory %.1fMB" % (name, duration,
+                                                      max_rss / 1024.0)
+            with open(destination, "rb") as fd:
+                outputs.append(fd.read())
+        print "Identical output: %s" % (outputs[0] == outputs[1])
+    finally:
+        rmtree(tmp)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("--bootloader-size", type=int, default=256 * 1024,
+                        help="Size of the bootloader. Default: 256KB")
+    parser.add_argument("--application-size", type=int, default=4096 * 1024,
+                        help="Size of the application. Default: 4MB")
+    parser.add_argument("--hex", action="store_true",
+                        help="Use an Intel HEX bootloader")
+    options = parser.parse_args()
+    benchmark(options.bootloader_size, options.application_size, options.hex)
@@ -0,0 +1,114 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Report of the time spent importing the modules of a tools entry point
+
+The report has the format of "python3 -X importtime": every import that
+loads new modules is listed once they are loaded, with the time spent in that
+import alone and including the imports it made, in microseconds. Scripts are
+run with a __name__ other than "__main__", so only their imports are timed.
+"""
+import sys
+import __builtin__
+import runpy
+from os.path import join, abspath, dirname
+from argparse import ArgumentParser
+from timeit import default_timer
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+
+class ImportTimer(object):
+    """Times every call of __import__ that loads new modules
+
+    The results are in `imports`, as (depth, name, self time, cumulative
+    time) tuples in the order the imports finished.
+    """
+    def __init__(self):
+        self.imports = []
+        self._stack = []
+        self._import = None
+
+    def _timed_import(self, name, *args, **kwargs):
+        loaded = len(sys.modules)
+        self._stack.append(0.0)
+        start = default_timer()
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            cumulative = default_timer() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            if len(sys.modules) > loaded:
+                self.imports.append((len(self._stack), name,
+                                     cumulative - children, cumulative))
+
+    def __enter__(self):
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self._timed_import
+        return self
+
+    def __exit__(self, *_):
+        __builtin__.__import__ = self._import
+
+    def total(self):
+        """The time spent in the outermost imports, in seconds"""
+        return sum(cumulative for depth, _, _, cumulative in self.imports
+                   if depth == 0)
+
+
+def time_imports(target):
+    """Import a module, or run the imports of a script, timing them
+
+    Positional arguments:
+    target - a module name, or the path of a script ending in ".py"
+
+    Returns an ImportTimer
+    """
+    with ImportTimer() as timer:
+        if target.endswith(".py"):
+            # As when the script is run
+            sys.path.insert(0, dirname(abspath(target)))
+            runpy.run_path(target, run_name="__import_time__")
+        else:
+            timer._timed_import(target)
+    return timer
+
+
+def print_report(timer, top=None):
+    """Print the imports as python3 -X importtime does, or the slowest
+    imports by self time when top is given"""
+    imports = timer.imports
+    if top:
+        imports = sorted(imports, key=lambda i: i[2], reverse=True)[:top]
+    print "import time: self [us] | cumulative | imported package"
+    for depth, name, self_time, cumulative in imports:
+        print "import time: %11d | %10d | %s%s" % (
+            self_time * 1e6, cumulative * 1e6, "  " * depth, name)
+    print "Total: %.3fs, %d modules loaded" % (timer.total(), len(sys.modules))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("target",
+                        help="A module, e.g. tools.build_api, or a script, "
+                        "e.g. tools/make.py")
+    parser.add_argument("--top", type=int,
+                        help="Only list this many of the slowest imports")
+    options = parser.parse_args()
+    print_report(time_imports(options.target), options.top)
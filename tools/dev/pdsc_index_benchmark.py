@@ -0,0 +1,147 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmark of generating the index of the arm_pack_manager cache
+
+A cache of synthetic PDSC files is indexed as the pack manager did with
+BeautifulSoup, from scratch with the XML parser, and again after a few of the
+files changed.
+"""
+import sys
+from os.path import join, abspath, dirname
+from os import makedirs
+from argparse import ArgumentParser
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import time
+from mock import patch
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+from tools.arm_pack_manager import Cache
+
+DEVICE = """
+        <device Dname="DEV%(pack)d_%(device)d">
+          <processor Dclock="%(device)d000000"/>
+          <memory id="IROM1" start="0x00000000" size="0x80000" default="1"/>
+          <memory id="IRAM1" start="0x10000000" size="0x8000" default="1"/>
+          <algorithm name="Flash\\IAP_%(device)d.FLM" start="0x0" size="0x80000"/>
+          <debug svd="SVD/DEV%(device)d.svd"/>
+        </device>"""
+
+PDSC = """<?xml version="1.0" encoding="UTF-8"?>
+<package schemaVersion="1.3">
+  <vendor>Vendor</vendor>
+  <name>Pack%(pack)d</name>
+  <url>http://www.example.com/pack</url>
+  <releases>
+    <release version="1.2.0">Second</release>
+    <release version="1.0.0">First</release>
+  </releases>
+  <boards>
+    <board vendor="Vendor" name="Board%(pack)d">
+      <mountedDevice deviceIndex="0" Dvendor="NXP:11" Dname="DEV%(pack)d_0"/>
+    </board>
+  </boards>
+  <devices>
+    <family Dfamily="Family" Dvendor="NXP:11">
+      <processor Dcore="Cortex-M4" Dfpu="1" Dendian="Little-endian"/>
+      <compile header="Device/Include/Family.h"/>
+      <subFamily DsubFamily="Sub">%(devices)s
+      </subFamily>
+    </family>
+  </devices>
+</package>
+"""
+
+
+def write_pdsc(data_path, pack, devices, comment=""):
+    with open(join(data_path, "www.example.com", "pdsc",
+                   "Vendor.Pack%d.pdsc" % pack), "w") as fd:
+        fd.write(PDSC % dict(pack=pack, devices="".join(
+            DEVICE % dict(pack=pack, device=device)
+            for device in range(devices))) + comment)
+    return "http://www.example.com/pdsc/Vendor.Pack%d.pdsc" % pack
+
+
+def soup_from_cache(cache, url):
+    """Cache.pdsc_from_cache, as implemented with BeautifulSoup"""
+    with open(join(cache.data_path, url.split("://")[1]), "r") as fd:
+        return BeautifulSoup(fd, "html.parser")
+
+
+def run(name, data_path, urls, jobs):
+    cache = Cache(True, False, jobs=jobs)
+    cache.data_path = data_path
+    cache.urls = urls
+    start = time()
+    cache.generate_index()
+    cache.generate_aliases()
+    print "%-24s %.2fs, %d devices" % (name, time() - start,
+                                       len(cache._index) - 1)
+    return cache._index, cache._aliases
+
+
+def benchmark(packs, devices, changed, jobs):
+    tmp = mkdtemp()
+    try:
+        makedirs(join(tmp, "www.example.com", "pdsc"))
+        urls = [write_pdsc(tmp, pack, devices) for pack in range(packs)]
+        with patch("tools.arm_pack_manager.LocalPackIndex",
+                   join(tmp, "index.json")), \
+             patch("tools.arm_pack_manager.LocalPackAliases",
+                   join(tmp, "aliases.json")), \
+             patch("tools.arm_pack_manager.IndexFragments",
+                   "no_fragments.json"):
+            with patch.object(Cache, "pdsc_from_cache", soup_from_cache):
+                expected = run("BeautifulSoup", tmp, urls, 1)
+        for name, jobs in (("XML parser", 1), ("XML parser, %d jobs" % jobs, jobs)):
+            with patch("tools.arm_pack_manager.LocalPackIndex",
+                       join(tmp, "index.json")), \
+                 patch("tools.arm_pack_manager.LocalPackAliases",
+                       join(tmp, "aliases.json")), \
+                 patch("tools.arm_pack_manager.IndexFragments",
+                       name.replace(" ", "_").replace(",", "") + ".json"):
+                print "Identical index: %s" % (
+                    run(name, tmp, urls, jobs) == expected)
+        for pack in range(changed):
+            write_pdsc(tmp, pack, devices, "<!-- changed -->")
+        with patch("tools.arm_pack_manager.LocalPackIndex",
+                   join(tmp, "index.json")), \
+             patch("tools.arm_pack_manager.LocalPackAliases",
+                   join(tmp, "aliases.json")), \
+             patch("tools.arm_pack_manager.IndexFragments",
+                   "XML_parser.json"):
+            run("%d changed" % changed, tmp, urls, 1)
+    finally:
+        rmtree(tmp)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("--packs", type=int, default=200,
+                        help="Number of PDSC files. Default: 200")
+    parser.add_argument("--devices", type=int, default=40,
+                        help="Number of devices in every PDSC file. Default: 40")
+    parser.add_argument("--changed", type=int, default=5,
+                        help="Number of PDSC files changed before indexing "
+                        "again. Default: 5")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="Number of processes parsing PDSC files. Default: 4")
+    options = parser.parse_args()
+    benchmark(options.packs, options.devices, options.changed, options.jobs)
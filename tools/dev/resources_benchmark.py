@@ -0,0 +1,103 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Memory and latency benchmark of scanning, merging and copying Resources
+
+The source tree is scanned several times, as build_tests does for every
+test, keeping all the results alive. The memory reported is the size of
+all the objects reachable from the results, counting shared objects once.
+"""
+import sys
+from os.path import join, abspath, dirname
+from argparse import ArgumentParser
+from copy import deepcopy
+from time import time
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from tools.toolchains import TOOLCHAIN_CLASSES, Resources
+from tools.targets import TARGET_MAP
+
+
+def deep_size(roots):
+    """The size in bytes of all the objects reachable from *roots*"""
+    seen = set()
+    stack = list(roots)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or callable(obj):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        if hasattr(obj, "__dict__"):
+            stack.append(obj.__dict__)
+        for name in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, name):
+                stack.append(getattr(obj, name))
+    return total
+
+
+def scan(path, target, toolchain_name):
+    """Scan *path*, including all of its features"""
+    toolchain = TOOLCHAIN_CLASSES[toolchain_name](TARGET_MAP[target],
+                                                  silent=True)
+    resources = toolchain.scan_resources(path)
+    for name in list(resources.features):
+        resources.features[name]
+    return resources
+
+
+def benchmark(path, target, toolchain_name, repeat):
+    start = time()
+    scans = [scan(path, target, toolchain_name) for _ in range(repeat)]
+    scan_time = time() - start
+    print "Scan:     %.1fms per scan" % (scan_time * 1000 / repeat)
+    print "Memory:   %.1fMB for %d scans" % (deep_size(scans) / 1024.0 ** 2,
+                                              repeat)
+
+    start = time()
+    merged = Resources(path)
+    for resources in scans:
+        merged.add(resources)
+        for name in resources.features:
+            merged.add(resources.features[name])
+    print "Merge:    %.1fms" % ((time() - start) * 1000)
+
+    start = time()
+    for resources in scans:
+        deepcopy(resources)
+    print "Deepcopy: %.2fms per copy" % ((time() - start) * 1000 / repeat)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("--source", default=ROOT,
+                        help="The directory to scan. Default: the mbed-os tree")
+    parser.add_argument("-m", "--mcu", default="K64F",
+                        help="The target to scan for. Default: K64F")
+    parser.add_argument("-t", "--toolchain", default="GCC_ARM",
+                        help="The toolchain to scan for. Default: GCC_ARM")
+    parser.add_argument("-r", "--repeat", type=int, default=10,
+                        help="Number of scans. Default: 10")
+    options = parser.parse_args()
+    benchmark(options.source, options.mcu, options.toolchain, options.repeat)
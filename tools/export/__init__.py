@@ -17,22 +17,26 @@
 
 import sys
 from os.path import join, abspath, dirname, exists
-from os.path import basename, relpath, normpath, splitext
+from os.path import basename, relpath, normpath, splitext, split
 from os import makedirs, walk
 import copy
 from shutil import rmtree, copyfile
-import zipfile
+from collections import OrderedDict
+from time import time
+import json
 ROOT = abspath(join(dirname(__file__), ".."))
 sys.path.insert(0, ROOT)
 
 from tools.build_api import prepare_toolchain
 from tools.build_api import scan_resources
+from tools.config import Config
 from tools.toolchains import Resources
 from tools.export import lpcxpresso, ds5_5, iar, makefile
 from tools.export import embitz, coide, kds, simplicity, atmelstudio, mcuxpresso
 from tools.export import sw4stm32, e2studio, zip, cmsis, uvision, cdt, vscode
 from tools.export import gnuarmeclipse
 from tools.export import qtcreator
+from tools.export.archive import ZipWriter
 from tools.targets import TARGET_NAMES
 
 EXPORTERS = {
@@ -209,39 +213,56 @@ def generate_project_files(resources, export_path, target, name, toolchain, ide,
     return files, exporter
 
 
-def zip_export(file_name, prefix, resources, project_files, inc_repos):
+def zip_export(file_name, prefix, resources, project_files, inc_repos,
+               jobs=0):
     """Create a zip file from an exported project.
 
     Positional Parameters:
-    file_name - the file name of the resulting zip file
+    file_name - the file name of the resulting zip file, or a file object,
+      such as the file of a socket, to stream it to
     prefix - a directory name that will prefix the entire zip file's contents
     resources - a resources object with files that must be included in the zip
     project_files - a list of extra files to be added to the root of the prefix
       directory
+
+    Keyword Parameters:
+    jobs - number of threads compressing files; 0 for one per CPU
     """
-    with zipfile.ZipFile(file_name, "w") as zip_file:
+    with ZipWriter(file_name, jobs=jobs) as zip_file:
         for prj_file in project_files:
             zip_file.write(prj_file, join(prefix, basename(prj_file)))
         for loc, res in resources.iteritems():
+            # The relative path of every directory, as relpath is slow
+            relative_dirs = {}
+
+            def archive_name(source, base_path):
+                directory, filename = split(source)
+                key = (directory, base_path)
+                if key not in relative_dirs:
+                    relative_dirs[key] = normpath(join(
+                        prefix, loc, relpath(directory, base_path)))
+                return join(relative_dirs[key], filename)
+
             to_zip = (
                 res.headers + res.s_sources + res.c_sources +\
                 res.cpp_sources + res.libraries + res.hex_files + \
                 [res.linker_script] + res.bin_files + res.objects + \
                 res.json_files + res.lib_refs + res.lib_builds)
+            for source in to_zip:
+                if source:
+                    zip_file.write(
+                        source, archive_name(source,
+                                             res.file_basepath[source]))
             if inc_repos:
                 for directory in res.repo_dirs:
                     for root, _, files in walk(directory):
                         for repo_file in files:
                             source = join(root, repo_file)
-                            to_zip.append(source)
-                            res.file_basepath[source] = res.base_path
-                to_zip += res.repo_files
-            for source in to_zip:
-                if source:
-                    zip_file.write(
-                        source,
-                        join(prefix, loc,
-                             relpath(source, res.file_basepath[source])))
+                            zip_file.write(source,
+                                           archive_name(source, res.base_path))
+                for source in res.repo_files:
+                    zip_file.write(source, archive_name(
+                        source, res.file_basepath[source]))
             for source in res.lib_builds:
                 target_dir, _ = splitext(source)
                 dest = join(prefix, loc,
@@ -282,20 +303,7 @@ def export_project(src_paths, export_path, target, ide, libraries_paths=None,
      if you do not wish to create an archive
     """
 
-    # Convert src_path to a list if needed
-    if isinstance(src_paths, dict):
-        paths = sum(src_paths.values(), [])
-    elif isinstance(src_paths, list):
-        paths = src_paths[:]
-    else:
-        paths = [src_paths]
-
-    # Extend src_paths wit libraries_paths
-    if libraries_paths is not None:
-        paths.extend(libraries_paths)
-
-    if not isinstance(src_paths, dict):
-        src_paths = {"": paths}
+    paths, src_paths = _source_paths(src_paths, libraries_paths)
 
     # Export Directory
     if not exists(export_path):
@@ -312,11 +320,53 @@ def export_project(src_paths, export_path, target, ide, libraries_paths=None,
     # The first path will give the name to the library
     toolchain.RESPONSE_FILES = False
     if name is None:
-        name = basename(normpath(abspath(src_paths[0])))
+        name = basename(normpath(abspath(paths[0])))
 
     # Call unified scan_resources
     resource_dict = {loc: scan_resources(path, toolchain, inc_dirs=inc_dirs, collect_ignores=True)
                      for loc, path in src_paths.iteritems()}
+    return _generate_export(toolchain, resource_dict, export_path, target,
+                            ide, name, macros=macros,
+                            linker_script=linker_script, zip_proj=zip_proj,
+                            inc_repos=inc_repos)
+
+
+def _source_paths(src_paths, libraries_paths=None):
+    """The list of all source paths, and the source paths by location in the
+    exported project, as export_project accepts them"""
+    # Convert src_path to a list if needed
+    if isinstance(src_paths, dict):
+        paths = sum(src_paths.values(), [])
+    elif isinstance(src_paths, list):
+        paths = src_paths[:]
+    else:
+        paths = [src_paths]
+
+    # Extend src_paths wit libraries_paths
+    if libraries_paths is not None:
+        paths.extend(libraries_paths)
+
+    if not isinstance(src_paths, dict):
+        src_paths = {"": paths}
+    return paths, src_paths
+
+
+def _generate_export(toolchain, resource_dict, export_path, target, ide, name,
+                     macros=None, linker_script=None, zip_proj=None,
+                     inc_repos=False, zip_jobs=0):
+    """Generate the project files of scanned resources, and zip them if
+    specified
+
+    Positional Arguments:
+    toolchain - the toolchain the resources were scanned with
+    resource_dict - the Resources of every location in the project
+    export_path, target, ide, name - as in export_project
+
+    Keyword Arguments:
+    macros, linker_script, zip_proj, inc_repos - as in export_project
+    zip_jobs - number of threads compressing the zip archive; 0 for one per
+      CPU
+    """
     resources = Resources()
     toolchain.build_dir = export_path
     config_header = toolchain.get_config_header()
@@ -337,24 +387,206 @@ def export_project(src_paths, export_path, target, ide, libraries_paths=None,
     if linker_script is not None:
         resources.linker_script = linker_script
 
-    files, exporter = generate_project_files(resources, export_path,
-                                             target, name, toolchain, ide,
-                                             macros=macros)
+    with toolchain.timer.span("generate"):
+        files, exporter = generate_project_files(resources, export_path,
+                                                 target, name, toolchain, ide,
+                                                 macros=macros)
     files.append(config_header)
     if zip_proj:
         for resource in resource_dict.values():
             for label, res in resource.features.iteritems():
                 if label not in toolchain.target.features:
                     resource.add(res)
-        if isinstance(zip_proj, basestring):
-            zip_export(join(export_path, zip_proj), name, resource_dict,
-                       files + list(exporter.static_files), inc_repos)
-        else:
-            zip_export(zip_proj, name, resource_dict,
-                       files + list(exporter.static_files), inc_repos)
+        with toolchain.timer.span("zip"):
+            if isinstance(zip_proj, basestring):
+                zip_export(join(export_path, zip_proj), name, resource_dict,
+                           files + list(exporter.static_files), inc_repos,
+                           jobs=zip_jobs)
+            else:
+                zip_export(zip_proj, name, resource_dict,
+                           files + list(exporter.static_files), inc_repos,
+                           jobs=zip_jobs)
     else:
         for static_file in exporter.static_files:
             if not exists(join(export_path, basename(static_file))):
                 copyfile(static_file, join(export_path, basename(static_file)))
 
     return exporter
+
+
+# The scanned projects of the batch export run by this process, by target and
+# toolchain
+_batch_projects = {}
+
+
+def export_projects(src_paths, export_root, targets, ides, name=None,
+                    libraries_paths=None, macros=None, build_profile=None,
+                    app_config=None, zip_proj=True, inc_repos=False, jobs=1,
+                    report=None, silent=False):
+    """Export a program to every combination of targets and IDEs
+
+    The sources are scanned once for every target and toolchain, as the
+    toolchain labels select the sources, and the resolved configuration and
+    resources are shared by all IDEs using that toolchain. The project files
+    are then generated by up to *jobs* worker processes. Exports failing, or
+    to IDEs not supporting a target, are reported and do not stop the batch.
+
+    Positional Arguments:
+    src_paths - a list of paths from which to find source files
+    export_root - the directory containing a directory per exported project,
+      named as the project, the IDE and the target joined with "_"
+    targets - the mbed boards/mcus to export to
+    ides - the IDEs to export to
+
+    Keyword Arguments:
+    name - project name; the name of the first source path by default
+    libraries_paths, macros, build_profile, app_config, inc_repos - as in
+      export_project
+    zip_proj - create a zip archive of every project, named as its directory
+    jobs - number of worker processes generating projects; on Windows, where
+      the workers could not inherit the scanned sources, projects are
+      generated in this process
+    report - the name of a JSON file to write the timing report to
+    silent - silent export - no output
+
+    Returns the timing report: a list with a dict for every export, in the
+    order of targets and then IDEs, see export_report_table
+    """
+    paths, src_paths = _source_paths(src_paths, libraries_paths)
+    if name is None:
+        name = basename(normpath(abspath(paths[0])))
+
+    entries = []
+    projects = OrderedDict()
+    for target in targets:
+        for ide in ides:
+            exporter, toolchain_name = get_exporter_toolchain(ide)
+            project = "_".join([name, ide, target])
+            entry = {"target": target, "ide": ide, "toolchain": toolchain_name,
+                     "export_path": join(export_root, project),
+                     "zip": project + ".zip" if zip_proj else None,
+                     "result": "OK", "error": None, "scan": 0.0,
+                     "shared_scan": 0, "generate": 0.0, "zip_time": 0.0,
+                     "total": 0.0}
+            if not exporter.is_target_supported(target):
+                entry["result"] = "NOT_SUPPORTED"
+                entry["error"] = "%s not supported by %s" % (target, ide)
+            else:
+                projects.setdefault((target, toolchain_name), []).append(entry)
+            entries.append(entry)
+
+    _batch_projects.clear()
+    for (target, toolchain_name), project_entries in projects.iteritems():
+        start = time()
+        try:
+            config = Config(target, paths, app_config=app_config)
+            toolchain = prepare_toolchain(
+                paths, "", target, toolchain_name, macros=macros,
+                silent=silent, config=config, build_profile=build_profile)
+            resource_dict = {loc: scan_resources(path, toolchain,
+                                                 collect_ignores=True)
+                             for loc, path in src_paths.iteritems()}
+            if zip_proj:
+                # Scan the features, which are zipped, once as well
+                for resources in resource_dict.values():
+                    list(resources.features.iteritems())
+            _batch_projects[(target, toolchain_name)] = {
+                "paths": paths, "config": config,
+                "config_data": toolchain.config_data,
+                "resources": resource_dict, "name": name, "macros": macros,
+                "build_profile": build_profile, "inc_repos": inc_repos,
+                "silent": silent}
+        except Exception as exc:
+            for entry in project_entries:
+                entry["result"] = "FAIL"
+                entry["error"] = str(exc) or exc.__class__.__name__
+        scan = time() - start
+        for entry in project_entries:
+            entry["scan"] = scan
+            entry["shared_scan"] = len(project_entries)
+
+    queue = [entry for entry in entries if entry["result"] == "OK"]
+    parallel = jobs > 1 and len(queue) > 1 and sys.platform != "win32"
+    for project in _batch_projects.values():
+        # The worker processes compress their archive on a single thread
+        project["zip_jobs"] = 1 if parallel else 0
+    if parallel:
+        # The workers inherit the scanned projects
+        from multiprocessing import Pool
+        pool = Pool(processes=min(jobs, len(queue)))
+        try:
+            results = pool.map(_export_batch_entry, queue)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [_export_batch_entry(entry) for entry in queue]
+    # zip is the exporter module here
+    for entry, result in map(None, queue, results):
+        entry.update(result)
+    _batch_projects.clear()
+
+    if report:
+        write_export_report(entries, report)
+    return entries
+
+
+def _export_batch_entry(entry):
+    """Export a project of the batch run by export_projects
+
+    Returns the result, error and timing of the export
+    """
+    project = _batch_projects[(entry["target"], entry["toolchain"])]
+    start = time()
+    result = {"result": "OK", "error": None}
+    try:
+        if not exists(entry["export_path"]):
+            makedirs(entry["export_path"])
+        toolchain = prepare_toolchain(
+            project["paths"], "", entry["target"], entry["toolchain"],
+            macros=project["macros"], silent=project["silent"],
+            config=project["config"], build_profile=project["build_profile"])
+        toolchain.set_config_data(project["config_data"])
+        toolchain.RESPONSE_FILES = False
+        _generate_export(toolchain, copy.deepcopy(project["resources"]),
+                         entry["export_path"], entry["target"], entry["ide"],
+                         project["name"], macros=project["macros"],
+                         zip_proj=entry["zip"],
+                         inc_repos=project["inc_repos"],
+                         zip_jobs=project["zip_jobs"])
+        totals = toolchain.timer.totals()
+        result["generate"] = totals.get("generate", 0.0)
+        result["zip_time"] = totals.get("zip", 0.0)
+    except Exception as exc:
+        result["result"] = "FAIL"
+        result["error"] = str(exc) or exc.__class__.__name__
+    result["total"] = time() - start
+    return result
+
+
+def write_export_report(entries, filename):
+    """Write the timing report of export_projects as JSON"""
+    with open(filename, "w") as fd:
+        json.dump(entries, fd, indent=4, sort_keys=True)
+
+
+def export_report_table(entries):
+    """A table of the timing report of export_projects
+
+    Every export reports the time spent scanning its sources, shared with the
+    given number of exports of the same target and toolchain, and the time
+    spent generating project files, zipping them and exporting in total,
+    without the scan. Times are in seconds.
+    """
+    from prettytable import PrettyTable
+    table = PrettyTable(["Target", "IDE", "Result", "Scan (shared)",
+                         "Generate", "Zip", "Total"])
+    table.align["Target"] = "l"
+    table.align["IDE"] = "l"
+    for entry in entries:
+        scan = ("%.3f (%d)" % (entry["scan"], entry["shared_scan"])
+                if entry["shared_scan"] else "")
+        table.add_row([entry["target"], entry["ide"], entry["result"], scan,
+                       "%.3f" % entry["generate"], "%.3f" % entry["zip_time"],
+                       "%.3f" % entry["total"]])
+    return table.get_string()
@@ -0,0 +1,212 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import struct
+import zlib
+from time import localtime
+from collections import deque
+from os import stat
+from os.path import splitext
+from zipfile import ZipFile, ZipInfo, ZIP_STORED, ZIP_DEFLATED
+
+# Files that are stored as they are, as compressing them gains little
+STORED_EXTENSIONS = frozenset([".a", ".ar", ".lib", ".bin", ".hex", ".zip",
+                               ".pack"])
+
+# Files larger than this are compressed while they are written, in chunks of
+# CHUNK_SIZE, rather than read whole by a worker
+STREAM_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 16
+
+# Number of files read and compressed ahead of the output, per worker
+PENDING_PER_JOB = 4
+
+# Signature of the data descriptor following the files streamed
+_DATA_DESCRIPTOR = 0x08074b50
+
+
+class _Output(object):
+    """A file object that only needs a write method, such as the file of a
+    socket, with the position that ZipFile expects from tell"""
+    def __init__(self, fd):
+        self.fd = fd
+        self.position = 0
+
+    def write(self, data):
+        self.fd.write(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        if hasattr(self.fd, "flush"):
+            self.fd.flush()
+
+
+def _zip_info(name, info, compress_type):
+    zinfo = ZipInfo(name, localtime(info.st_mtime)[:6])
+    zinfo.external_attr = (info.st_mode & 0xFFFF) << 16
+    zinfo.compress_type = compress_type
+    zinfo.file_size = info.st_size
+    return zinfo
+
+
+def _compress(source, compress_type, level):
+    """Read and compress a file, returning its CRC and zip data"""
+    with open(source, "rb") as fd:
+        data = fd.read()
+    crc = zlib.crc32(data) & 0xffffffff
+    if compress_type == ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+    return crc, data
+
+
+class ZipWriter(object):
+    """Writes a zip archive, compressing its files on worker threads
+
+    Files are read and compressed up to PENDING_PER_JOB files per worker
+    ahead of the output, which is written in order, so memory use is bounded
+    whatever the size of the archive. The output may be a file name or any
+    object with a write method: the archive is written front to back, without
+    seeking. Files with one of STORED_EXTENSIONS are stored uncompressed.
+
+    Keyword arguments:
+    jobs - number of worker threads; 0 for one per CPU
+    compression - ZIP_DEFLATED or ZIP_STORED
+    level - the zlib compression level
+    """
+    def __init__(self, output, jobs=0, compression=ZIP_DEFLATED,
+                 level=zlib.Z_DEFAULT_COMPRESSION):
+        if isinstance(output, basestring):
+            self._file = open(output, "wb")
+        else:
+            self._file = None
+        self._output = _Output(self._file or output)
+        self._zip = ZipFile(self._output, "w", compression, allowZip64=True)
+        self.compression = compression
+        self.level = level
+        if not jobs:
+            from multiprocessing import cpu_count
+            jobs = cpu_count()
+        self._pool = None
+        if jobs > 1:
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(jobs)
+        self._window = jobs * PENDING_PER_JOB
+        self._pending = deque()
+
+    def _compress_type(self, source):
+        if splitext(source)[1].lower() in STORED_EXTENSIONS:
+            return ZIP_STORED
+        return self.compression
+
+    def write(self, source, name):
+        """Add the file *source* to the archive as *name*"""
+        compress_type = self._compress_type(source)
+        info = stat(source)
+        if info.st_size > STREAM_SIZE:
+            self._drain(0)
+            self._write_stream(source, name, info, compress_type)
+            return
+        args = (source, compress_type, self.level)
+        if self._pool:
+            result = self._pool.apply_async(_compress, args)
+        else:
+            result = _compress(*args)
+        self._pending.append((name, info, compress_type, result))
+        self._drain(self._window)
+
+    def _drain(self, window):
+        """Write the pending files in order, until at most *window* remain"""
+        while len(self._pending) > window:
+            name, info, compress_type, result = self._pending.popleft()
+            if self._pool:
+                result = result.get()
+            crc, data = result
+            zinfo = _zip_info(name, info, compress_type)
+            zinfo.CRC = crc
+            zinfo.compress_size = len(data)
+            self._begin(zinfo)
+            self._output.write(data)
+            self._end(zinfo)
+
+    def _write_stream(self, source, name, info, compress_type):
+        """Write a large file in chunks, followed by its CRC and sizes"""
+        zinfo = _zip_info(name, info, compress_type)
+        zinfo.flag_bits |= 0x08
+        zip64 = info.st_size > (1 << 31) - 1
+        self._begin(zinfo, zip64)
+        crc = 0
+        size = compress_size = 0
+        compressor = None
+        if compress_type == ZIP_DEFLATED:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        with open(source, "rb") as fd:
+            for chunk in iter(lambda: fd.read(CHUNK_SIZE), ""):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                compress_size += len(chunk)
+                self._output.write(chunk)
+        if compressor:
+            chunk = compressor.flush()
+            compress_size += len(chunk)
+            self._output.write(chunk)
+        zinfo.CRC = crc & 0xffffffff
+        zinfo.file_size = size
+        zinfo.compress_size = compress_size
+        self._output.write(struct.pack("<LLQQ" if zip64 else "<LLLL",
+                                       _DATA_DESCRIPTOR, zinfo.CRC,
+                                       compress_size, size))
+        self._end(zinfo)
+
+    def _begin(self, zinfo, zip64=None):
+        zinfo.header_offset = self._output.tell()
+        self._zip._writecheck(zinfo)
+        self._output.write(zinfo.FileHeader(zip64))
+
+    def _end(self, zinfo):
+        self._zip.filelist.append(zinfo)
+        self._zip.NameToInfo[zinfo.filename] = zinfo
+
+    def close(self):
+        """Write the remaining files and the central directory"""
+        try:
+            self._drain(0)
+            self._zip.close()
+        finally:
+            self._terminate()
+
+    def _terminate(self):
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self._terminate()
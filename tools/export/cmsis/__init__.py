@@ -53,13 +53,13 @@ class DeviceCMSIS():
         t = TARGET_MAP[target]
         try:
             cpu_name = t.device_name
-            target_info = DeviceCMSIS.CACHE.index[cpu_name]
+            target_info = DeviceCMSIS.CACHE.lookup[cpu_name]
         # Target does not have device name or pdsc file
         except:
             try:
                 # Try to find the core as a generic CMSIS target
                 cpu_name = DeviceCMSIS.cpu_cmsis(t.core)
-                target_info = DeviceCMSIS.CACHE.index[cpu_name]
+                target_info = DeviceCMSIS.CACHE.lookup[cpu_name]
             except:
                 return False
         target_info["_cpu_name"] = cpu_name
@@ -4,11 +4,11 @@ from abc import abstractmethod, ABCMeta
 import logging
 from os.path import join, dirname, relpath, basename, realpath, normpath
 from itertools import groupby
-from jinja2 import FileSystemLoader, StrictUndefined
-from jinja2.environment import Environment
+from jinja2 import Undefined
 import copy
 
 from tools.targets import TARGET_MAP
+from tools.templates import get_environment, get_template
 
 
 class TargetNotSupportedException(Exception):
@@ -45,7 +45,7 @@ class Exporter(object):
     progen.
     """
     __metaclass__ = ABCMeta
-    TEMPLATE_DIR = dirname(__file__)
+    TEMPLATE_DIR = dirname(os.path.abspath(__file__))
     DOT_IN_RELATIVE_PATH = False
     NAME = None
     TARGETS = set()
@@ -69,8 +69,8 @@ class Exporter(object):
         self.target = target
         self.project_name = project_name
         self.toolchain = toolchain
-        jinja_loader = FileSystemLoader(os.path.dirname(os.path.abspath(__file__)))
-        self.jinja_environment = Environment(loader=jinja_loader)
+        self.jinja_environment = get_environment(self.TEMPLATE_DIR,
+                                                 undefined=Undefined)
         self.resources = resources
         self.generated_files = []
         self.static_files = (
@@ -131,13 +131,11 @@ class Exporter(object):
         return list(set([os.path.dirname(src) for src in source_files]))
 
     def gen_file(self, template_file, data, target_file, **kwargs):
-        """Generates a project file from a template using jinja"""
-        jinja_loader = FileSystemLoader(
-            os.path.dirname(os.path.abspath(__file__)))
-        jinja_environment = Environment(loader=jinja_loader,
-                                        undefined=StrictUndefined, **kwargs)
+        """Generates a project file from a template using jinja
 
-        template = jinja_environment.get_template(template_file)
+        Templates are compiled once per process, see tools/templates.py
+        """
+        template = get_template(self.TEMPLATE_DIR, template_file, **kwargs)
         target_text = template.render(data)
 
         target_path = join(self.export_dir, target_file)
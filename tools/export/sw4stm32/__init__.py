@@ -458,7 +458,8 @@ class Sw4STM32(GNUARMEclipse):
             # pass an empty string to avoid crashing.
             src_paths = ['']
             toolchain = prepare_toolchain(
-                src_paths, "", self.toolchain.target.name, self.TOOLCHAIN, build_profile=[profile])
+                src_paths, "", self.toolchain.target.name, self.TOOLCHAIN, build_profile=[profile],
+                config=self.toolchain.config)
 
             # Hack to fill in build_dir
             toolchain.build_dir = self.toolchain.build_dir
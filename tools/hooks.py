@@ -17,6 +17,14 @@ _HOOK_TYPES = ["binary", "compile", "link", "assemble"]
 # Available hook steps
 _HOOK_STEPS = ["pre", "replace", "post"]
 
+def _run_hook(hook, step, tool, t_self, args, kwargs):
+    """Run a hook, timing it when the hooked object has a build timer"""
+    timer = getattr(t_self, "timer", None)
+    if timer is None:
+        return hook(t_self, *args, **kwargs)
+    with timer.span("%s-%s hook" % (step, tool)):
+        return hook(t_self, *args, **kwargs)
+
 # Hook the given function. Use this function as a decorator
 def hook_tool(function):
     """Decorate a function as a tool that may be hooked"""
@@ -38,7 +46,8 @@ def hook_tool(function):
         setattr(t_self, tool_flag, False)
         # If there is a replace hook, execute the replacement instead
         if tooldesc.has_key("replace"):
-            res = tooldesc["replace"](t_self, *args, **kwargs)
+            res = _run_hook(tooldesc["replace"], "replace", tool, t_self,
+                            args, kwargs)
         # If the replacement has set the "done" flag, exit now
         # Otherwise continue as usual
         if getattr(t_self, tool_flag, False):
@@ -46,12 +55,13 @@ def hook_tool(function):
             return res
         # Execute pre-function before main function if specified
         if tooldesc.has_key("pre"):
-            tooldesc["pre"](t_self, *args, **kwargs)
+            _run_hook(tooldesc["pre"], "pre", tool, t_self, args, kwargs)
         # Execute the main function now
         res = function(t_self, *args, **kwargs)
         # Execute post-function after main function if specified
         if tooldesc.has_key("post"):
-            post_res = tooldesc["post"](t_self, *args, **kwargs)
+            post_res = _run_hook(tooldesc["post"], "post", tool, t_self,
+                                 args, kwargs)
             _RUNNING_HOOKS[tool] = False
             return post_res or res
         else:
@@ -77,6 +77,20 @@ if __name__ == '__main__':
         default=0,
         help="Number of concurrent jobs. Default: 0/auto (based on host machine's number of CPUs)")
 
+    parser.add_argument(
+        "--compile-timeout",
+        type=float,
+        dest="compile_timeout",
+        default=None,
+        help="Abort if compiling takes longer than this many seconds. Default: no limit")
+
+    parser.add_argument(
+        "--scan-jobs",
+        type=int,
+        dest="scan_jobs",
+        default=1,
+        help="Number of threads that scan source directories and features. Default: 1")
+
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -287,6 +301,8 @@ if __name__ == '__main__':
                                      silent=options.silent,
                                      macros=options.macros,
                                      jobs=options.jobs,
+                                     compile_timeout=options.compile_timeout,
+                                     scan_jobs=options.scan_jobs,
                                      name=options.artifact_name,
                                      app_config=options.app_config,
                                      inc_dirs=[dirname(MBED_LIBRARIES)],
@@ -8,8 +8,6 @@ import re
 import csv
 import json
 import argparse
-from copy import deepcopy
-from prettytable import PrettyTable
 
 from utils import argparse_filestring_type, \
     argparse_lowercase_hyphen_type, argparse_uppercase_type
@@ -75,6 +73,47 @@ class MemapParser(object):
         # this is a dict because modules are looked up by their basename
         self.cmd_modules = {}
 
+        # Module names by their basename, so that module_add can find a
+        # module named with a different path. See _find_module
+        self._basename_index = {}
+        self._indexed_modules = None
+
+    @staticmethod
+    def _index_key(module_path):
+        """The key of a module in the basename index, or None for a module
+        without a directory, which can only be found by its exact name"""
+        index = module_path.rfind(os.sep)
+        if index == -1:
+            return None
+        return module_path[index + 1:]
+
+    def _index_module(self, module_path):
+        key = self._index_key(module_path)
+        if key is not None:
+            self._basename_index.setdefault(key, []).append(module_path)
+
+    def _find_module(self, object_name):
+        """Find the module that an object, not known by its exact name,
+        belongs to: a module with the same basename"""
+        if self._indexed_modules is not self.modules:
+            # The modules were replaced from outside; index them again
+            self._basename_index = {}
+            for module_path in self.modules:
+                self._index_module(module_path)
+            self._indexed_modules = self.modules
+        candidates = self._basename_index.get(os.path.basename(object_name))
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        # Several modules share the basename: pick the first one in the
+        # order of the modules dict, as a search through it would
+        obj_split = os.sep + os.path.basename(object_name)
+        for module_path in self.modules:
+            if module_path.endswith(obj_split):
+                return module_path
+        return None
+
 
     def module_add(self, object_name, size, section):
         """ Adds a module / section to the list
@@ -88,20 +127,15 @@ class MemapParser(object):
         if not object_name or not size or not section:
             return
 
-        if object_name in self.modules:
-            self.modules[object_name].setdefault(section, 0)
-            self.modules[object_name][section] += size
-            return
-
-        obj_split = os.sep + os.path.basename(object_name)
-        for module_path, contents in self.modules.items():
-            if module_path.endswith(obj_split) or module_path == object_name:
-                contents.setdefault(section, 0)
-                contents[section] += size
+        contents = self.modules.get(object_name)
+        if contents is None:
+            module_path = self._find_module(object_name)
+            if module_path is None:
+                self.modules[object_name] = {section: size}
+                self._index_module(object_name)
                 return
-
-        new_module = {section: size}
-        self.modules[object_name] = new_module
+            contents = self.modules[module_path]
+        contents[section] = contents.get(section, 0) + size
 
     def module_replace(self, old_object, new_object):
         """ Replaces an object name with a new one
@@ -109,6 +143,11 @@ class MemapParser(object):
         if old_object in self.modules:
             self.modules[new_object] = self.modules[old_object]
             del self.modules[old_object]
+            if self._indexed_modules is self.modules:
+                key = self._index_key(old_object)
+                if key is not None:
+                    self._basename_index[key].remove(old_object)
+                self._index_module(new_object)
 
     def check_new_section_gcc(self, line):
         """ Check whether a new section in a map file has been detected (only
@@ -117,6 +156,9 @@ class MemapParser(object):
         Positional arguments:
         line - the line to check for a new section
         """
+        # Most lines do not start a section
+        if not line.startswith(('.', 'unknown', 'OUTPUT')):
+            return False
 
         for i in self.all_sections:
             if line.startswith(i):
@@ -137,7 +179,7 @@ class MemapParser(object):
         """
 
         line = line.replace('\\', '/')
-        test_re_mbed_os_name = re.match(RE_OBJECT_FILE_GCC, line)
+        test_re_mbed_os_name = RE_OBJECT_FILE_GCC.match(line)
 
         if test_re_mbed_os_name:
 
@@ -150,7 +192,7 @@ class MemapParser(object):
 
         else:
 
-            test_re_obj_name = re.match(RE_LIBRARY_OBJECT_GCC, line)
+            test_re_obj_name = RE_LIBRARY_OBJECT_GCC.match(line)
 
             if test_re_obj_name:
                 object_name = test_re_obj_name.group(1) + '/' + \
@@ -173,13 +215,13 @@ class MemapParser(object):
         line - the line to parse a section from
         """
 
-        is_fill = re.match(RE_FILL_SECTION_GCC, line)
+        is_fill = RE_FILL_SECTION_GCC.match(line)
         if is_fill:
             o_name = '[fill]'
             o_size = int(is_fill.group(2), 16)
             return [o_name, o_size]
 
-        is_section = re.match(RE_STD_SECTION_GCC, line)
+        is_section = RE_STD_SECTION_GCC.match(line)
         if is_section:
             o_size = int(is_section.group(2), 16)
             if o_size:
@@ -239,7 +281,7 @@ class MemapParser(object):
             return line
 
         else:
-            is_obj = re.match(RE_OBJECT_ARMCC, line)
+            is_obj = RE_OBJECT_ARMCC.match(line)
             if is_obj:
                 object_name = os.path.basename(is_obj.group(1)) + '/' + is_obj.group(3)
                 return '[lib]/' + object_name
@@ -261,7 +303,7 @@ class MemapParser(object):
         line - the line to parse the section data from
         """
 
-        test_re_armcc = re.match(RE_ARMCC, line)
+        test_re_armcc = RE_ARMCC.match(line)
 
         if test_re_armcc:
 
@@ -322,7 +364,7 @@ class MemapParser(object):
         line - the line to parse section data from
         """
 
-        test_re_iar = re.match(RE_IAR, line)
+        test_re_iar = RE_IAR.match(line)
 
         if test_re_iar:
 
@@ -393,7 +435,7 @@ class MemapParser(object):
         """
 
 
-        test_address_line = re.match(RE_LIBRARY_IAR, line)
+        test_address_line = RE_LIBRARY_IAR.match(line)
 
         if test_address_line:
             return test_address_line.group(1)
@@ -412,7 +454,7 @@ class MemapParser(object):
 
         """
 
-        test_address_line = re.match(RE_OBJECT_LIBRARY_IAR, line)
+        test_address_line = RE_OBJECT_LIBRARY_IAR.match(line)
 
         if test_address_line:
             return test_address_line.group(1)
@@ -488,18 +530,21 @@ class MemapParser(object):
 
         """
         if depth == 0 or depth == None:
-            self.short_modules = deepcopy(self.modules)
+            # The sections hold numbers only, so copying both levels of
+            # dicts is as good as a deep copy
+            self.short_modules = dict((name, dict(sections)) for name, sections
+                                      in self.modules.iteritems())
         else:
             self.short_modules = dict()
-            for module_name, v in self.modules.items():
+            for module_name, v in self.modules.iteritems():
                 split_name = module_name.split('/')
                 if split_name[0] == '':
                     split_name = split_name[1:]
                 new_name = "/".join(split_name[:depth])
-                self.short_modules.setdefault(new_name, {})
-                for section_idx, value in v.items():
-                    self.short_modules[new_name].setdefault(section_idx, 0)
-                    self.short_modules[new_name][section_idx] += self.modules[module_name][section_idx]
+                short_module = self.short_modules.setdefault(new_name, {})
+                for section_idx, value in v.iteritems():
+                    short_module[section_idx] = (
+                        short_module.get(section_idx, 0) + value)
 
 
     export_formats = ["json", "csv-ci", "table"]
@@ -582,6 +627,8 @@ class MemapParser(object):
 
         Returns: string of the generated table
         """
+        from prettytable import PrettyTable
+
         # Create table
         columns = ['Module']
         columns.extend(self.print_sections)
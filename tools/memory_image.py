@@ -0,0 +1,274 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from bisect import bisect_left, bisect_right
+from binascii import hexlify, unhexlify, Error as HexError
+from os.path import splitext
+
+from tools.utils import ToolException
+
+# Binary contents are produced in chunks of at most this size
+CHUNK_SIZE = 64 * 1024
+
+
+class MemoryImage(object):
+    """The contents of memory, such as the firmware of a device, built from
+    binary and Intel HEX files
+
+    The image is a sorted list of contiguous segments, each a bytearray, so
+    that it takes about as much memory as its contents. Gaps between the
+    segments take no memory; they are filled with padding when the image is
+    written as a binary. This replaces IntelHex, which stores every byte in
+    a dict, for merging large images.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._data = []
+        self.start_addr = None
+
+    def __len__(self):
+        """The number of bytes in the image, not counting gaps"""
+        return sum(len(data) for data in self._data)
+
+    def segments(self):
+        """The (start address, bytearray) pairs of the image, in order"""
+        return zip(self._starts, self._data)
+
+    def minaddr(self):
+        """The lowest address in the image, or None if it is empty"""
+        return self._starts[0] if self._starts else None
+
+    def maxaddr(self):
+        """The highest address in the image, or None if it is empty"""
+        if not self._starts:
+            return None
+        return self._starts[-1] + len(self._data[-1]) - 1
+
+    def overlaps(self, address, size):
+        """Whether any of the *size* bytes at *address* are in the image"""
+        index = bisect_left(self._starts, address + size) - 1
+        return (index >= 0 and size > 0 and
+                self._starts[index] + len(self._data[index]) > address)
+
+    def put(self, address, data):
+        """Write *data* at *address*, replacing anything already there"""
+        if not data:
+            return
+        end = address + len(data)
+        starts = self._starts
+        # The segments that overlap or touch [address, end]
+        low = bisect_right(starts, address) - 1
+        if low < 0 or starts[low] + len(self._data[low]) < address:
+            low += 1
+        high = bisect_right(starts, end)
+        if low == high:
+            starts.insert(low, address)
+            self._data.insert(low, bytearray(data))
+            return
+        first = self._data[low]
+        first_end = starts[low] + len(first)
+        if high == low + 1 and starts[low] <= address:
+            if end <= first_end:
+                # Within a segment
+                first[address - starts[low]:end - starts[low]] = data
+                return
+            if address == first_end:
+                # Appended to a segment
+                first.extend(data)
+                return
+        start = min(starts[low], address)
+        last_end = starts[high - 1] + len(self._data[high - 1])
+        merged = bytearray(max(end, last_end) - start)
+        for seg_start, seg_data in zip(starts[low:high], self._data[low:high]):
+            merged[seg_start - start:seg_start - start + len(seg_data)] = \
+                seg_data
+        merged[address - start:end - start] = data
+        starts[low:high] = [start]
+        self._data[low:high] = [merged]
+
+    def merge(self, other, overlap='error'):
+        """Add the contents of the image *other*
+
+        Keyword arguments:
+        overlap - what to do with addresses in both images: 'error' raises a
+                  ToolException, 'replace' uses the contents of *other*
+        """
+        for start, data in other.segments():
+            if overlap == 'error' and self.overlaps(start, len(data)):
+                raise ToolException("Data overlapped at address 0x%x" % start)
+            self.put(start, data)
+        if other.start_addr is not None and \
+           self.start_addr != other.start_addr:
+            if self.start_addr is not None and overlap == 'error':
+                raise ToolException("Starting addresses are different")
+            self.start_addr = other.start_addr
+
+    def load_bin(self, filename, offset=0):
+        """Add the contents of the binary file *filename* at *offset*"""
+        with open(filename, "rb") as fd:
+            self.put(offset, bytearray(fd.read()))
+
+    def load_hex(self, filename):
+        """Add the contents of the Intel HEX file *filename*"""
+        base = 0
+        run_start = None
+        run = bytearray()
+        with open(filename, "r") as fd:
+            for line_number, line in enumerate(fd, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    if line[0] != ":":
+                        raise ValueError
+                    record = bytearray(unhexlify(line[1:]))
+                    if (len(record) < 5 or len(record) != record[0] + 5 or
+                            sum(record) & 0xFF):
+                        raise ValueError
+                except (ValueError, TypeError, HexError):
+                    raise ToolException("%s:%d: invalid Intel HEX record"
+                                        % (filename, line_number))
+                rectype = record[3]
+                data = record[4:-1]
+                if rectype == 0:
+                    address = base + (record[1] << 8 | record[2])
+                    if run_start is not None and \
+                       address == run_start + len(run):
+                        run.extend(data)
+                        continue
+                    self._put_run(filename, run_start, run)
+                    run_start, run = address, data
+                elif rectype == 1:
+                    break
+                elif rectype == 2:
+                    base = (data[0] << 8 | data[1]) * 16
+                elif rectype == 4:
+                    base = (data[0] << 8 | data[1]) << 16
+                elif rectype == 3:
+                    self.start_addr = {'CS': data[0] << 8 | data[1],
+                                       'IP': data[2] << 8 | data[3]}
+                elif rectype == 5:
+                    self.start_addr = {'EIP': (data[0] << 24 | data[1] << 16 |
+                                               data[2] << 8 | data[3])}
+        self._put_run(filename, run_start, run)
+
+    def _put_run(self, filename, start, data):
+        if start is None:
+            return
+        if self.overlaps(start, len(data)):
+            raise ToolException("%s: data overlapped at address 0x%x"
+                                % (filename, start))
+        self.put(start, data)
+
+    def iter_bin(self, start=None, end=None, padding=0xFF):
+        """The contents of the image from *start* up to *end* (exclusive), as
+        a sequence of bytearrays of at most CHUNK_SIZE bytes, with gaps filled
+        with *padding*. By default, from the lowest to the highest address of
+        the image."""
+        if start is None:
+            start = self.minaddr() or 0
+        if end is None:
+            end = self.maxaddr() + 1 if self._starts else start
+        fill = bytearray(chr(padding) * min(CHUNK_SIZE, max(end - start, 0)))
+        address = start
+        for seg_start, data in self.segments():
+            seg_end = min(end, seg_start + len(data))
+            if seg_end <= address:
+                continue
+            if seg_start >= end:
+                break
+            while address < seg_start:
+                size = min(seg_start - address, CHUNK_SIZE)
+                yield fill if size == len(fill) else fill[:size]
+                address += size
+            while address < seg_end:
+                size = min(seg_end - address, CHUNK_SIZE)
+                yield data[address - seg_start:address - seg_start + size]
+                address += size
+        while address < end:
+            size = min(end - address, CHUNK_SIZE)
+            yield fill if size == len(fill) else fill[:size]
+            address += size
+
+    def tobinfile(self, fd, start=None, end=None, padding=0xFF):
+        """Write the image to the file object *fd* as a binary; see
+        iter_bin"""
+        for chunk in self.iter_bin(start, end, padding):
+            fd.write(chunk)
+
+    def write_hex_file(self, fd, write_start_addr=True, byte_count=16):
+        """Write the image to the file object *fd* in Intel HEX format, with
+        the same records that IntelHex writes"""
+        def record(rectype, address, data):
+            content = bytearray([len(data), address >> 8 & 0xFF,
+                                 address & 0xFF, rectype]) + data
+            content.append(-sum(content) & 0xFF)
+            return ":" + hexlify(content).upper() + "\n"
+
+        lines = []
+        if self.start_addr and write_start_addr:
+            keys = sorted(self.start_addr)
+            if keys == ['CS', 'IP']:
+                cs, ip = self.start_addr['CS'], self.start_addr['IP']
+                lines.append(record(3, 0, bytearray([
+                    cs >> 8 & 0xFF, cs & 0xFF, ip >> 8 & 0xFF, ip & 0xFF])))
+            elif keys == ['EIP']:
+                eip = self.start_addr['EIP']
+                lines.append(record(5, 0, bytearray([
+                    eip >> 24 & 0xFF, eip >> 16 & 0xFF, eip >> 8 & 0xFF,
+                    eip & 0xFF])))
+            else:
+                raise ToolException("Invalid start address %r"
+                                    % self.start_addr)
+
+        offset_records = self._starts and self.maxaddr() > 0xFFFF
+        high = None
+        for seg_start, data in self.segments():
+            address = seg_start
+            seg_end = seg_start + len(data)
+            while address < seg_end:
+                if offset_records and address >> 16 != high:
+                    high = address >> 16
+                    lines.append(record(4, 0, bytearray([high >> 8 & 0xFF,
+                                                         high & 0xFF])))
+                # Records do not cross 64KB boundaries
+                size = min(byte_count, seg_end - address,
+                           0x10000 - (address & 0xFFFF))
+                lines.append(record(0, address & 0xFFFF,
+                                    data[address - seg_start:
+                                         address - seg_start + size]))
+                address += size
+            if len(lines) > 4096:
+                fd.write("".join(lines))
+                lines = []
+        lines.append(":00000001FF\n")
+        fd.write("".join(lines))
+
+
+def load_image(filename, offset):
+    """Load a hex or bin file, a bin file at a particular offset, as a
+    MemoryImage"""
+    _, image_type = splitext(filename)
+    image = MemoryImage()
+    if image_type == ".bin":
+        image.load_bin(filename, offset=offset)
+    elif image_type == ".hex":
+        image.load_hex(filename)
+    else:
+        raise ToolException("File %s does not have a known binary file type"
+                            % filename)
+    return image
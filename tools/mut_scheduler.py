@@ -0,0 +1,255 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from time import time
+from Queue import Queue
+from threading import Thread, Lock, Event, BoundedSemaphore
+
+
+class MutJob(object):
+    """A job run on one MUT, and its outcome once it ran"""
+
+    def __init__(self, mut_id, function, callback=None):
+        self.mut_id = mut_id
+        self.function = function
+        self.callback = callback
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+    def wait(self, timeout=None):
+        """Wait for the job to run
+
+        Return value:
+        The value returned by the job. Any exception the job raised is raised
+        again here.
+        """
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class MutScheduler(object):
+    """Runs jobs, such as tests, on many MUTs at once
+
+    Every MUT has its own queue of jobs, which one worker thread serves. Jobs
+    of different MUTs run concurrently, while the jobs of one MUT run one at
+    a time, in order. The queues are bounded: submitting a job blocks while
+    the queue of its MUT is full, so that the producer of jobs (building the
+    tests) does not run far ahead of the MUTs.
+
+    MUTs may name the USB hub they are connected to with a 'hub' entry in
+    the MUTs file. At most hub_limit MUTs of the same hub run jobs at once.
+    """
+
+    def __init__(self, muts, queue_size=2, hub_limit=None):
+        """
+        Positional arguments:
+        muts - the MUTs, as in the MUTs file: a dict of MUT descriptions
+
+        Keyword arguments:
+        queue_size - the number of jobs waiting for a MUT before submit blocks
+        hub_limit - the number of MUTs of one hub used at once; no limit if
+                    None
+        """
+        self.muts = muts
+        self.queue_size = queue_size
+        self.hub_limit = hub_limit
+        self._queues = {}
+        self._workers = []
+        self._hubs = {}
+        self._jobs = []
+        self._lock = Lock()
+
+    def _hub_semaphore(self, mut):
+        hub = mut.get('hub')
+        if hub is None or not self.hub_limit:
+            return None
+        if hub not in self._hubs:
+            self._hubs[hub] = BoundedSemaphore(self.hub_limit)
+        return self._hubs[hub]
+
+    def _queue(self, mut_id):
+        """The job queue of a MUT, starting its worker on first use"""
+        with self._lock:
+            if mut_id not in self._queues:
+                queue = Queue(self.queue_size)
+                worker = Thread(target=self._work,
+                                args=(self.muts[mut_id],
+                                      self._hub_semaphore(self.muts[mut_id]),
+                                      queue))
+                worker.daemon = True
+                worker.start()
+                self._queues[mut_id] = queue
+                self._workers.append(worker)
+            return self._queues[mut_id]
+
+    @staticmethod
+    def _work(mut, hub, queue):
+        while True:
+            job = queue.get()
+            if job is None:
+                return
+            if hub:
+                hub.acquire()
+            try:
+                job.result = job.function(mut)
+            except Exception, e:
+                job.error = e
+            finally:
+                if hub:
+                    hub.release()
+            try:
+                if job.callback and job.error is None:
+                    job.callback(job.result)
+            except Exception, e:
+                job.error = e
+            finally:
+                job.done.set()
+
+    def submit(self, mut_id, function, callback=None):
+        """Queue a job for a MUT
+
+        Positional arguments:
+        mut_id - the key of the MUT in muts
+        function - the job, called with the MUT description
+
+        Keyword arguments:
+        callback - called, on the worker thread, with the value returned by
+                   the job
+
+        Return value:
+        The MutJob
+        """
+        job = MutJob(mut_id, function, callback)
+        with self._lock:
+            self._jobs.append(job)
+        self._queue(mut_id).put(job)
+        return job
+
+    def join(self):
+        """Wait for all jobs, and stop the workers
+
+        The first exception raised by a job or its callback, in the order the
+        jobs were submitted, is raised again here.
+        """
+        with self._lock:
+            queues = self._queues.values()
+            workers = list(self._workers)
+            self._queues = {}
+            self._workers = []
+            jobs, self._jobs = self._jobs, []
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+        for job in jobs:
+            job.wait()
+
+
+class MutDetector(object):
+    """Waits for MUTs to be (re)detected, e.g. after they were flashed
+
+    Rather than sleeping a fixed time between detections, the interval grows
+    from min_interval to max_interval. Threads waiting at the same time
+    share the detections, so the devices are not listed once per thread.
+    """
+
+    def __init__(self, detect, min_interval=0.25, max_interval=3.0,
+                 timeout=180):
+        """
+        Positional arguments:
+        detect - a function listing the connected MUTs, in the format of
+                 get_autodetected_MUTS
+
+        Keyword arguments:
+        min_interval - the first time to wait, in seconds, between detections
+        max_interval - the longest time to wait between detections
+        timeout - how long to wait for a MUT before giving up
+        """
+        self.detect = detect
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._lock = Lock()
+        self._stopped = Event()
+        self._muts = {}
+        self._detected_at = None
+
+    def detected(self):
+        """The connected MUTs, detected at most min_interval seconds ago"""
+        with self._lock:
+            if (self._detected_at is None or
+                    time() - self._detected_at >= self.min_interval):
+                self._muts = self.detect()
+                self._detected_at = time()
+            return self._muts
+
+    @staticmethod
+    def find(mut, muts):
+        """Find the MUT *mut* among the detected *muts*
+
+        A MUT is the board with the same target ID when both have one, or
+        else the board of the same target mounted on the same disk or port.
+        Without either, any board of the same target is taken, but only when
+        there is one, as several MUTs may be the same kind of board.
+
+        Return value:
+        The description of the MUT as detected, or None
+        """
+        same_mcu = [muts[key] for key in sorted(muts)
+                    if muts[key]['mcu'] == mut['mcu']]
+        target_id = mut.get('target_id')
+        if target_id:
+            for other in same_mcu:
+                if other.get('target_id') == target_id:
+                    return other
+            if any(other.get('target_id') for other in same_mcu):
+                return None
+        for key in ('disk', 'port'):
+            if mut.get(key):
+                for other in same_mcu:
+                    if other.get(key) == mut[key]:
+                        return other
+        if len(same_mcu) == 1:
+            return same_mcu[0]
+        return None
+
+    def wait_for(self, mut):
+        """Wait for the MUT *mut*, a MUT description, to be detected, see
+        find
+
+        Return value:
+        The description of the MUT as detected, or None when it did not
+        appear within the timeout or the detector was stopped
+        """
+        deadline = time() + self.timeout
+        interval = self.min_interval
+        while not self._stopped.is_set():
+            found = self.find(mut, self.detected())
+            if found is not None:
+                return found
+            remaining = deadline - time()
+            if remaining <= 0:
+                return None
+            self._stopped.wait(min(interval, remaining))
+            interval = min(interval * 2, self.max_interval)
+        return None
+
+    def stop(self):
+        """Wake up and fail all waits"""
+        self._stopped.set()
@@ -7,12 +7,14 @@ ROOT = abspath(join(dirname(__file__), ".."))
 sys.path.insert(0, ROOT)
 
 from shutil import move, rmtree
+from multiprocessing import cpu_count
 from argparse import ArgumentParser
 from os.path import normpath, realpath
 
 from tools.paths import EXPORT_DIR, MBED_HAL, MBED_LIBRARIES, MBED_TARGETS_PATH
 from tools.settings import BUILD_DIR
 from tools.export import EXPORTERS, mcu_ide_matrix, mcu_ide_list, export_project, get_exporter_toolchain
+from tools.export import export_projects, export_report_table
 from tools.tests import TESTS, TEST_MAP
 from tools.tests import test_known, test_name_known, Test
 from tools.targets import TARGET_NAMES
@@ -96,6 +98,38 @@ def export(target, ide, build=None, src=None, macros=None, project_id=None,
                           app_config=app_config)
 
 
+def export_batch(targets, ides, build=None, src=None, macros=None,
+                 project_id=None, build_profile=None, app_config=None, jobs=1,
+                 report=None):
+    """Export a project to every combination of targets and IDEs, scanning its
+    sources once per target and toolchain. Every project is zipped in
+    EXPORT_DIR.
+
+    Positional arguments:
+    targets - MCUs that the projects will compile for
+    ides - the IDEs or project structures to export to
+
+    Keyword arguments:
+    build, src, macros, project_id, build_profile, app_config - as in export
+    jobs - number of projects generated at once
+    report - the name of a JSON file to write the timing report to
+
+    Returns the timing report of tools.export.export_projects
+    """
+    _, _, src_paths, lib = setup_project(ides[0], targets[0],
+                                         program=project_id, source_dir=src,
+                                         build=build)
+    if project_id is None:
+        name = basename(normpath(realpath(src[0])))
+    else:
+        name = Test(project_id).id
+
+    return export_projects(src_paths, EXPORT_DIR, targets, ides, name=name,
+                           libraries_paths=lib, macros=macros,
+                           build_profile=build_profile, app_config=app_config,
+                           jobs=jobs, report=report)
+
+
 def main():
     """Entry point"""
     # Parse Options
@@ -114,9 +148,11 @@ def main():
 
     parser.add_argument("-i",
                         dest="ide",
-                        type=argparse_force_lowercase_type(
-                            toolchainlist, "toolchain"),
-                        help="The target IDE: %s"% str(toolchainlist))
+                        type=argparse_many(argparse_force_lowercase_type(
+                            toolchainlist, "toolchain")),
+                        help="The target IDE: %s. Several IDEs, or MCUs, "
+                        "separated by commas export every combination of "
+                        "them to %s" % (str(toolchainlist), EXPORT_DIR))
 
     parser.add_argument("-c", "--clean",
                         action="store_true",
@@ -187,6 +223,20 @@ def main():
                         dest="app_config",
                         default=None)
 
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        dest="jobs",
+                        default=1,
+                        help="Number of projects generated at once when "
+                        "exporting several. Use 0 for auto based on host "
+                        "machine's number of CPUs. Default: 1")
+
+    parser.add_argument("--report",
+                        dest="report",
+                        default=None,
+                        help="Write the timing report of exporting several "
+                        "projects to this JSON file")
+
     options = parser.parse_args()
 
     # Print available tests in order and exit
@@ -240,15 +290,36 @@ def main():
 
     if (options.program is None) and (not options.source_dir):
         args_error(parser, "one of -p, -n, or --source is required")
-    exporter, toolchain_name = get_exporter_toolchain(options.ide)
-    mcu = extract_mcus(parser, options)[0]
-    if not exporter.is_target_supported(mcu):
-        args_error(parser, "%s not supported by %s"%(mcu,options.ide))
-    profile = extract_profile(parser, options, toolchain_name, fallback="debug")
+    mcus = extract_mcus(parser, options)
     if options.clean:
         rmtree(BUILD_DIR)
+    if len(mcus) > 1 or len(options.ide) > 1:
+        # The profile must support the toolchain of every IDE
+        for ide in options.ide:
+            _, toolchain_name = get_exporter_toolchain(ide)
+            profile = extract_profile(parser, options, toolchain_name,
+                                      fallback="debug")
+        jobs = options.jobs or cpu_count()
+        report = export_batch(mcus, options.ide, build=options.build,
+                              src=options.source_dir, macros=options.macros,
+                              project_id=options.program,
+                              build_profile=profile,
+                              app_config=options.app_config, jobs=jobs,
+                              report=options.report)
+        print export_report_table(report)
+        for entry in report:
+            if entry["result"] == "FAIL":
+                print "[ERROR] %s %s: %s" % (entry["target"], entry["ide"],
+                                             entry["error"])
+        exit(1 if any(entry["result"] == "FAIL" for entry in report) else 0)
+
+    exporter, toolchain_name = get_exporter_toolchain(options.ide[0])
+    mcu = mcus[0]
+    if not exporter.is_target_supported(mcu):
+        args_error(parser, "%s not supported by %s"%(mcu,options.ide[0]))
+    profile = extract_profile(parser, options, toolchain_name, fallback="debug")
     try:
-        export(mcu, options.ide, build=options.build,
+        export(mcu, options.ide[0], build=options.build,
                src=options.source_dir, macros=options.macros,
                project_id=options.program, zip_proj=zip_proj,
                build_profile=profile, app_config=options.app_config)
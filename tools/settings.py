@@ -54,6 +54,21 @@ BUILD_OPTIONS = []
 # mbed.org username
 MBED_ORG_USER = ""
 
+# Directory of the compile cache, which shares compiled objects between
+# build directories. The cache is disabled when this is empty
+COMPILE_CACHE_DIR = ""
+
+# Size limit of the compile cache, in bytes
+COMPILE_CACHE_SIZE = 5 * 1024 * 1024 * 1024
+
+# Directory of the bytecode of the compiled templates of the exporters and
+# the config header, shared between processes. Disabled when this is empty.
+# See tools/templates.py
+TEMPLATE_CACHE_DIR = ""
+
+# Number of compiled templates kept in memory per template directory
+TEMPLATE_CACHE_SIZE = 400
+
 CLI_COLOR_MAP = {
     "warning": "yellow",
     "error"  : "red"
@@ -83,6 +98,12 @@ for _n in _ENV_PATHS:
         else:
             print "WARNING: MBED_%s set as environment variable but doesn't exist" % _n
 
+if getenv('MBED_COMPILE_CACHE_DIR'):
+    COMPILE_CACHE_DIR = getenv('MBED_COMPILE_CACHE_DIR')
+
+if getenv('MBED_TEMPLATE_CACHE_DIR'):
+    TEMPLATE_CACHE_DIR = getenv('MBED_TEMPLATE_CACHE_DIR')
+
 
 ##############################################################################
 # Test System Settings
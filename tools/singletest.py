@@ -66,6 +66,7 @@ from tools.build_api import mcu_toolchain_matrix
 from tools.test_api import SingleTestRunner
 from tools.test_api import singletest_in_cli_mode
 from tools.test_api import detect_database_verbose
+from tools.test_api import add_database_unique_keys
 from tools.test_api import get_json_data_from_file
 from tools.test_api import get_avail_tests_summary_table
 from tools.test_api import get_default_test_options_parser
@@ -113,6 +114,9 @@ if __name__ == '__main__':
         detect_database_verbose(opts.db_url)
         exit(0)
 
+    if opts.db_add_unique_keys:
+        exit(0 if add_database_unique_keys(opts.db_url) else 1)
+
     # Print summary / information about automation test status
     if opts.test_automation_report:
         print get_avail_tests_summary_table(platform_filter=opts.general_filter_regex)
@@ -248,6 +252,7 @@ if __name__ == '__main__':
                                    _opts_firmware_global_name=opts.firmware_global_name,
                                    _opts_only_build_tests=opts.only_build_tests,
                                    _opts_parallel_test_exec=opts.parallel_test_exec,
+                                   _opts_hub_limit=opts.hub_limit,
                                    _opts_suppress_summary=opts.suppress_summary,
                                    _opts_test_x_toolchain_summary=opts.test_x_toolchain_summary,
                                    _opts_copy_method=opts.copy_method,
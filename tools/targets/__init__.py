@@ -16,17 +16,21 @@ limitations under the License.
 """
 
 import os
+import re
 import binascii
 import struct
 import shutil
 import inspect
 import sys
+import json
+import marshal
 from copy import copy
+from hashlib import md5
 from inspect import getmro
-from collections import namedtuple, Mapping
+from collections import namedtuple, Mapping, OrderedDict
 from tools.targets.LPC import patch
 from tools.paths import TOOLS_BOOTLOADERS
-from tools.utils import json_file_to_dict
+from tools.utils import json_file_to_dict, dict_to_ascii
 
 __all__ = ["target", "TARGETS", "TARGET_MAP", "TARGET_NAMES", "CORE_LABELS",
            "HookError", "generate_py_target", "Target",
@@ -105,6 +109,109 @@ def target(name, json_data):
                   resolution_order=resolution_order,
                   resolution_order_names=resolution_order_names)
 
+# Version of the compiled targets database. Change it along with the way
+# attributes are resolved, so that databases compiled before are not used.
+COMPILED_TARGETS_VERSION = 3
+
+# Directory of the compiled targets databases of the user
+COMPILED_TARGETS_DIR = os.path.join(os.path.expanduser("~"), ".mbed", "targets")
+
+# Number of compiled targets databases kept, the most recently used first
+COMPILED_TARGETS_KEEP = 8
+
+# Databases named by earlier versions, after the targets JSON files only
+LEGACY_COMPILED_TARGETS = re.compile(r"^targets_[0-9a-f]{32}\.db$")
+
+
+def _compiled_targets_dir():
+    """COMPILED_TARGETS_DIR, created if needed, or None when it can not be
+    used: the databases are only read from a directory that only the user
+    may write to"""
+    directory = COMPILED_TARGETS_DIR
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        info = os.stat(directory)
+    except OSError:
+        return None
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or
+                                  info.st_mode & 0022):
+        return None
+    return directory
+
+
+def _remove_compiled_targets(directory, filename):
+    """Remove the databases in directory compiled for other contents of the
+    main targets JSON file of the database filename, the ones named by
+    earlier versions, and the least recently used ones beyond
+    COMPILED_TARGETS_KEEP"""
+    group = filename.rsplit("_", 1)[0] + "_"
+    kept = []
+    for other in os.listdir(directory):
+        path = os.path.join(directory, other)
+        if other == filename or not other.endswith(".db"):
+            continue
+        try:
+            if other.startswith(group) or LEGACY_COMPILED_TARGETS.match(other):
+                os.remove(path)
+            else:
+                kept.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    for _, path in sorted(kept, reverse=True)[COMPILED_TARGETS_KEEP - 1:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _load_json_data(text):
+    return dict_to_ascii(json.loads(text, object_pairs_hook=OrderedDict))
+
+
+class CompiledJsonData(Mapping):
+    """The JSON data of the targets in a resolution order, read from the
+    compiled targets database, together with the attributes of the target
+    resolved when the database was compiled
+
+    Both are decoded on first access, so that targets that are never
+    used cost nothing more than their name.
+    """
+
+    def __init__(self, names, attributes, data):
+        self._names = names
+        self._attributes = attributes
+        self._data = data
+
+    @property
+    def attributes(self):
+        """The (cumulative, defined_by, unresolved) attribute tables of the
+        target: the values of cumulative attributes, the names of the targets
+        defining the other attributes, and the attributes that could not be
+        resolved. Attributes in none of them are not defined by the target."""
+        if isinstance(self._attributes, str):
+            self._attributes = marshal.loads(self._attributes)
+        return self._attributes
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        value = self._data[name]
+        if isinstance(value, str):
+            value = self._data[name] = _load_json_data(value)
+        return value
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __deepcopy__(self, memo):
+        # Read only; Config copies its target
+        return self
+
+
 def generate_py_target(new_targets, name):
     """Add one or more new target(s) represented as a Python dictionary
     in 'new_targets'. It is an error to add a target with a name that
@@ -133,6 +240,10 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
     # Extra custom targets files
     __extra_target_json_files = []
 
+    # Warnings about the custom targets, printed again whenever the compiled
+    # targets database is loaded
+    __json_target_warnings = []
+
     @staticmethod
     @cached
     def get_json_target_data():
@@ -140,10 +251,13 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
         targets = json_file_to_dict(Target.__targets_json_location or
                                     Target.__targets_json_location_default)
 
+        Target.__json_target_warnings = []
         for extra_target in Target.__extra_target_json_files:
             for k, v in json_file_to_dict(extra_target).iteritems():
                 if k in targets:
-                    print 'WARNING: Custom target "%s" cannot replace existing target.' % k
+                    warning = 'WARNING: Custom target "%s" cannot replace existing target.' % k
+                    Target.__json_target_warnings.append(warning)
+                    print warning
                 else:
                     targets[k] = v
 
@@ -249,28 +363,158 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
                         starting_value.remove(name_def_map[element])
         return starting_value
 
-    def __getattr_helper(self, attrname):
-        """Compute the value of a given target attribute"""
+    def __getattr_resolved(self, attrname):
+        """Compute the value of a given target attribute, as written in JSON"""
         if attrname in CUMULATIVE_ATTRIBUTES:
             return self.__getattr_cumulative(attrname)
         else:
             tdata = self.json_data
-            starting_value = None
             for tgt in self.resolution_order:
                 data = tdata[tgt[0]]
                 if data.has_key(attrname):
-                    starting_value = data[attrname]
-                    break
-            else: # Attribute not found
-                raise AttributeError(
-                    "Attribute '%s' not found in target '%s'"
-                    % (attrname, self.name))
-            # 'progen' needs the full path to the template (the path in JSON is
-            # relative to tools/export)
-            if attrname == "progen":
-                return self.__add_paths_to_progen(starting_value)
-            else:
-                return starting_value
+                    return data[attrname]
+            # Attribute not found
+            raise AttributeError(
+                "Attribute '%s' not found in target '%s'"
+                % (attrname, self.name))
+
+    def __getattr_compiled(self, attrname):
+        """Read the value of a given target attribute from the compiled
+        targets database, or compute it when the database does not have it"""
+        cumulative, defined_by, unresolved = self.json_data.attributes
+        if attrname in cumulative:
+            return cumulative[attrname][:]
+        elif attrname in defined_by:
+            return self.json_data[defined_by[attrname]][attrname]
+        elif attrname in unresolved:
+            return self.__getattr_resolved(attrname)
+        raise AttributeError("Attribute '%s' not found in target '%s'"
+                             % (attrname, self.name))
+
+    def __getattr_helper(self, attrname):
+        """Compute the value of a given target attribute"""
+        if isinstance(self.json_data, CompiledJsonData):
+            value = self.__getattr_compiled(attrname)
+        else:
+            value = self.__getattr_resolved(attrname)
+        # 'progen' needs the full path to the template (the path in JSON is
+        # relative to tools/export)
+        if attrname == "progen":
+            return self.__add_paths_to_progen(value)
+        return value
+
+    @staticmethod
+    def compile_target_data(json_data):
+        """Resolve the attributes of every target in json_data, as the
+        targets database does
+
+        Positional arguments:
+        json_data - the data of all targets, as from get_json_target_data
+
+        Returns a list of (name, public, resolution order, attributes)
+        tuples, with attributes as CompiledJsonData.attributes
+        """
+        compiled = []
+        for name, data in json_data.items():
+            tgt = target(name, json_data)
+            cumulative, defined_by, unresolved = {}, {}, []
+            for attrname in CUMULATIVE_ATTRIBUTES:
+                try:
+                    cumulative[attrname] = tgt.__getattr_resolved(attrname)
+                except AttributeError:
+                    pass
+                except ValueError:
+                    # Raised again, when the attribute is used
+                    unresolved.append(attrname)
+            for parent in reversed(tgt.resolution_order_names):
+                for attrname in json_data[parent]:
+                    if attrname not in CUMULATIVE_ATTRIBUTES:
+                        defined_by[attrname] = parent
+            compiled.append((name, data.get("public", True),
+                             tgt.resolution_order,
+                             (cumulative, defined_by, unresolved)))
+        return compiled
+
+    @staticmethod
+    def __compiled_targets_name():
+        """The file name of the compiled targets database: a hash of the
+        location of the main targets JSON file, shared by all of its
+        databases, and a hash of the contents of every targets JSON file"""
+        main_file = (Target.__targets_json_location or
+                     Target.__targets_json_location_default)
+        key = md5("%d %s" % (COMPILED_TARGETS_VERSION, sys.version))
+        for filename in [main_file] + Target.__extra_target_json_files:
+            key.update(filename)
+            try:
+                with open(filename, "rb") as json_file:
+                    key.update(json_file.read())
+            except IOError:
+                # Reported when the file is parsed
+                return None
+        return "targets_%s_%s.db" % (
+            md5(os.path.abspath(main_file)).hexdigest()[:12], key.hexdigest())
+
+    @staticmethod
+    @cached
+    def get_compiled_targets():
+        """Load the compiled targets database, compiling it first when any
+        targets JSON file changed
+
+        The database is kept in COMPILED_TARGETS_DIR, named after a hash of
+        the targets JSON files. It only holds plain data, with marshal: the
+        resolved attributes and the JSON data of every target are encoded
+        separately, and only decoded when used. Databases that can not be
+        read are compiled again. Compiling a database removes the ones
+        compiled before for the same main targets JSON file, and all but the
+        COMPILED_TARGETS_KEEP most recently used.
+        """
+        db_name = Target.__compiled_targets_name()
+        directory = _compiled_targets_dir() if db_name else None
+        filename = os.path.join(directory, db_name) if directory else None
+        try:
+            with open(filename, "rb") as db_file:
+                database = marshal.load(db_file)
+            if not all(name in database for name
+                       in ("targets", "index", "data", "warnings")):
+                raise ValueError("Incomplete database %s" % filename)
+            for warning in database["warnings"]:
+                print warning
+            try:
+                # Marks the database as used
+                os.utime(filename, None)
+            except OSError:
+                pass
+            return database
+        except (IOError, TypeError, EOFError, ValueError, KeyError,
+                ImportError, AttributeError):
+            pass
+        json_data = Target.get_json_target_data()
+        compiled = Target.compile_target_data(json_data)
+        database = {
+            "targets": [(name, public, resolution_order,
+                         marshal.dumps(attributes))
+                        for name, public, resolution_order, attributes
+                        in compiled],
+            "index": dict((name, number) for number, (name, _, _, _)
+                          in enumerate(compiled)),
+            "data": dict((name, json.dumps(data))
+                         for name, data in json_data.items()),
+            "warnings": Target.__json_target_warnings,
+        }
+        if filename:
+            try:
+                tmp_file = "%s.%d.tmp" % (filename, os.getpid())
+                with os.fdopen(os.open(tmp_file, os.O_WRONLY | os.O_CREAT |
+                                       os.O_TRUNC | getattr(os, "O_BINARY", 0),
+                                       0600), "wb") as db_file:
+                    marshal.dump(database, db_file)
+                if os.path.exists(filename):
+                    os.remove(filename)
+                os.rename(tmp_file, filename)
+                _remove_compiled_targets(directory, db_name)
+            except (IOError, OSError, ValueError):
+                pass
+        return database
 
     def __getattr__(self, attrname):
         """ Return the value of an attribute. This function only computes the
@@ -285,7 +529,15 @@ class Target(namedtuple("Target", "name json_data resolution_order resolution_or
     @cached
     def get_target(target_name):
         """ Return the target instance starting from the target name """
-        return target(target_name, Target.get_json_target_data())
+        database = Target.get_compiled_targets()
+        _, _, resolution_order, attributes = \
+            database["targets"][database["index"][target_name]]
+        resolution_order_names = [tgt for tgt, _ in resolution_order]
+        return Target(name=target_name,
+                      json_data=CompiledJsonData(set(resolution_order_names),
+                                                 attributes, database["data"]),
+                      resolution_order=resolution_order,
+                      resolution_order_names=resolution_order_names)
 
 
     @property
@@ -385,24 +637,15 @@ class LPC4088Code(object):
             # Regular binary file, nothing to do
             LPCTargetCode.lpc_patch(t_self, resources, elf, binf)
             return
-        outbin = open(binf + ".temp", "wb")
-        partf = open(os.path.join(binf, "ER_IROM1"), "rb")
-        # Pad the fist part (internal flash) with 0xFF to 512k
-        data = partf.read()
-        outbin.write(data)
-        outbin.write('\xFF' * (512*1024 - len(data)))
-        partf.close()
-        # Read and append the second part (external flash) in chunks of fixed
-        # size
-        chunksize = 128 * 1024
-        partf = open(os.path.join(binf, "ER_IROM2"), "rb")
-        while True:
-            data = partf.read(chunksize)
-            outbin.write(data)
-            if len(data) < chunksize:
-                break
-        partf.close()
-        outbin.close()
+        from tools.memory_image import MemoryImage
+        image = MemoryImage()
+        # The first part (internal flash) is padded with 0xFF to 512k, and
+        # followed by the second part (external flash)
+        image.load_bin(os.path.join(binf, "ER_IROM1"), 0)
+        image.load_bin(os.path.join(binf, "ER_IROM2"), 512*1024)
+        with open(binf + ".temp", "wb") as outbin:
+            image.tobinfile(outbin, start=0,
+                            end=max(512*1024, image.maxaddr() + 1))
         # Remove the directory with the binary parts and rename the temporary
         # file to 'binf'
         shutil.rmtree(binf, True)
@@ -429,22 +672,19 @@ class MTSCode(object):
         if not os.path.exists(loader):
             print "Can't find bootloader binary: " + loader
             return
-        outbin = open(target, 'w+b')
-        part = open(loader, 'rb')
-        data = part.read()
-        outbin.write(data)
-        outbin.write('\xFF' * (64*1024 - len(data)))
-        part.close()
-        part = open(binf, 'rb')
-        data = part.read()
-        outbin.write(data)
-        part.close()
-        outbin.seek(0, 0)
-        data = outbin.read()
-        outbin.seek(0, 1)
-        crc = struct.pack('<I', binascii.crc32(data) & 0xFFFFFFFF)
-        outbin.write(crc)
-        outbin.close()
+        from tools.memory_image import MemoryImage
+        # The bootloader, padded with 0xFF to 64k, the application and the
+        # CRC of both
+        image = MemoryImage()
+        image.load_bin(loader, 0)
+        image.load_bin(binf, 64*1024)
+        crc = 0
+        with open(target, 'wb') as outbin:
+            for chunk in image.iter_bin(start=0,
+                                        end=max(64*1024, image.maxaddr() + 1)):
+                outbin.write(chunk)
+                crc = binascii.crc32(chunk, crc)
+            outbin.write(struct.pack('<I', crc & 0xFFFFFFFF))
         os.remove(binf)
         os.rename(target, binf)
 
@@ -499,23 +739,25 @@ class MCU_NRF51Code(object):
                     break
 
         # Merge user code with softdevice
-        from intelhex import IntelHex
-        binh = IntelHex()
+        from tools.memory_image import MemoryImage
+        binh = MemoryImage()
         _, ext = os.path.splitext(binf)
         if ext == ".hex":
-            binh.loadhex(binf)
+            binh.load_hex(binf)
         elif ext == ".bin":
-            binh.loadbin(binf, softdevice_and_offset_entry['offset'])
+            binh.load_bin(binf, softdevice_and_offset_entry['offset'])
 
         if t_self.target.MERGE_SOFT_DEVICE is True:
             t_self.debug("Merge SoftDevice file %s"
                          % softdevice_and_offset_entry['name'])
-            sdh = IntelHex(sdf)
+            sdh = MemoryImage()
+            sdh.load_hex(sdf)
             binh.merge(sdh)
 
         if t_self.target.MERGE_BOOTLOADER is True and blf is not None:
             t_self.debug("Merge BootLoader file %s" % blf)
-            blh = IntelHex(blf)
+            blh = MemoryImage()
+            blh.load_hex(blf)
             binh.merge(blh)
 
         with open(binf.replace(".bin", ".hex"), "w") as fileout:
@@ -538,9 +780,8 @@ class RTL8195ACode:
 
 # Instantiate all public targets
 def update_target_data():
-    TARGETS[:] = [Target.get_target(tgt) for tgt, obj
-                  in Target.get_json_target_data().items()
-                  if obj.get("public", True)]
+    TARGETS[:] = [Target.get_target(tgt) for tgt, public, _, _
+                  in Target.get_compiled_targets()["targets"] if public]
     # Map each target name to its unique instance
     TARGET_MAP.clear()
     TARGET_MAP.update(dict([(tgt.name, tgt) for tgt in TARGETS]))
@@ -0,0 +1,162 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Compile the templates of the exporters and of the config header ahead of time
+
+The compiled templates are written to the bytecode cache, TEMPLATE_CACHE_DIR
+by default, so that the next processes only load them.
+"""
+import sys
+from os import makedirs, getpid, rename, remove
+from os.path import join, abspath, dirname, isdir, exists
+from hashlib import md5
+from threading import Lock
+from argparse import ArgumentParser
+
+if __name__ == '__main__':
+    sys.path.insert(0, abspath(join(dirname(__file__), "..")))
+
+import tools.settings
+
+# The shared environments, by search path and options
+_environments = {}
+_environments_lock = Lock()
+
+
+def _bytecode_cache(directory, key):
+    """A jinja2 bytecode cache in *directory*, for the environment with the
+    options hashed in *key*
+
+    The bytecode of a template depends on options such as trim_blocks, which
+    jinja2 does not include in its cache keys, so every set of options has
+    its own files. Files are replaced atomically, and files that can not be
+    read are compiled again, so that processes may share the directory.
+    """
+    from jinja2 import FileSystemBytecodeCache
+
+    class BytecodeCache(FileSystemBytecodeCache):
+        def load_bytecode(self, bucket):
+            try:
+                FileSystemBytecodeCache.load_bytecode(self, bucket)
+            except (EOFError, ValueError, TypeError):
+                bucket.reset()
+
+        def dump_bytecode(self, bucket):
+            filename = self._get_cache_filename(bucket)
+            tmp_file = "%s.%d.tmp" % (filename, getpid())
+            try:
+                with open(tmp_file, "wb") as fd:
+                    bucket.write_bytecode(fd)
+                if exists(filename):
+                    remove(filename)
+                rename(tmp_file, filename)
+            except (IOError, OSError):
+                # The cache is an optimization only
+                pass
+
+    if not isdir(directory):
+        try:
+            makedirs(directory)
+        except OSError:
+            if not isdir(directory):
+                raise
+    return BytecodeCache(directory, "__jinja2_%%s_%s.cache" % key)
+
+
+def get_environment(search_path, **options):
+    """Get the jinja2 environment of the templates in *search_path*, shared by
+    the whole process
+
+    Templates are compiled once, and kept compiled until they change on disk.
+    Every environment keeps at most TEMPLATE_CACHE_SIZE compiled templates,
+    and, when TEMPLATE_CACHE_DIR is set, their bytecode in that directory.
+
+    Positional arguments:
+    search_path - the directory containing the templates
+
+    Keyword arguments:
+    Options of jinja2.Environment. "undefined" defaults to StrictUndefined
+    """
+    from jinja2 import FileSystemLoader, StrictUndefined
+    from jinja2.environment import Environment
+    options.setdefault("undefined", StrictUndefined)
+    options = dict((name, tuple(value) if isinstance(value, list) else value)
+                   for name, value in options.iteritems())
+    search_path = abspath(search_path)
+    key = (search_path, tuple(sorted(options.iteritems())))
+    with _environments_lock:
+        if key not in _environments:
+            cache_dir = tools.settings.TEMPLATE_CACHE_DIR
+            if cache_dir:
+                options["bytecode_cache"] = _bytecode_cache(
+                    cache_dir, md5(repr(key[1])).hexdigest()[:12])
+            _environments[key] = Environment(
+                loader=FileSystemLoader(search_path),
+                cache_size=tools.settings.TEMPLATE_CACHE_SIZE, **options)
+        return _environments[key]
+
+
+def get_template(search_path, name, **options):
+    """Get the compiled template *name* of *search_path*, see get_environment
+
+    Raises jinja2.exceptions.TemplateNotFound when there is no such template
+    """
+    return get_environment(search_path, **options).get_template(name)
+
+
+def render(search_path, name, context, **options):
+    """Render the template *name* of *search_path* with the dict *context*,
+    see get_environment"""
+    return get_template(search_path, name, **options).render(context)
+
+
+def precompile(search_path, extensions=("tmpl",), **options):
+    """Compile all templates of *search_path*, so that they are in the
+    shared environment and in the bytecode cache
+
+    Return value:
+    The names of the templates
+    """
+    environment = get_environment(search_path, **options)
+    names = environment.list_templates(extensions=extensions)
+    for name in names:
+        environment.get_template(name)
+    return names
+
+
+def precompile_all():
+    """Compile the templates of every exporter and of the config header
+
+    Return value:
+    The number of templates compiled
+    """
+    import tools.export
+    import tools.config
+    return (len(precompile(dirname(abspath(tools.export.exporters.__file__)))) +
+            len(precompile(dirname(abspath(tools.config.__file__)))))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__.split("\n\n")[-2])
+    parser.add_argument("--cache-dir", default=None,
+                        help="The bytecode cache. Default: TEMPLATE_CACHE_DIR")
+    options = parser.parse_args()
+    if options.cache_dir:
+        tools.settings.TEMPLATE_CACHE_DIR = options.cache_dir
+    if not tools.settings.TEMPLATE_CACHE_DIR:
+        parser.error("TEMPLATE_CACHE_DIR is not set; give --cache-dir")
+    print "Compiled %d templates into %s" % (precompile_all(),
+                                             tools.settings.TEMPLATE_CACHE_DIR)
@@ -30,7 +30,7 @@ from tools.config import ConfigException
 from tools.test_api import test_path_to_name, find_tests, get_test_config, print_tests, build_tests, test_spec_from_test_builds
 import tools.test_configs as TestConfig
 from tools.options import get_default_options_parser, extract_profile, extract_mcus
-from tools.build_api import build_project, build_library
+from tools.build_api import build_project
 from tools.build_api import print_build_memory_usage
 from tools.build_api import merge_build_data
 from tools.targets import TARGET_MAP
@@ -81,6 +81,9 @@ if __name__ == '__main__':
         parser.add_argument("--continue-on-build-fail", action="store_true", dest="continue_on_build_fail",
                           default=None, help="Continue trying to build all tests if a build failure occurs")
 
+        parser.add_argument("--no-shared-objects", action="store_false", dest="shared_objects",
+                          default=True, help="Build every test from all of its sources, instead of linking the tests against the sources built once")
+
         #TODO validate the names instead of just passing through str
         parser.add_argument("-n", "--names", dest="names", type=argparse_many(str),
                           default=None, help="Limit the tests to a comma separated list of names")
@@ -197,64 +200,39 @@ if __name__ == '__main__':
             build_report = {}
             build_properties = {}
 
-            library_build_success = False
             profile = extract_profile(parser, options, toolchain)
-            try:
-                # Build sources
-                build_library(base_source_paths, options.build_dir, mcu,
-                              toolchain, jobs=options.jobs,
-                              clean=options.clean, report=build_report,
-                              properties=build_properties, name="mbed-build",
-                              macros=options.macros, verbose=options.verbose,
-                              notify=notify, archive=False,
-                              app_config=config,
-                              build_profile=profile)
-
-                library_build_success = True
-            except ToolException, e:
-                # ToolException output is handled by the build log
-                pass
-            except NotSupportedException, e:
-                # NotSupportedException is handled by the build log
-                pass
-            except Exception, e:
-                # Some other exception occurred, print the error message
-                print e
-
-            if not library_build_success:
-                print "Failed to build library"
-            else:
-                # Build all the tests
-
-                test_build_success, test_build = build_tests(tests, [options.build_dir], options.build_dir, mcu, toolchain,
-                        clean=options.clean,
-                        report=build_report,
-                        properties=build_properties,
-                        macros=options.macros,
-                        verbose=options.verbose,
-                        notify=notify,
-                        jobs=options.jobs,
-                        continue_on_build_fail=options.continue_on_build_fail,
-                        app_config=config,
-                        build_profile=profile,
-                        stats_depth=options.stats_depth)
-
-                # If a path to a test spec is provided, write it to a file
-                if options.test_spec:
-                    test_spec_data = test_spec_from_test_builds(test_build)
-
-                    # Create the target dir for the test spec if necessary
-                    # mkdir will not create the dir if it already exists
-                    test_spec_dir = os.path.dirname(options.test_spec)
-                    if test_spec_dir:
-                        mkdir(test_spec_dir)
-
-                    try:
-                        with open(options.test_spec, 'w') as f:
-                            f.write(json.dumps(test_spec_data, indent=2))
-                    except IOError, e:
-                        print "[ERROR] Error writing test spec to file"
-                        print e
+
+            # Build all the tests
+            test_build_success, test_build = build_tests(tests, base_source_paths, options.build_dir, mcu, toolchain,
+                    clean=options.clean,
+                    report=build_report,
+                    properties=build_properties,
+                    macros=options.macros,
+                    verbose=options.verbose,
+                    notify=notify,
+                    jobs=options.jobs,
+                    continue_on_build_fail=options.continue_on_build_fail,
+                    app_config=config,
+                    build_profile=profile,
+                    stats_depth=options.stats_depth,
+                    shared_objects=options.shared_objects)
+
+            # If a path to a test spec is provided, write it to a file
+            if options.test_spec:
+                test_spec_data = test_spec_from_test_builds(test_build)
+
+                # Create the target dir for the test spec if necessary
+                # mkdir will not create the dir if it already exists
+                test_spec_dir = os.path.dirname(options.test_spec)
+                if test_spec_dir:
+                    mkdir(test_spec_dir)
+
+                try:
+                    with open(options.test_spec, 'w') as f:
+                        f.write(json.dumps(test_spec_data, indent=2))
+                except IOError, e:
+                    print "[ERROR] Error writing test spec to file"
+                    print e
 
             # If a path to a JUnit build report spec is provided, write it to a file
             if options.build_report_junit:
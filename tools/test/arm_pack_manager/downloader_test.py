@@ -0,0 +1,179 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from hashlib import md5
+from threading import Thread
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+import pytest
+from mock import patch
+from tools.arm_pack_manager import Cache
+from tools.arm_pack_manager.downloader import Downloader
+
+"""
+Tests for the downloads of arm_pack_manager, against a local HTTP server
+"""
+
+class PackServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves the files in its dict `files`, with ETags and range requests.
+    The paths in `truncate` are sent only partially, once.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), PackRequestHandler)
+        self.files = {}
+        self.truncate = set()
+        self.requests = []
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+
+class PackRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+        content = server.files[self.path]
+        etag = '"%s"' % md5(content).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") == etag:
+            start = int(byte_range[len("bytes="):-1])
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d"
+                             % (start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        if self.path in server.truncate:
+            server.truncate.remove(self.path)
+            self.wfile.write(content[start:start + len(content) // 2])
+            return
+        self.wfile.write(content[start:])
+
+
+@pytest.fixture
+def server():
+    server = PackServer()
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_conditional_download(server, tmpdir):
+    """
+    Test that files are only downloaded again when they changed
+    """
+    server.files["/Vendor.Pack.pdsc"] = "<package>1</package>"
+    downloader = Downloader(str(tmpdir))
+    url = server.url + "/Vendor.Pack.pdsc"
+    dest = downloader.destination(url)
+    assert downloader.fetch(url) == Downloader.DOWNLOADED
+    assert open(dest).read() == "<package>1</package>"
+
+    assert downloader.fetch(url) == Downloader.UNCHANGED
+    assert "if-none-match" in server.requests[-1][1]
+
+    server.files["/Vendor.Pack.pdsc"] = "<package>2</package>"
+    assert downloader.fetch(url) == Downloader.DOWNLOADED
+    assert open(dest).read() == "<package>2</package>"
+    assert not os.path.exists(dest + ".part")
+
+
+def test_resume_download(server, tmpdir):
+    """
+    Test that an interrupted download is not used, and resumed next time
+    """
+    content = os.urandom(300000)
+    server.files["/Vendor.Big.1.0.0.pack"] = content
+    server.truncate.add("/Vendor.Big.1.0.0.pack")
+    downloader = Downloader(str(tmpdir))
+    url = server.url + "/Vendor.Big.1.0.0.pack"
+    dest = downloader.destination(url)
+    assert downloader.fetch(url) == Downloader.FAILED
+    assert not os.path.exists(dest)
+    assert os.path.getsize(dest + ".part") == len(content) // 2
+
+    assert downloader.fetch(url) == Downloader.RESUMED
+    assert open(dest, "rb").read() == content
+    assert not os.path.exists(dest + ".part")
+
+    assert downloader.fetch(url) == Downloader.UNCHANGED
+    assert downloader.fetch(server.url + "/missing.pack") == Downloader.FAILED
+
+
+PDSC = """<?xml version="1.0" encoding="UTF-8"?>
+<package>
+  <vendor>Vendor</vendor>
+  <name>Pack%d</name>
+  <url>%s/packs/</url>
+  <releases>
+    <release version="1.0.0">First</release>
+    <release version="1.2.0">Second</release>
+  </releases>
+</package>
+"""
+
+
+def test_cache_pack_list(server, tmpdir):
+    """
+    Test that the Cache downloads a fake pack index, and skips all of it on
+    a refresh
+    """
+    pdscs = []
+    for index in range(8):
+        server.files["/pdsc/Vendor.Pack%d.pdsc" % index] = PDSC % (index,
+                                                                  server.url)
+        server.files["/packs/Vendor.Pack%d.1.2.0.pack" % index] = \
+            "pack %d" % index
+        pdscs.append('<pdsc url="%s/pdsc/" name="Vendor.Pack%d.pdsc"/>'
+                     % (server.url, index))
+    server.files["/index.idx"] = "<index>%s</index>" % "".join(pdscs)
+
+    with patch("tools.arm_pack_manager.RootPackURL", server.url + "/index.idx"):
+        cache = Cache(True, False, jobs=4)
+        cache.data_path = str(tmpdir)
+        cache.cache_pack_list(cache.get_urls())
+        assert cache.downloader.stats[Downloader.DOWNLOADED] == 17
+        pack = cache.downloader.destination(
+            server.url + "/packs/Vendor.Pack3.1.2.0.pack")
+        assert open(pack).read() == "pack 3"
+
+        refresh = Cache(True, False, jobs=4)
+        refresh.data_path = str(tmpdir)
+        refresh.cache_pack_list(refresh.get_urls())
+        assert refresh.downloader.stats[Downloader.UNCHANGED] == 16
+        assert refresh.downloader.stats[Downloader.DOWNLOADED] == 0
@@ -0,0 +1,95 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import json
+from itertools import takewhile
+import pytest
+from fuzzywuzzy import process
+from tools.arm_pack_manager import Cache, LocalPackIndex
+from tools.arm_pack_manager.lookup import DeviceLookup, device_lookup
+
+"""
+Tests for the device lookup of arm_pack_manager
+"""
+
+INDEX = {
+    "version": "0.1.0",
+    "LPC1768": {"debug": "SVD/LPC176x5x.svd"},
+    "LPC1769": {"debug": "SVD/LPC176x5x.svd"},
+    "STM32F407VG": {"core": "Cortex-M4"},
+    "STM32F407VE": {"core": "Cortex-M4"},
+    "nRF51822_xxAA": {"core": "Cortex-M0"},
+    u"ATSAMD21G18A": {"memory": {"IROM1": {"start": "0x0", "size": "0x40000"}}},
+}
+
+
+def find_device_by_scan(index, match):
+    """
+    Cache.find_device, as implemented with a scan of the whole index
+    """
+    choices = process.extract(match, index.keys(), limit=len(index))
+    choices = sorted([(v, k) for k, v in choices], reverse=True)
+    if choices:
+        choices = list(takewhile(lambda t: t[0] == choices[0][0], choices))
+    return [v for k, v in choices]
+
+
+def test_exact_and_normalized():
+    """
+    Test that devices are found by name, and by normalized name
+    """
+    lookup = DeviceLookup(str(DeviceLookup.build(INDEX)))
+    assert len(lookup) == 6
+    assert lookup.get("LPC1768") == INDEX["LPC1768"]
+    assert lookup["ATSAMD21G18A"] == INDEX["ATSAMD21G18A"]
+    assert "version" not in lookup
+    assert lookup.get("lpc1768") is None
+    with pytest.raises(KeyError):
+        lookup["STM32F407"]
+    assert lookup.find("LPC1768") == [("LPC1768", INDEX["LPC1768"])]
+    assert lookup.find("stm32f407-vg") == [("STM32F407VG", INDEX["STM32F407VG"])]
+    assert [name for name, _ in lookup.find("nrf51822")] == ["nRF51822_xxAA"]
+    assert lookup.candidates("STM32F407", 2) == ["STM32F407VE", "STM32F407VG"]
+
+
+@pytest.mark.parametrize("query", ["stm32f407", "K64F", "ATSAMD21G18"])
+def test_same_as_scan(query):
+    """
+    Test that fuzzy searches of the pack index find what a scan finds
+    """
+    with open(LocalPackIndex) as fd:
+        index = json.load(fd)
+    assert ([name for name, _ in Cache(True, True).find_device(query)] ==
+            find_device_by_scan(index, query))
+
+
+def test_rebuilt_when_index_changes(tmpdir):
+    """
+    Test that the lookup file is built next to the index, and built again
+    when the index changes
+    """
+    index_file = tmpdir.join("index.json")
+    index_file.write(json.dumps(INDEX))
+    assert device_lookup(str(index_file)).get("LPC1769") == INDEX["LPC1769"]
+    assert tmpdir.join("index.lookup").check()
+    assert device_lookup(str(index_file)) is device_lookup(str(index_file))
+
+    index = dict(INDEX, LPC1769={"debug": "changed"})
+    index_file.write(json.dumps(index))
+    os.utime(str(index_file), (0, 12345))
+    assert device_lookup(str(index_file)).get("LPC1769") == {"debug": "changed"}
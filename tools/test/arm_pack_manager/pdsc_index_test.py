@@ -0,0 +1,138 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from bs4 import BeautifulSoup
+from mock import patch
+from tools.arm_pack_manager import Cache
+from tools.arm_pack_manager.pdsc import parse_pdsc, parse_xml
+
+"""
+Tests for the PDSC parser and the incremental index of arm_pack_manager
+"""
+
+PDSC = """<?xml version="1.0" encoding="UTF-8"?>
+<package schemaVersion="1.3">
+  <vendor>Vendor</vendor>
+  <name>Pack%(index)d</name>
+  <url>http://www.example.com/pack</url>
+  <releases>
+    <release version="2.10.0">x</release>
+    <release version="2.9.1">y</release>
+  </releases>
+  <boards>
+    <board vendor="Vendor" name="Board%(index)d">
+      <mountedDevice deviceIndex="0" Dvendor="NXP:11" Dname="DEV%(index)d_A"/>
+    </board>
+    <board vendor="Vendor" name="Unmounted">
+      <description>no mounted device</description>
+    </board>
+  </boards>
+  <devices>
+    <family Dfamily="Family" Dvendor="NXP:11">
+      <processor Dcore="Cortex-M3" Dfpu="0" Dendian="Little-endian"/>
+      <debug svd="SVD/Family.svd"/>
+      <compile header="Device/Include/Family.h"/>
+      <subFamily DsubFamily="Sub">
+        <processor Dclock="100000000"/>
+        <compile define="SUB"/>
+        <device Dname="DEV%(index)d_A">
+          <memory id="IROM1" start="0x00000000" size="0x80000" default="1"/>
+          <memory id="IRAM1" start="0x10000000" size="0x8000" default="1"/>
+          <algorithm name="Flash\\IAP.FLM" start="0x0" size="0x80000" RAMstart="0x10000000" RAMsize="0x0FE0"/>
+        </device>
+        <device Dname="DEV%(index)d_B">
+          <processor Dclock="120000000"/>
+          <memory name="Flash" start="0x00000000" size="0x80000"/>
+          <debug svd="SVD/B.svd"/>
+        </device>
+      </subFamily>
+    </family>
+  </devices>
+</package>
+"""
+
+
+def write_pdsc(tmpdir, index, extra=""):
+    pdsc = tmpdir.join("www.example.com", "pdsc", "Vendor.Pack%d.pdsc" % index)
+    pdsc.write(PDSC % dict(index=index) + extra, ensure=True)
+    return "http://www.example.com/pdsc/Vendor.Pack%d.pdsc" % index
+
+
+def test_same_index_as_beautifulsoup(tmpdir):
+    """
+    Test that the XML parser indexes a PDSC file as BeautifulSoup does
+    """
+    url = write_pdsc(tmpdir, 0)
+    filename = str(tmpdir.join("www.example.com", "pdsc", "Vendor.Pack0.pdsc"))
+    cache = Cache(True, False)
+    cache.data_path = str(tmpdir)
+    with open(filename) as fd:
+        soup = BeautifulSoup(fd, "html.parser")
+    document = parse_xml(filename)
+    assert cache._pack_url(document) == cache._pack_url(soup)
+    assert ([d["dname"] for d in document("device")] ==
+            [d["dname"] for d in soup("device")])
+    for expected, device in zip(soup("device"), document("device")):
+        assert (cache._extract_dict(device, url, "pack") ==
+                cache._extract_dict(expected, url, "pack"))
+    assert document.package.releases.release["version"] == "2.10.0"
+    assert document.board.mounteddevice["dname"] == "DEV0_A"
+
+
+def test_not_well_formed(tmpdir):
+    """
+    Test that PDSC files that are not XML are parsed with BeautifulSoup
+    """
+    pdsc = tmpdir.join("broken.pdsc")
+    pdsc.write("<package><url>http://example.com/</url><device Dname=X></package>")
+    assert parse_xml(str(pdsc)) is None
+    assert parse_pdsc(str(pdsc)).device["dname"] == "X"
+
+
+def test_incremental_index(tmpdir):
+    """
+    Test that only the PDSC files that changed are indexed again
+    """
+    urls = [write_pdsc(tmpdir, index) for index in range(4)]
+    with patch("tools.arm_pack_manager.LocalPackIndex",
+               str(tmpdir.join("index.json"))), \
+         patch("tools.arm_pack_manager.LocalPackAliases",
+               str(tmpdir.join("aliases.json"))):
+        cache = Cache(True, False, jobs=1)
+        cache.data_path = str(tmpdir)
+        cache.urls = urls
+        cache.generate_index()
+        cache.generate_aliases()
+        assert sorted(cache._index) == sorted(
+            ["version"] + ["DEV%d_%s" % (i, s) for i in range(4) for s in "AB"])
+        assert cache._aliases == dict(("Board%d" % i, "DEV%d_A" % i)
+                                      for i in range(4))
+
+        write_pdsc(tmpdir, 2, "<!-- changed -->")
+        os.remove(str(tmpdir.join("www.example.com", "pdsc", "Vendor.Pack3.pdsc")))
+        refresh = Cache(True, False, jobs=1)
+        refresh.data_path = str(tmpdir)
+        refresh.urls = urls[:3]
+        with patch.object(Cache, "_index_pdsc", autospec=True,
+                          side_effect=Cache._index_pdsc) as index_pdsc:
+            refresh.generate_index()
+            refresh.generate_aliases()
+        assert [call[0][1] for call in index_pdsc.call_args_list] == [urls[2]]
+        assert sorted(refresh._index) == sorted(
+            ["version"] + ["DEV%d_%s" % (i, s) for i in range(3) for s in "AB"])
+        assert refresh.index["DEV2_B"]["processor"]["clock"] == "120000000"
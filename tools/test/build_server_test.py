@@ -0,0 +1,155 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import socket
+from os.path import join, abspath, dirname
+from subprocess import Popen, PIPE
+from StringIO import StringIO
+import pytest
+import tools.build_server
+from tools.build_server import start_server, request, run_script, call
+from tools.build_server import BuildServerError, TreeWatcher, default_socket
+from tools.build_server import _build_environment, _connect
+
+"""
+Tests for the build server, run in the background as it is by the client
+"""
+
+TOOLS = abspath(join(dirname(__file__), ".."))
+
+
+@pytest.fixture
+def server(tmpdir):
+    socket_path = str(tmpdir.join("build.sock"))
+    start_server(socket_path)
+    yield socket_path
+    try:
+        request({"command": "stop"}, socket_path, start=False)
+    except BuildServerError:
+        pass
+
+
+def run_served(server, argv):
+    stdout, stderr = StringIO(), StringIO()
+    reply = request({"command": "run", "script": "make", "argv": argv},
+                    server, stdout=stdout, stderr=stderr)
+    return reply["exit"], stdout.getvalue(), stderr.getvalue()
+
+
+def run_direct(argv):
+    process = Popen([sys.executable, join(TOOLS, "make.py")] + argv,
+                    stdout=PIPE, stderr=PIPE)
+    stdout, stderr = process.communicate()
+    return process.returncode, stdout, stderr
+
+
+@pytest.mark.parametrize("argv", [
+    ["-S", "targets"],
+    # Fails parsing the arguments
+    ["-m", "K64F"],
+])
+def test_run_script(server, argv):
+    """
+    Test that make.py has the same output and exit status in the server
+    """
+    assert run_served(server, argv) == run_direct(argv)
+    status = request({"command": "status"}, server)["result"]
+    assert status["builds"] == 1
+
+
+def test_call_failure(server):
+    """
+    Test that an exception raised by a build is reported to the client
+    """
+    with pytest.raises(BuildServerError) as exc:
+        call("build_project", ".", "BUILD", "K64F", "NOT_A_TOOLCHAIN",
+             socket_path=server)
+    assert "NOT_A_TOOLCHAIN" in str(exc.value)
+
+
+def test_restart(server, monkeypatch):
+    """
+    Test that a server started with other settings is replaced by a new one
+    """
+    pid = request({"command": "status"}, server)["result"]["pid"]
+    assert run_script("make", ["-S", "targets"], server) == 0
+    monkeypatch.setenv("MBED_BUILD_SERVER_TEST", "1")
+    assert run_script("make", ["-S", "targets"], server) == 0
+    status = request({"command": "status"}, server)["result"]
+    assert status["pid"] != pid
+    assert status["builds"] == 1
+
+
+def test_tree_watcher(tmpdir):
+    """
+    Test that changed, created and removed files are noticed once
+    """
+    changed = tmpdir.join("changed.py")
+    changed.write("")
+    created = tmpdir.join("created.py")
+    watcher = TreeWatcher([str(changed), str(created)])
+    assert watcher.changed() == []
+    changed.setmtime(changed.mtime() + 10)
+    created.write("")
+    assert sorted(watcher.changed()) == sorted([str(changed), str(created)])
+    assert watcher.changed() == []
+    changed.remove()
+    assert watcher.changed() == [str(changed)]
+
+
+def test_default_socket(tmpdir, monkeypatch):
+    """
+    Test that the socket is in a directory of the user only
+    """
+    socket_dir = tmpdir.join("build_server")
+    monkeypatch.setattr(tools.build_server, "SOCKET_DIR", str(socket_dir))
+    assert dirname(default_socket()) == str(socket_dir)
+    assert oct(socket_dir.stat().mode & 0777) == "0700"
+    socket_dir.chmod(0777)
+    with pytest.raises(BuildServerError):
+        default_socket()
+
+
+def test_build_environment():
+    """
+    Test that only the environment of the tools and toolchains is sent
+    """
+    environ = {"PATH": "/bin", "MBED_GCC_ARM_PATH": "/gcc", "LC_ALL": "C",
+               "ARMLMD_LICENSE_FILE": "8224@license", "AWS_SECRET_KEY": "x",
+               "GITHUB_TOKEN": "y", "SSH_AUTH_SOCK": "/tmp/agent"}
+    assert sorted(_build_environment(environ)) == [
+        "ARMLMD_LICENSE_FILE", "LC_ALL", "MBED_GCC_ARM_PATH", "PATH"]
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0,
+                    reason="Needs to create a socket of another user")
+def test_socket_of_another_user(tmpdir):
+    """
+    Test that the client does not talk to a socket of another user
+    """
+    socket_path = str(tmpdir.join("other.sock"))
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(socket_path)
+        listener.listen(1)
+        os.chown(socket_path, 65534, -1)
+        with pytest.raises(BuildServerError):
+            _connect(socket_path)
+    finally:
+        listener.close()
@@ -58,6 +58,12 @@ def main():
     compile_cmd.add_argument("--profile",
                              help=("build profile file"),
                              metavar="profile")
+    compile_cmd.add_argument("-j", "--jobs", type=int, default=1,
+                             help="number of combinations compiled at once")
+    compile_cmd.add_argument("--log-dir",
+                             help=("write the output of every combination to "
+                                   "a file in this directory; the default "
+                                   "with more than one job is example_logs"))
 
     export_cmd = subparsers.add_parser("export")
     export_cmd.set_defaults(fn=do_export),
@@ -73,6 +79,12 @@ def main():
                                 argparse_force_uppercase_type(
                                     official_target_names, "MCU")),
                             default=official_target_names)
+    export_cmd.add_argument("-j", "--jobs", type=int, default=1,
+                            help="number of combinations exported at once")
+    export_cmd.add_argument("--log-dir",
+                            help=("write the output of every combination to "
+                                  "a file in this directory; the default "
+                                  "with more than one job is example_logs"))
     args = parser.parse_args()
     config = json.load(open(os.path.join(os.path.dirname(__file__),
                                args.config)))
@@ -87,7 +99,8 @@ def main():
 def do_export(args, config, examples):
     """Do export and build step"""
     results = {}
-    results = lib.export_repos(config, args.ide, args.mcu, examples)
+    results = lib.export_repos(config, args.ide, args.mcu, examples,
+                               args.jobs, args.log_dir)
 
     lib.print_summary(results, export=True)
     failures = lib.get_num_failures(results, export=True)
@@ -116,7 +129,8 @@ def do_deploy(_, config, examples):
 def do_compile(args, config, examples):
     """Do the compile step"""
     results = {}
-    results = lib.compile_repos(config, args.toolchains, args.mcu, args.profile, examples)
+    results = lib.compile_repos(config, args.toolchains, args.mcu, args.profile, examples,
+                                args.jobs, args.log_dir)
     
     lib.print_summary(results)
     failures = lib.get_num_failures(results)
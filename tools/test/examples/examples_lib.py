@@ -5,12 +5,15 @@
 
  """
 import os
-from os.path import dirname, abspath, basename
+from os.path import dirname, abspath, basename, join, exists
 import os.path
 import sys
 import subprocess
 from shutil import rmtree
 from sets import Set
+from time import time
+from contextlib import contextmanager
+from multiprocessing import Pool
 
 ROOT = abspath(dirname(dirname(dirname(dirname(__file__)))))
 sys.path.insert(0, ROOT)
@@ -228,7 +231,156 @@ def get_num_failures(results, export=False):
 
     return num_failures
 
-def export_repos(config, ides, targets, examples):
+@contextmanager
+def job_output(log_file):
+    """Send everything written to stdout and stderr, including by
+    subprocesses, to log_file; when it is None, output is left alone.
+
+    Args:
+    log_file - the path of the log to write
+
+    """
+    if not log_file:
+        yield
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2), sys.stdout, sys.stderr
+    # Line buffered, so that lines printed here and by subprocesses stay in
+    # order
+    with open(log_file, "w", 1) as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        sys.stdout = sys.stderr = log
+        try:
+            yield
+        finally:
+            sys.stdout, sys.stderr = saved[2], saved[3]
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+def job_directory(example_dir, job_dir):
+    """Create a directory for a single job of an example, linking to every
+    file and directory of the example, so that mbed-os and the sources are
+    shared while the files generated by the job stay in job_dir.
+
+    Args:
+    example_dir - the checkout of the example
+    job_dir - the directory to create
+
+    """
+    if exists(job_dir):
+        rmtree(job_dir)
+    os.makedirs(job_dir)
+    for entry in os.listdir(example_dir):
+        if entry != "BUILD":
+            os.symlink(abspath(join(example_dir, entry)), join(job_dir, entry))
+
+
+def compile_job(job):
+    """Compile a single combination of example, target and toolchain.
+    Runs in a worker process of run_matrix.
+
+    Returns "success" or "failure"
+    """
+    print("Compiling %s" % job['summary'])
+    sys.stdout.flush()
+    with job_output(job['log']):
+        proc = subprocess.Popen(job['command'], cwd=job['directory'])
+        proc.wait()
+    return "failure" if proc.returncode else "success"
+
+
+def export_job(job):
+    """Export, and then build, a single combination of example, target and
+    IDE. Runs in a worker process of run_matrix.
+
+    Returns "export failure", "build failure", "skip" or "success"
+    """
+    print("Exporting %s" % job['summary'])
+    sys.stdout.flush()
+    directory = job['directory']
+    if job['job_dir']:
+        job_directory(directory, job['job_dir'])
+        directory = job['job_dir']
+    cwd = os.getcwd()
+    with job_output(job['log']):
+        os.chdir(directory)
+        try:
+            proc = subprocess.Popen(["mbed-cli", "export", "-i", job['ide'],
+                                     "-m", job['target']])
+            proc.wait()
+            if proc.returncode:
+                return "export failure"
+            try:
+                if EXPORTERS[job['ide']].build(job['project'], cleanup=False):
+                    return "build failure"
+                return "success"
+            except TypeError:
+                return "skip"
+        finally:
+            os.chdir(cwd)
+
+
+def timed_job(args):
+    """Run a job of run_matrix, timing it"""
+    function, index, job = args
+    start = time()
+    outcome = function(job)
+    return index, outcome, time() - start
+
+
+def run_matrix(function, jobs, workers=1):
+    """Run every job with function, on up to workers processes at once.
+
+    Worker processes may change their working directory and redirect their
+    output without affecting each other. With a single worker, jobs run in
+    this process, one after the other.
+
+    Args:
+    function - called with a job, returns its outcome
+    jobs - list of jobs
+    workers - the number of jobs run at once
+
+    Yields every job with its outcome and its duration in seconds, as they
+    finish
+    """
+    tasks = [(function, index, job) for index, job in enumerate(jobs)]
+    if workers > 1 and len(jobs) > 1:
+        pool = Pool(min(workers, len(jobs)))
+        try:
+            done = pool.imap_unordered(timed_job, tasks)
+            for index, outcome, duration in done:
+                yield jobs[index], outcome, duration
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for task in tasks:
+            index, outcome, duration = timed_job(task)
+            yield jobs[index], outcome, duration
+
+
+def log_path(log_dir, summary):
+    """The log file of the job summary in log_dir, or None without log_dir"""
+    if not log_dir:
+        return None
+    if not exists(log_dir):
+        os.makedirs(log_dir)
+    return abspath(join(log_dir, summary.replace(" ", "_") + ".log"))
+
+
+def job_status(message, job, duration):
+    """Print the status of a finished job, with its time and log"""
+    log = ", log in %s" % job['log'] if job['log'] else ""
+    print("%s %s (%.1fs%s)" % (message, job['summary'], duration, log))
+    sys.stdout.flush()
+
+
+def export_repos(config, ides, targets, examples, jobs=1, log_dir=None):
     """Exports and builds combinations of example programs, targets and IDEs.
 
         The results are returned in a [key: value] dictionary format:
@@ -251,25 +403,31 @@ def export_repos(config, ides, targets, examples):
             Args:
             config - the json object imported from the file.
             ides - List of IDES to export to
+
+            Kwargs:
+            jobs - the number of combinations exported at once. Each is
+                   exported in its own directory, linking to the example.
+            log_dir - the directory of the logs of every combination
     """
     results = {}
     valid_examples = Set(examples)
+    # Exports run in a directory of links to the example
+    isolate = jobs > 1 and hasattr(os, "symlink")
+    if jobs > 1 and not isolate:
+        print("Exporting one example at a time: links are not supported")
+        jobs = 1
+    if jobs > 1 and not log_dir:
+        log_dir = "example_logs"
+    matrix = []
     print("\nExporting example repos....\n")
     for example in config['examples']:
         example_names = [basename(x['repo']) for x in get_repo_list(example)]
         common_examples = valid_examples.intersection(Set(example_names))
         if not common_examples:
             continue
-        export_failures = []
-        build_failures = []
-        build_skips = []
-        successes = []
-        exported = True
-        pass_status = True
         if example['export']:
             for repo_info in get_repo_list(example):
                 example_project_name = basename(repo_info['repo'])
-                os.chdir(example_project_name)
                 # Check that the target, IDE, and features combinations are valid and return a
                 # list of valid combinations to work through
                 for target, ide in target_cross_ide(valid_choices(example['targets'], targets),
@@ -277,44 +435,52 @@ def export_repos(config, ides, targets, examples):
                                                     example['features'], example['toolchains']):
                     example_name = "{} {} {}".format(example_project_name, target,
                                                      ide)
-                    def status(message):
-                        print(message + " %s" % example_name)
-                        sys.stdout.flush()
-
-                    status("Exporting")
-                    proc = subprocess.Popen(["mbed-cli", "export", "-i", ide,
-                                             "-m", target])
-                    proc.wait()
-                    if proc.returncode:
-                        export_failures.append(example_name)
-                        status("FAILURE exporting")
-                    else:
-                        status("SUCCESS exporting")
-                        status("Building")
-                        try:
-                            if EXPORTERS[ide].build(example_project_name, cleanup=False):
-                                status("FAILURE building")
-                                build_failures.append(example_name)
-                            else:
-                                status("SUCCESS building")
-                                successes.append(example_name)
-                        except TypeError:
-                            successes.append(example_name)
-                            build_skips.append(example_name)
-                os.chdir("..")
-
-                if len(build_failures+export_failures) > 0:
-                    pass_status= False
+                    matrix.append({
+                        'example': example['name'],
+                        'summary': example_name,
+                        'project': example_project_name,
+                        'directory': abspath(example_project_name),
+                        # The project is named after the directory it is
+                        # exported in, which the IDE build expects
+                        'job_dir': abspath(join("BUILD", "export",
+                                                "%s_%s" % (target, ide),
+                                                example_project_name))
+                                   if isolate else None,
+                        'target': target,
+                        'ide': ide,
+                        'log': log_path(log_dir, example_name),
+                    })
+        results[example['name']] = [example['export'], True, [], [], [], []]
+
+    statuses = {}
+    messages = {"success": "SUCCESS exporting and building",
+                "skip": "SUCCESS exporting, no build for",
+                "export failure": "FAILURE exporting",
+                "build failure": "FAILURE building"}
+    for job, outcome, duration in run_matrix(export_job, matrix, jobs):
+        statuses[job['summary']] = outcome
+        job_status(messages[outcome], job, duration)
+
+    for job in matrix:
+        _, pass_status, successes, export_failures, build_failures, build_skips = \
+            results[job['example']]
+        outcome = statuses[job['summary']]
+        if outcome == "export failure":
+            export_failures.append(job['summary'])
+        elif outcome == "build failure":
+            build_failures.append(job['summary'])
         else:
-            exported = False
-
-        results[example['name']] = [exported, pass_status, successes,
-                                    export_failures, build_failures, build_skips]
+            successes.append(job['summary'])
+            if outcome == "skip":
+                build_skips.append(job['summary'])
+        if export_failures or build_failures:
+            results[job['example']][1] = False
 
     return results
 
 
-def compile_repos(config, toolchains, targets, profile, examples):
+def compile_repos(config, toolchains, targets, profile, examples, jobs=1,
+                  log_dir=None):
     """Compiles combinations of example programs, targets and compile chains.
 
        The results are returned in a [key: value] dictionary format:
@@ -334,53 +500,63 @@ def compile_repos(config, toolchains, targets, profile, examples):
     toolchains - List of toolchains to compile for.
     results - results of the compilation stage.
 
+    Kwargs:
+    jobs - the number of combinations compiled at once. Each is compiled
+           into its own build directory.
+    log_dir - the directory of the logs of every combination
+
     """
     results = {}
     valid_examples = Set(examples)
+    if jobs > 1 and not log_dir:
+        log_dir = "example_logs"
+    matrix = []
     print("\nCompiling example repos....\n")
     for example in config['examples']:
         example_names = [basename(x['repo']) for x in get_repo_list(example)]
         common_examples = valid_examples.intersection(Set(example_names))
         if not common_examples:
             continue
-        failures = []
-        successes = []
-        compiled = True
-        pass_status = True
         if example['compile']:
             for repo_info in get_repo_list(example):
                 name = basename(repo_info['repo'])
-                os.chdir(name)
 
                 # Check that the target, toolchain and features combinations are valid and return a
                 # list of valid combinations to work through
                 for target, toolchain in target_cross_toolchain(valid_choices(example['targets'], targets),
                                                                 valid_choices(example['toolchains'], toolchains),
                                                                 example['features']):
-                    print("Compiling %s for %s, %s" % (name, target, toolchain))
-                    build_command = ["mbed-cli", "compile", "-t", toolchain, "-m", target, "-v"]
+                    build_command = ["mbed-cli", "compile", "-t", toolchain, "-m", target, "-v",
+                                     "--build", join("BUILD", target, toolchain)]
 
                     if profile:
                         build_command.append("--profile")
                         build_command.append(profile)
 
-                    proc = subprocess.Popen(build_command)
-
-                    proc.wait()
                     example_summary = "{} {} {}".format(name, target, toolchain)
-                    if proc.returncode:
-                        failures.append(example_summary)
-                    else:
-                        successes.append(example_summary)
-                os.chdir("..")
-
-            # If there are any compilation failures for the example 'set' then the overall status is fail.
-            if len(failures) > 0:
-                pass_status = False
+                    matrix.append({
+                        'example': example['name'],
+                        'summary': example_summary,
+                        'directory': abspath(name),
+                        'command': build_command,
+                        'log': log_path(log_dir, example_summary),
+                    })
+        results[example['name']] = [example['compile'], True, [], []]
+
+    statuses = {}
+    for job, outcome, duration in run_matrix(compile_job, matrix, jobs):
+        statuses[job['summary']] = outcome
+        job_status("SUCCESS compiling" if outcome == "success"
+                   else "FAILURE compiling", job, duration)
+
+    # If there are any compilation failures for the example 'set' then the overall status is fail.
+    for job in matrix:
+        _, _, successes, failures = results[job['example']]
+        if statuses[job['summary']] == "success":
+            successes.append(job['summary'])
         else:
-            compiled = False
-
-        results[example['name']] = [compiled, pass_status, successes, failures]
+            failures.append(job['summary'])
+            results[job['example']][1] = False
 
     return results
 
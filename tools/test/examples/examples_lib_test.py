@@ -0,0 +1,138 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import stat
+from itertools import combinations
+import pytest
+from mock import patch
+import examples_lib as lib
+
+"""
+Tests for the compile and export matrix of examples_lib, with a fake mbed-cli
+"""
+
+MBED_CLI = """#!%s
+import os, sys, time
+args = sys.argv[1:]
+start = time.time()
+time.sleep(0.5)
+times = os.path.join(os.path.dirname(__file__), os.pardir, "times")
+with open(os.path.join(times, str(os.getpid())), "w") as run:
+    run.write("%%r %%r" %% (start, time.time()))
+print("mbed-cli %%s in %%s" %% (" ".join(args), os.getcwd()))
+target = args[args.index("-m") + 1]
+if args[0] == "compile":
+    build = args[args.index("--build") + 1]
+    os.makedirs(build)
+    open(os.path.join(build, "example.bin"), "w").close()
+else:
+    # Projects are named after the directory they are exported in
+    open(os.path.basename(os.getcwd()) + ".project", "w").close()
+sys.exit(target == "NUCLEO_F401RE")
+"""
+
+
+class FakeExporter(object):
+    TOOLCHAIN = "GCC_ARM"
+
+    @staticmethod
+    def is_target_supported(target):
+        return True
+
+    @staticmethod
+    def build(project_name, cleanup=True):
+        assert os.path.exists(project_name + ".project")
+        print("building %s" % project_name)
+        return 0
+
+
+CONFIG = {"examples": [{
+    "name": "blinky",
+    "github": "https://github.com/ARMmbed/mbed-os-example-blinky",
+    "test-repo-source": "github",
+    "features": [], "targets": [], "toolchains": [], "exporters": [],
+    "compile": True, "export": True,
+}]}
+
+
+@pytest.fixture
+def workspace(tmpdir):
+    """
+    A checkout of an example, with a fake mbed-cli on the PATH
+    """
+    tmpdir.join("bin").ensure(dir=True)
+    tmpdir.join("times").ensure(dir=True)
+    mbed_cli = tmpdir.join("bin", "mbed-cli")
+    mbed_cli.write(MBED_CLI % sys.executable)
+    mbed_cli.chmod(stat.S_IRWXU)
+    tmpdir.join("mbed-os-example-blinky", "main.cpp").write("", ensure=True)
+    tmpdir.join("mbed-os-example-blinky", "mbed-os", "mbed.h").write("", ensure=True)
+    with patch.dict(os.environ, PATH=str(tmpdir.join("bin")) + os.pathsep +
+                    os.environ["PATH"]):
+        with tmpdir.as_cwd():
+            yield tmpdir
+
+
+def test_compile_matrix(workspace):
+    """
+    Test that combinations are compiled at once, into their own build
+    directory, with the same results as one at a time
+    """
+    targets = ["K64F", "NUCLEO_F401RE"]
+    results = lib.compile_repos(CONFIG, ["GCC_ARM", "ARM"], targets, None,
+                                ["mbed-os-example-blinky"], jobs=4)
+    runs = [map(float, run.read().split())
+            for run in workspace.join("times").listdir()]
+    assert len(runs) == 4
+    assert any(start < other_end and other_start < end for
+               (start, end), (other_start, other_end) in combinations(runs, 2))
+    assert results == {"blinky": [
+        True, False,
+        ["mbed-os-example-blinky K64F GCC_ARM", "mbed-os-example-blinky K64F ARM"],
+        ["mbed-os-example-blinky NUCLEO_F401RE GCC_ARM",
+         "mbed-os-example-blinky NUCLEO_F401RE ARM"]]}
+    assert workspace.join("mbed-os-example-blinky", "BUILD", "K64F", "ARM",
+                          "example.bin").check()
+    log = workspace.join("example_logs", "mbed-os-example-blinky_K64F_ARM.log")
+    assert "compile -t ARM -m K64F" in log.read()
+
+    assert lib.compile_repos(CONFIG, ["ARM"], ["NUCLEO_F401RE"], None,
+                             ["mbed-os-example-blinky"]) == {"blinky": [
+        True, False, [], ["mbed-os-example-blinky NUCLEO_F401RE ARM"]]}
+
+
+def test_export_matrix(workspace):
+    """
+    Test that every combination is exported into its own directory, linking
+    to the example
+    """
+    with patch.dict(lib.EXPORTERS, {"fake": FakeExporter}):
+        results = lib.export_repos(CONFIG, ["fake"], ["K64F", "NUCLEO_F401RE"],
+                                   ["mbed-os-example-blinky"], jobs=2)
+    assert results == {"blinky": [
+        True, False, ["mbed-os-example-blinky K64F fake"],
+        ["mbed-os-example-blinky NUCLEO_F401RE fake"], [], []]}
+    job_dir = workspace.join("BUILD", "export", "K64F_fake",
+                             "mbed-os-example-blinky")
+    assert job_dir.join("mbed-os-example-blinky.project").check()
+    assert job_dir.join("mbed-os").islink()
+    assert not workspace.join("mbed-os-example-blinky",
+                              "mbed-os-example-blinky.project").check()
+    log = workspace.join("example_logs", "mbed-os-example-blinky_K64F_fake.log")
+    assert "building mbed-os-example-blinky" in log.read()
@@ -0,0 +1,88 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import zipfile
+from StringIO import StringIO
+import pytest
+import tools.export.archive
+from tools.export.archive import ZipWriter
+
+"""
+Tests for writing zip archives on threads
+"""
+
+
+class Socket(object):
+    """A file that can only be written to"""
+    def __init__(self):
+        self.data = StringIO()
+
+    def write(self, data):
+        self.data.write(data)
+
+
+@pytest.fixture
+def files(tmpdir):
+    tmpdir.join("main.c").write("int main() { return 0; }\n" * 100)
+    tmpdir.join("lib.a").write("".join(chr(i % 251) for i in range(5000)),
+                               "wb")
+    tmpdir.join("large.h").write("#define LARGE 1\n" * 1000)
+    tmpdir.join("empty.h").write("")
+    return [str(tmpdir.join(name)) for name in
+            ("main.c", "lib.a", "large.h", "empty.h")]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_zip_writer(files, monkeypatch, jobs):
+    """
+    Test that archives streamed to a file that can not seek are complete,
+    with binaries stored and large files compressed in chunks
+    """
+    monkeypatch.setattr(tools.export.archive, "STREAM_SIZE", 10000)
+    monkeypatch.setattr(tools.export.archive, "CHUNK_SIZE", 1000)
+    output = Socket()
+    with ZipWriter(output, jobs=jobs) as writer:
+        for directory in ("project/", "project/copy/"):
+            for source in files:
+                writer.write(source, directory + os.path.basename(source))
+
+    archive = zipfile.ZipFile(StringIO(output.data.getvalue()))
+    assert archive.testzip() is None
+    infos = archive.infolist()
+    assert len(infos) == 8
+    assert [info.filename for info in infos][:4] == \
+        ["project/" + os.path.basename(source) for source in files]
+    for info, source in zip(infos, files * 2):
+        with open(source, "rb") as fd:
+            assert archive.read(info) == fd.read()
+    compression = dict((info.filename, (info.compress_type, info.flag_bits))
+                       for info in infos[:4])
+    assert compression == {
+        "project/main.c": (zipfile.ZIP_DEFLATED, 0),
+        "project/lib.a": (zipfile.ZIP_STORED, 0),
+        "project/large.h": (zipfile.ZIP_DEFLATED, 0x08),
+        "project/empty.h": (zipfile.ZIP_DEFLATED, 0)}
+
+
+def test_zip_writer_file(files, tmpdir):
+    """
+    Test that an archive given by name is written to that file
+    """
+    filename = str(tmpdir.join("project.zip"))
+    with ZipWriter(filename, jobs=2) as writer:
+        writer.write(files[0], "main.c")
+    assert zipfile.ZipFile(filename).namelist() == ["main.c"]
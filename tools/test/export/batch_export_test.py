@@ -0,0 +1,86 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import zipfile
+from os.path import join, abspath, dirname, exists
+import pytest
+from mock import patch
+import tools.export
+from tools.export import export_projects, export_project
+
+"""
+Tests for exporting a program to several targets and IDEs at once
+"""
+
+ROOT = abspath(join(dirname(__file__), "..", "..", ".."))
+
+
+@pytest.fixture
+def program(tmpdir):
+    tmpdir.join("source", "main.cpp").write("int main() { return 0; }\n",
+                                            ensure=True)
+    return str(tmpdir.join("source"))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export_projects(program, tmpdir, jobs):
+    """
+    Test that the sources are scanned once per toolchain, and that every
+    project is exported as export_project does
+    """
+    scan_resources = tools.export.scan_resources
+    with patch("tools.export.scan_resources",
+               side_effect=scan_resources) as scan:
+        report = export_projects(
+            [program, ROOT], str(tmpdir.join("export")), ["K64F"],
+            ["gcc_arm", "make_gcc_arm", "iar", "atmelstudio"], name="program",
+            jobs=jobs, report=str(tmpdir.join("report.json")), silent=True)
+    assert scan.call_count == 2
+
+    assert [(entry["ide"], entry["result"], entry["shared_scan"])
+            for entry in report] == [("gcc_arm", "OK", 2),
+                                     ("make_gcc_arm", "OK", 2),
+                                     ("iar", "OK", 1),
+                                     ("atmelstudio", "NOT_SUPPORTED", 0)]
+    with open(str(tmpdir.join("report.json"))) as fd:
+        assert json.load(fd) == report
+
+    export_project([program, ROOT], str(tmpdir.join("single")), "K64F",
+                   "gcc_arm", name="program", zip_proj="program.zip",
+                   silent=True)
+    single = zipfile.ZipFile(str(tmpdir.join("single", "program.zip")))
+    for entry in report[:3]:
+        assert entry["generate"] > 0 and entry["total"] > 0
+        batch = zipfile.ZipFile(join(entry["export_path"], entry["zip"]))
+        if entry["ide"] == "gcc_arm":
+            assert sorted(batch.namelist()) == sorted(single.namelist())
+        assert "program/Makefile" in batch.namelist() or \
+            "program/program.ewp" in batch.namelist()
+
+
+def test_export_failure(program, tmpdir):
+    """
+    Test that a failing export is reported, and does not stop the others
+    """
+    with patch("tools.export.uvision.Uvision.generate",
+               side_effect=IOError("disk full")):
+        report = export_projects([program, ROOT], str(tmpdir), ["K64F"],
+                                 ["uvision5", "gcc_arm"], name="program",
+                                 silent=True)
+    assert [(entry["result"], entry["error"]) for entry in report] == \
+        [("FAIL", "disk full"), ("OK", None)]
+    assert exists(join(report[1]["export_path"], report[1]["zip"]))
@@ -0,0 +1,71 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import sys
+import json
+from os.path import join, abspath, dirname
+from subprocess import check_output
+import pytest
+
+"""
+Tests that the tools entry points start without importing slow modules
+"""
+
+ROOT = abspath(join(dirname(__file__), "..", ".."))
+
+# Generous, so that slow machines pass; the entry points start in about
+# 0.15s (0.25s for project.py), down from 0.5s when every module was
+# imported eagerly
+IMPORT_BUDGET = 1.0
+
+# Modules that are slow to import and only used by some commands
+HEAVY_MODULES = ["bs4", "elftools", "fuzzywuzzy", "jinja2", "mbed_lstools",
+                 "pkg_resources", "prettytable"]
+
+IMPORT_SCRIPT = """
+import sys, json
+sys.path.insert(0, %r)
+from tools.dev.import_time import time_imports
+timer = time_imports(%r)
+print(json.dumps({"total": timer.total(), "modules": sorted(sys.modules)}))
+"""
+
+
+def import_script(script):
+    """Import the modules of a tools script in a new interpreter"""
+    output = check_output([sys.executable, "-c",
+                           IMPORT_SCRIPT % (ROOT, join(ROOT, "tools", script))],
+                          cwd=ROOT)
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize("script, allowed", [
+    ("make.py", []),
+    ("build.py", []),
+    ("test.py", []),
+    # Every exporter is loaded, and they render jinja2 templates
+    ("project.py", ["jinja2"]),
+])
+def test_import_budget(script, allowed):
+    """
+    Test that the entry points import no slow module they do not need
+    """
+    imported = import_script(script)
+    heavy = [module for module in HEAVY_MODULES
+             if module in imported["modules"] and module not in allowed]
+    assert heavy == []
+    assert imported["total"] < IMPORT_BUDGET
@@ -2,6 +2,7 @@ import sys
 from io import open
 from os.path import isfile, join, dirname
 import json
+import gzip
 
 import pytest
 
@@ -59,3 +60,55 @@ def test_add_full_module():
     assert("main.o" in memap.modules)
     assert(".data" in memap.modules["main.o"])
     assert(memap.modules["main.o"][".data"] == 8)
+
+def test_add_module_by_basename():
+    memap = MemapParser()
+    memap.module_add("/common/path/main.o", 8, ".text")
+    memap.module_add("/other/path/main.o", 4, ".text")
+    memap.module_add("main.o", 2, ".data")
+    memap.module_add("/common/path/irqs.o", 1, ".text")
+    assert memap.modules == {"/common/path/main.o": {".text": 12, ".data": 2},
+                             "/common/path/irqs.o": {".text": 1}}
+
+    memap.module_replace("/common/path/main.o", "[lib]/c.a/main.o")
+    memap.module_add("/any/main.o", 1, ".bss")
+    assert memap.modules["[lib]/c.a/main.o"] == {".text": 12, ".data": 2,
+                                                 ".bss": 1}
+
+    memap.modules = {"/new/path/irqs.o": {".text": 1}}
+    memap.module_add("irqs.o", 1, ".text")
+    assert memap.modules == {"/new/path/irqs.o": {".text": 2}}
+
+
+SAMPLE_MAPS = [("gcc_k64f", "GCC_ARM"), ("arm_k64f", "ARM")]
+GOLDEN_OUTPUTS = [("json", "json"), ("csv-ci", "csv"), ("table", "txt")]
+
+@pytest.mark.parametrize("name, toolchain", SAMPLE_MAPS)
+@pytest.mark.parametrize("depth", [1, 2, 3])
+@pytest.mark.parametrize("export_format, extension", GOLDEN_OUTPUTS)
+def test_golden_outputs(tmpdir, name, toolchain, depth, export_format,
+                        extension):
+    """The reports of the sample maps match the ones memap produced before
+    its parsing was reworked
+    """
+    mapfile = str(tmpdir.join(name + ".map"))
+    with gzip.open(join(dirname(__file__), name + ".map.gz")) as sample, \
+         open(mapfile, "wb") as map_output:
+        map_output.write(sample.read())
+    output_file = str(tmpdir.join("report"))
+
+    memap = MemapParser()
+    assert memap.parse(mapfile, toolchain)
+    table = memap.generate_output(export_format, depth, output_file)
+    if table is not None:
+        with open(output_file, "wb") as table_output:
+            table_output.write(table)
+
+    golden_file = join(dirname(__file__), "golden",
+                       "%s.depth%d.%s" % (name, depth, extension))
+    with open(golden_file, "rb") as golden, \
+         open(output_file, "rb") as report:
+        if export_format == "json":
+            assert json.load(report) == json.load(golden)
+        else:
+            assert report.read() == golden.read()
@@ -0,0 +1,133 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+from StringIO import StringIO
+import pytest
+from intelhex import IntelHex
+from tools.memory_image import MemoryImage, load_image
+from tools.build_api import merge_region_list
+from tools.config import Region
+from tools.utils import ToolException
+
+"""
+Tests for memory_image.py, against IntelHex
+"""
+
+def random_images(seed):
+    """
+    The same random contents, as an IntelHex and as a MemoryImage
+    """
+    rand = random.Random(seed)
+    intel_hex = IntelHex()
+    image = MemoryImage()
+    for _ in range(rand.randint(1, 10)):
+        address = rand.choice([0, 0xFFF0, 0x1FFFA, rand.randint(0, 0x30000)])
+        data = "".join(chr(rand.randint(0, 255))
+                       for _ in range(rand.randint(1, 300)))
+        intel_hex.puts(address, data)
+        image.put(address, data)
+    return intel_hex, image
+
+
+def load_from_segments(segments):
+    """
+    A MemoryImage of (address, data) pairs
+    """
+    image = MemoryImage()
+    for address, data in segments:
+        image.put(address, data)
+    return image
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_output_as_intelhex(seed, tmpdir):
+    """
+    Test that images are written, and read back, as IntelHex does
+    """
+    intel_hex, image = random_images(seed)
+    intel_hex.start_addr = image.start_addr = {'EIP': 0x1C000 + seed}
+    expected_hex = StringIO()
+    intel_hex.write_hex_file(expected_hex)
+    written_hex = StringIO()
+    image.write_hex_file(written_hex)
+    assert written_hex.getvalue() == expected_hex.getvalue()
+
+    expected_bin = StringIO()
+    intel_hex.tofile(expected_bin, format='bin')
+    written_bin = StringIO()
+    image.tobinfile(written_bin)
+    assert written_bin.getvalue() == expected_bin.getvalue()
+
+    hex_file = tmpdir.join("image.hex")
+    hex_file.write(expected_hex.getvalue())
+    loaded = load_image(str(hex_file), 0)
+    assert loaded.segments() == image.segments()
+    assert loaded.start_addr == intel_hex.start_addr
+
+
+def test_put_joins_segments():
+    """
+    Test that overlapping and adjacent data is kept in one segment
+    """
+    image = MemoryImage()
+    image.put(0x10, "bb")
+    image.put(0x20, "dd")
+    image.put(0x00, "a" * 0x10)
+    image.put(0x12, "c" * 0x0E)
+    image.put(0x1F, "xyz")
+    assert image.segments() == [(0, bytearray("a" * 16 + "bb" + "c" * 13 +
+                                              "xyz"))]
+    image.put(0x40, "e")
+    assert len(image) == 0x23
+    assert (image.minaddr(), image.maxaddr()) == (0, 0x40)
+    assert image.overlaps(0x21, 1)
+    assert not image.overlaps(0x22, 0x1E)
+    with pytest.raises(ToolException):
+        image.merge(load_from_segments([(0x3F, "fg")]), overlap='error')
+    image.merge(load_from_segments([(0x3F, "fg")]), overlap='replace')
+    assert image.segments()[-1] == (0x3F, bytearray("fg"))
+
+
+def test_invalid_hex_record(tmpdir):
+    """
+    Test that a corrupted HEX file is reported with its line
+    """
+    hex_file = tmpdir.join("bad.hex")
+    hex_file.write(":0100000041BE\n:0100010042BB\n:00000001FF\n")
+    with pytest.raises(ToolException) as error:
+        load_image(str(hex_file), 0)
+    assert "bad.hex:2" in str(error.value)
+
+
+def test_merge_region_list(tmpdir):
+    """
+    Test that regions are padded up to the next region, and the gaps of a
+    HEX file are filled
+    """
+    bootloader = IntelHex()
+    bootloader.puts(0, "boot")
+    bootloader.puts(8, "loader")
+    bootloader.tofile(str(tmpdir.join("bootloader.hex")), format='hex')
+    tmpdir.join("app.bin").write("application")
+    destination = tmpdir.join("out", "merged.bin")
+    merge_region_list([
+        Region("bootloader", 0, 32, False, str(tmpdir.join("bootloader.hex"))),
+        Region("application", 32, 64, True, str(tmpdir.join("app.bin")))],
+        str(destination))
+    assert destination.read("rb") == ("boot" + "\xFF" * 4 + "loader" +
+                                      "\xFF" * 18 + "application")
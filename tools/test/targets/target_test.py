@@ -23,7 +23,9 @@ from os.path import join, abspath, dirname
 from contextlib import contextmanager
 import pytest
 
-from tools.targets import TARGETS, TARGET_MAP, Target, update_target_data
+import tools.targets
+from tools.targets import TARGETS, TARGET_MAP, Target, update_target_data, \
+    target, CUMULATIVE_ATTRIBUTES, CompiledJsonData, CACHES
 from tools.arm_pack_manager import Cache
 
 
@@ -131,3 +133,128 @@ def test_modify_existing_target():
             # The existing target should not be modified by custom targets
             assert TARGET_MAP["Test_Target"].default_toolchain != 'GCC_ARM'
             assert TARGET_MAP["Test_Target"].bootloader_supported != True
+
+def get_attribute(tgt, attrname):
+    """The value of an attribute, or the exception raised getting it"""
+    try:
+        return getattr(tgt, attrname)
+    except (AttributeError, KeyError, ValueError) as exc:
+        return type(exc), str(exc)
+
+def test_compiled_targets():
+    """Assert that targets read from the compiled targets database have the
+    attributes of targets resolved from JSON"""
+    json_data = Target.get_json_target_data()
+    for name in json_data:
+        compiled, resolved = Target.get_target(name), target(name, json_data)
+        assert isinstance(compiled.json_data, CompiledJsonData)
+        assert compiled.resolution_order == resolved.resolution_order
+        attrnames = set(CUMULATIVE_ATTRIBUTES + ["labels", "progen",
+                                                 "program_cycle_s", "unknown"])
+        for parent in resolved.resolution_order_names:
+            attrnames.update(json_data[parent])
+        for attrname in attrnames:
+            assert (get_attribute(compiled, attrname) ==
+                    get_attribute(resolved, attrname)), (name, attrname)
+
+def test_compiled_targets_changed(monkeypatch, tmpdir):
+    """Assert that the compiled targets database is compiled again when the
+    targets file changes, replacing the one compiled before, and that errors
+    are raised when attributes are used"""
+    test_target_json = """
+    {
+        "Target": {
+            "core": null,
+            "macros": ["A", "B=1"],
+            "public": false
+        },
+        "Test_Target": {
+            "inherits": ["Target"],
+            "core": "Cortex-M4",
+            "macros_remove": ["B"]
+        },
+        "Broken_Target": {
+            "inherits": ["Target"],
+            "macros_remove": ["C"]
+        }
+    }"""
+    db_dir = tmpdir.join("targets")
+    monkeypatch.setattr(tools.targets, "COMPILED_TARGETS_DIR", str(db_dir))
+    try:
+        with temp_target_file(test_target_json, json_filename="targets.json") as targets_dir:
+            targets_file = os.path.join(targets_dir, "targets.json")
+            Target.set_targets_json_location(targets_file)
+            update_target_data()
+            assert sorted(TARGET_MAP) == ["Broken_Target", "Test_Target"]
+            assert TARGET_MAP["Test_Target"].macros == ["A"]
+            assert TARGET_MAP["Broken_Target"].core is None
+            with pytest.raises(ValueError):
+                TARGET_MAP["Broken_Target"].macros
+
+            databases = db_dir.listdir()
+            assert len(databases) == 1
+            legacy = db_dir.join("targets_%s.db" % ("0" * 32))
+            legacy.write("")
+
+            with open(targets_file, "w") as out:
+                out.write(test_target_json.replace("Cortex-M4", "Cortex-M7"))
+            Target.set_targets_json_location(targets_file)
+            update_target_data()
+            assert TARGET_MAP["Test_Target"].core == "Cortex-M7"
+            assert len(db_dir.listdir()) == 1
+            assert db_dir.listdir() != databases
+
+            # Databases of other targets files, the least recently used first
+            for number in range(tools.targets.COMPILED_TARGETS_KEEP + 2):
+                other = db_dir.join("targets_%012d_%s.db" % (number, "0" * 32))
+                other.write("")
+                other.setmtime(1000000000 + number)
+            with open(targets_file, "w") as out:
+                out.write(test_target_json)
+            Target.set_targets_json_location(targets_file)
+            update_target_data()
+            remaining = sorted(path.basename for path in db_dir.listdir())
+            assert len(remaining) == tools.targets.COMPILED_TARGETS_KEEP
+            assert remaining[0] == "targets_%012d_%s.db" % (3, "0" * 32)
+    finally:
+        Target.set_targets_json_location()
+        update_target_data()
+
+def test_compiled_targets_location(monkeypatch, tmpdir):
+    """Assert that the compiled targets database is only kept in a directory
+    of the user, and compiled again when it can not be read"""
+    test_target_json = """
+    {
+        "Test_Target": {
+            "core": "Cortex-M4",
+            "macros": ["A"]
+        }
+    }"""
+    db_dir = tmpdir.join("targets")
+    monkeypatch.setattr(tools.targets, "COMPILED_TARGETS_DIR", str(db_dir))
+    try:
+        with temp_target_file(test_target_json, json_filename="targets.json") as targets_dir:
+            Target.set_targets_json_location(
+                os.path.join(targets_dir, "targets.json"))
+            update_target_data()
+            assert oct(db_dir.stat().mode & 0777) == "0700"
+            databases = db_dir.listdir()
+            assert len(databases) == 1
+            assert oct(databases[0].stat().mode & 0777) == "0600"
+
+            databases[0].write("\x00corrupt", "wb")
+            CACHES.clear()
+            update_target_data()
+            assert TARGET_MAP["Test_Target"].macros == ["A"]
+            assert len(databases[0].read("rb")) > 20
+
+            # Another user could replace databases in a shared directory
+            db_dir.chmod(0777)
+            databases[0].remove()
+            CACHES.clear()
+            update_target_data()
+            assert TARGET_MAP["Test_Target"].core == "Cortex-M4"
+            assert db_dir.listdir() == []
+    finally:
+        Target.set_targets_json_location()
+        update_target_data()
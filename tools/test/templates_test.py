@@ -0,0 +1,87 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import pytest
+import tools.settings
+import tools.templates
+from tools.templates import get_environment, get_template, render
+
+"""
+Tests for the shared template environments
+"""
+
+TEMPLATE = "{% for x in items %}\n{{ x }}\n{% endfor %}"
+
+
+@pytest.fixture
+def templates(tmpdir, monkeypatch):
+    """A directory of templates, with no environment created yet"""
+    monkeypatch.setattr(tools.templates, "_environments", {})
+    monkeypatch.setattr(tools.settings, "TEMPLATE_CACHE_DIR", "")
+    tmpdir.join("list.tmpl").write(TEMPLATE)
+    return str(tmpdir)
+
+
+def test_shared_environment(templates):
+    """
+    Test that templates are compiled once per set of options
+    """
+    environment = get_environment(templates)
+    assert get_environment(templates + "/") is environment
+    assert get_environment(templates, trim_blocks=True) is not environment
+    assert environment.cache.capacity == tools.settings.TEMPLATE_CACHE_SIZE
+    assert get_template(templates, "list.tmpl") is \
+        get_template(templates, "list.tmpl")
+    assert render(templates, "list.tmpl", {"items": [1]}) == "\n1\n"
+    assert render(templates, "list.tmpl", {"items": [1]},
+                  trim_blocks=True) == "1\n"
+
+
+def test_changed_template(templates):
+    """
+    Test that a template is compiled again when it changes
+    """
+    assert render(templates, "list.tmpl", {"items": [1]}) == "\n1\n"
+    path = os.path.join(templates, "list.tmpl")
+    with open(path, "w") as fd:
+        fd.write("{{ items|length }}")
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert render(templates, "list.tmpl", {"items": [1]}) == "1"
+
+
+def test_bytecode_cache(templates, tmpdir, monkeypatch):
+    """
+    Test that compiled templates are kept on disk, separately for every set
+    of options
+    """
+    cache_dir = str(tmpdir.join("cache"))
+    monkeypatch.setattr(tools.settings, "TEMPLATE_CACHE_DIR", cache_dir)
+    assert render(templates, "list.tmpl", {"items": [1]}) == "\n1\n"
+    assert render(templates, "list.tmpl", {"items": [1]},
+                  trim_blocks=True) == "1\n"
+    assert len(os.listdir(cache_dir)) == 2
+
+    # A new process only loads the bytecode
+    monkeypatch.setattr(tools.templates, "_environments", {})
+    environment = get_environment(templates)
+    monkeypatch.setattr(environment, "compile", None)
+    assert render(templates, "list.tmpl", {"items": [1]}) == "\n1\n"
+    trimmed = get_environment(templates, trim_blocks=True)
+    monkeypatch.setattr(trimmed, "compile", None)
+    assert render(templates, "list.tmpl", {"items": [1]},
+                  trim_blocks=True) == "1\n"
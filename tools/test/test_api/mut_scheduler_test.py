@@ -0,0 +1,298 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import pty
+from time import time, sleep
+from threading import Thread, Lock, Event
+import pytest
+from mock import patch
+from tools.mut_scheduler import MutScheduler, MutDetector
+from tools.test_api import SingleTestRunner
+
+"""
+Tests for mut_scheduler.py, with simulated MUTs
+"""
+
+def fake_muts(tmpdir, count, hub=None):
+    """
+    MUTs with a directory as their disk
+    """
+    muts = {}
+    for index in range(1, count + 1):
+        disk = tmpdir.mkdir("disk%d" % index)
+        muts[index] = {"mcu": "K64F", "disk": str(disk),
+                       "port": "/dev/ttyACM%d" % index}
+        if hub:
+            muts[index]["hub"] = hub
+    return muts
+
+
+class Board(object):
+    """
+    A simulated board: a directory as its disk, and a pseudo-terminal as its
+    serial port, printing the name of every image copied to the disk
+    """
+    def __init__(self, tmpdir, name, mcu="K64F"):
+        self.name = name
+        self.disk = str(tmpdir.mkdir(name))
+        self.master, slave = pty.openpty()
+        self.port = os.ttyname(slave)
+        self.slave = slave
+        self.mut = {"mcu": mcu, "disk": self.disk, "port": self.port,
+                    "target_id": "0240%s" % name}
+        self._stopped = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        seen = set()
+        while not self._stopped.wait(0.01):
+            for image in sorted(set(os.listdir(self.disk)) - seen):
+                seen.add(image)
+                os.write(self.master, "{{%s;%s}}\n" % (self.name, image))
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def flash_and_read(name):
+    """
+    A job copying the image *name* to the MUT and reading the line its serial
+    port prints
+    """
+    def job(mut):
+        fd = os.open(mut["port"], os.O_RDONLY | os.O_NOCTTY)
+        try:
+            with open("%s/%s" % (mut["disk"], name), "w") as image:
+                image.write(name)
+            line = ""
+            while not line.endswith("\n"):
+                line += os.read(fd, 64)
+        finally:
+            os.close(fd)
+        return line.strip()
+    return job
+
+
+def flash(name, delay=0.1):
+    """
+    A job copying the image *name* to the MUT
+    """
+    def job(mut):
+        sleep(delay)
+        with open("%s/%s" % (mut["disk"], name), "w") as fd:
+            fd.write(name)
+        return (mut["port"], name)
+    return job
+
+
+def test_jobs_run_on_all_muts_at_once(tmpdir):
+    """
+    Test that the MUTs run their jobs concurrently, and every MUT its own
+    jobs in order
+    """
+    muts = fake_muts(tmpdir, 4)
+    scheduler = MutScheduler(muts)
+    start = time()
+    jobs = [scheduler.submit(mut_id, flash("test%d.bin" % test))
+            for test in range(2) for mut_id in muts]
+    scheduler.join()
+    assert time() - start < 0.6
+    assert [job.wait() for job in jobs[:4]] == [
+        ("/dev/ttyACM%d" % i, "test0.bin") for i in range(1, 5)]
+    for mut in muts.values():
+        assert sorted(os.listdir(mut["disk"])) == ["test0.bin", "test1.bin"]
+
+
+def test_hub_limit(tmpdir):
+    """
+    Test that at most hub_limit MUTs of a hub are used at once
+    """
+    lock = Lock()
+    running = [0, 0]
+
+    def job(mut):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    muts = fake_muts(tmpdir, 6, hub="hub1")
+    scheduler = MutScheduler(muts, hub_limit=2)
+    for mut_id in muts:
+        scheduler.submit(mut_id, job)
+    scheduler.join()
+    assert running[1] == 2
+
+
+def test_back_pressure(tmpdir):
+    """
+    Test that submitting blocks while the queue of the MUT is full
+    """
+    muts = fake_muts(tmpdir, 1)
+    scheduler = MutScheduler(muts, queue_size=1)
+    release = Event()
+    scheduler.submit(1, lambda mut: release.wait())
+    sleep(0.05)
+    # One job runs, and one waits in the queue
+    scheduler.submit(1, lambda mut: None)
+    submitter = Thread(target=scheduler.submit, args=(1, lambda mut: None))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+    release.set()
+    submitter.join(1)
+    assert not submitter.is_alive()
+    scheduler.join()
+
+
+def test_errors_are_raised_by_join(tmpdir):
+    """
+    Test that an error of a job fails the run, without stopping other jobs
+    """
+    def fail(mut):
+        raise IOError("disk gone")
+
+    muts = fake_muts(tmpdir, 2)
+    scheduler = MutScheduler(muts)
+    scheduler.submit(1, fail)
+    other = scheduler.submit(2, flash("test.bin", 0))
+    with pytest.raises(IOError):
+        scheduler.join()
+    assert other.wait() == ("/dev/ttyACM2", "test.bin")
+
+
+def test_detector_shares_detections():
+    """
+    Test that a MUT is found once it appears, and that waiting threads share
+    the detections
+    """
+    calls = []
+
+    def detect():
+        calls.append(time())
+        if len(calls) < 3:
+            return {}
+        return {1: {"mcu": "NUCLEO_F401RE"}, 2: {"mcu": "K64F"}}
+
+    detector = MutDetector(detect, min_interval=0.02, max_interval=0.05,
+                           timeout=5)
+    found = []
+    waiters = [Thread(target=lambda: found.append(
+        detector.wait_for({"mcu": "K64F"}))) for _ in range(8)]
+    for waiter in waiters:
+        waiter.start()
+    for waiter in waiters:
+        waiter.join()
+    assert found == [{"mcu": "K64F"}] * 8
+    assert len(calls) < 8
+
+    detector.timeout = 0.1
+    assert detector.wait_for({"mcu": "LPC1768"}) is None
+
+
+def test_schedule_adds_results(tmpdir):
+    """
+    Test that scheduled tests fill the test summaries of SingleTestRunner
+    """
+    muts = fake_muts(tmpdir, 3)
+    runner = SingleTestRunner(_muts=muts)
+    runner.test_summary = []
+    runner.test_summary_ext = {"K64F": {"GCC_ARM": {}}}
+    runner.mut_scheduler = MutScheduler(muts)
+
+    def handle_mut(mut, data, target_name, toolchain_name, test_loops=1):
+        sleep(0.05)
+        return (("OK", mut["port"], toolchain_name, data["test_id"]),
+                {0: {"result": "OK"}})
+
+    with patch.object(runner, "handle_mut", side_effect=handle_mut):
+        for test_id in ("MBED_A1", "MBED_A2"):
+            runner.schedule(runner.shape_test_request("K64F", "image.bin",
+                                                      test_id),
+                            "K64F", "GCC_ARM")
+        runner.mut_scheduler.join()
+
+    assert len(runner.test_summary) == 6
+    assert sorted(set(r[3] for r in runner.test_summary)) == [
+        "MBED_A1", "MBED_A2"]
+    results = runner.test_summary_ext["K64F"]["GCC_ARM"]
+    assert len(results["MBED_A1"]) == 3
+    assert len(results["MBED_A2"]) == 3
+
+
+def test_detector_finds_the_same_board():
+    """
+    Test that a MUT is found again by its target ID, or else its disk or
+    port, among boards of the same target, and only by its target when there
+    is a single such board
+    """
+    board_a = {"mcu": "K64F", "disk": "/mnt/a", "port": "/dev/ttyACM0",
+               "target_id": "0240A"}
+    board_b = {"mcu": "K64F", "disk": "/mnt/b", "port": "/dev/ttyACM1",
+               "target_id": "0240B"}
+    other = {"mcu": "NUCLEO_F401RE", "disk": "/mnt/c", "port": "/dev/ttyACM2"}
+    # Remounted in another order
+    muts = {1: dict(board_b, disk="/mnt/d"), 2: board_a, 3: other}
+    assert MutDetector.find(board_a, muts) is board_a
+    assert MutDetector.find(board_b, muts)["disk"] == "/mnt/d"
+    assert MutDetector.find(dict(board_a, target_id=None), muts) is board_a
+    assert MutDetector.find({"mcu": "K64F", "port": "/dev/ttyACM1"},
+                            muts)["target_id"] == "0240B"
+    assert MutDetector.find({"mcu": "K64F"}, muts) is None
+    assert MutDetector.find({"mcu": "NUCLEO_F401RE"}, muts) is other
+    assert MutDetector.find(dict(board_a, target_id="0240E"), muts) is None
+
+
+def test_boards_of_the_same_target(tmpdir):
+    """
+    Test that MUTs of the same target, redetected between tests, each flash
+    and read their own board
+    """
+    boards = [Board(tmpdir, name) for name in ("A", "B", "C")]
+    try:
+        muts = dict((index, board.mut) for index, board in enumerate(boards))
+        # The boards are listed in another order than in the MUTs
+        detector = MutDetector(
+            lambda: dict((index, boards[-1 - index].mut)
+                         for index in range(len(boards))),
+            min_interval=0.01, timeout=5)
+        scheduler = MutScheduler(muts)
+
+        def run(name):
+            def job(mut):
+                return flash_and_read(name)(detector.wait_for(mut))
+            return job
+
+        jobs = dict(((mut_id, test), scheduler.submit(mut_id, run(test)))
+                    for test in ("test0.bin", "test1.bin")
+                    for mut_id in muts)
+        scheduler.join()
+        for (mut_id, test), job in jobs.items():
+            assert job.wait() == "{{%s;%s}}" % (boards[mut_id].name, test)
+        for board in boards:
+            assert sorted(os.listdir(board.disk)) == ["test0.bin", "test1.bin"]
+    finally:
+        for board in boards:
+            board.close()
@@ -15,10 +15,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
+import sys
 import pytest
+from subprocess import Popen, PIPE
 from mock import patch
 from tools.targets import set_targets_json_location
-from tools.test_api import find_tests, build_tests
+from tools.test_api import find_tests, build_tests, build_test_worker,\
+    shared_objects_match, can_share_objects, SHARED_OBJECTS_DIR,\
+    SingleTestRunner, ProcessObserver
+from tools.build_api import prepare_toolchain, scan_resources
+from tools.utils import ToolException
 
 """
 Tests for test_api.py
@@ -91,3 +98,181 @@ def test_find_tests_app_config(build_path, target, toolchain_name, app_config):
                 "build_tests was not called with app_config"
             assert args[1]['app_config'] == app_config,\
                 "build_tests was called with an incorrect app_config"
+
+
+@pytest.mark.parametrize("build_path", ["build_path"])
+@pytest.mark.parametrize("target", ["K64F"])
+@pytest.mark.parametrize("toolchain_name", ["ARM"])
+def test_build_tests_shared_objects(build_path, target, toolchain_name):
+    """
+    Test that build_tests compiles the base sources once and builds each test
+    against the shared object pool
+
+    :param build_path: dummy value for the build directory
+    :param target: the target to "test" for
+    :param toolchain_name: the toolchain to use for "testing"
+    """
+    tests = {'test1': 'test1_path','test2': 'test2_path'}
+    src_paths = ['.']
+    shared_path = os.path.join(build_path, SHARED_OBJECTS_DIR)
+    set_targets_json_location()
+    with patch('tools.test_api.build_library') as mock_build_library,\
+         patch('tools.test_api.build_project') as mock_build_project,\
+         patch('tools.test_api.can_share_objects', return_value=True):
+        mock_build_project.return_value = "build_project"
+
+        build_tests(tests, src_paths, build_path, target, toolchain_name,
+                    shared_objects=True)
+
+        assert mock_build_library.call_count == 1
+        lib_args = mock_build_library.call_args
+        assert lib_args[0][0] == src_paths
+        assert lib_args[0][1] == shared_path
+        assert not lib_args[1]['archive']
+
+
+@pytest.mark.parametrize("build_path", ["build_path"])
+@pytest.mark.parametrize("target", ["K64F"])
+@pytest.mark.parametrize("toolchain_name", ["ARM"])
+def test_build_tests_shared_objects_fail(build_path, target, toolchain_name):
+    """
+    Test that build_tests reports a failure of the shared object pool as a
+    failed build, without building the tests
+
+    :param build_path: dummy value for the build directory
+    :param target: the target to "test" for
+    :param toolchain_name: the toolchain to use for "testing"
+    """
+    tests = {'test1': 'test1_path','test2': 'test2_path'}
+    set_targets_json_location()
+    with patch('tools.test_api.build_library',
+               side_effect=ToolException("compile error")),\
+         patch('tools.test_api.build_project') as mock_build_project:
+        result, test_build = build_tests(tests, ['.'], build_path, target,
+                                         toolchain_name, shared_objects=True)
+
+        assert not result
+        assert test_build['tests'] == {}
+        assert not mock_build_project.called
+
+
+@pytest.mark.parametrize("matches", [True, False])
+def test_build_test_worker_shared_objects(matches):
+    """
+    Test that a test is built from the full sources, without trying the
+    shared object pool first, when the pool does not match the configuration
+    of the test
+
+    :param matches: whether the shared object pool matches the test build
+    """
+    with patch('tools.test_api.build_project') as mock_build_project,\
+         patch('tools.test_api.can_share_objects', return_value=matches):
+        mock_build_project.return_value = "test.bin"
+        ret = build_test_worker(
+            ['shared', 'test1_path'], 'build_path', 'K64F', 'ARM',
+            report=None, project_id='test1', toolchain_paths={},
+            shared_objects_path='shared',
+            full_src_paths=['.', 'test1_path'])
+
+        assert ret['result']
+        calls = mock_build_project.call_args_list
+        assert len(calls) == 1
+        if matches:
+            assert calls[0][0][0] == ['shared', 'test1_path']
+        else:
+            assert calls[0][0][0] == ['.', 'test1_path']
+        for call in calls:
+            assert 'shared_objects_path' not in call[1]
+            assert 'full_src_paths' not in call[1]
+
+
+def test_shared_objects_match(tmpdir):
+    """
+    Test the comparison of configuration header and build profiles between
+    the shared object pool and a test build
+    """
+    shared = tmpdir.mkdir("shared")
+    test = tmpdir.mkdir("test")
+    for build_dir in (shared, test):
+        build_dir.join("mbed_config.h").write("#define FOO 1\n")
+        build_dir.join(".profile-c").write("['-Os']")
+    assert shared_objects_match(str(shared), str(test))
+    test.join("mbed_config.h").write("#define FOO 2\n")
+    assert not shared_objects_match(str(shared), str(test))
+    test.join("mbed_config.h").remove()
+    assert not shared_objects_match(str(shared), str(test))
+
+
+def test_can_share_objects(tmpdir):
+    """
+    Test that the configuration of a test is compared with the shared object
+    pool before the test is built
+    """
+    set_targets_json_location()
+    shared = tmpdir.mkdir("shared")
+    src = tmpdir.mkdir("src")
+    src.join("main.c").write("int main(void) { return 0; }\n")
+    src.join("mbed_lib.json").write(
+        '{"name": "lib", "config": {"foo": {"value": 1}}}')
+    # The files of the pool, as compile_sources generates them
+    toolchain = prepare_toolchain([str(src)], str(shared), "K64F", "GCC_ARM",
+                                  silent=True)
+    scan_resources([str(src)], toolchain)
+    toolchain.get_config_header()
+    toolchain.dump_build_profile()
+
+    same = tmpdir.mkdir("same")
+    same.join("test.c").write("void test(void) {}\n")
+    assert can_share_objects(str(shared), [str(src), str(same)], "K64F",
+                               "GCC_ARM")
+    assert not can_share_objects(str(shared), [str(src), str(same)],
+                                   "K64F", "GCC_ARM", macros=["BAR"])
+
+    changed = tmpdir.mkdir("changed")
+    changed.join("mbed_app.json").write(
+        '{"target_overrides": {"*": {"lib.foo": 2}}}')
+    assert not can_share_objects(str(shared), [str(src), str(changed)],
+                                   "K64F", "GCC_ARM")
+    assert sorted(os.listdir(str(changed))) == ["mbed_app.json"]
+
+
+def host_test_output(text, duration=10):
+    """
+    Collect the output of a process printing *text*, as run_host_test does
+    """
+    proc = Popen([sys.executable, "-c",
+                  "import sys; sys.stdout.write(%r)" % text], stdout=PIPE)
+    obs = ProcessObserver(proc)
+    try:
+        return SingleTestRunner().get_host_test_output(obs, duration)
+    finally:
+        obs.stop()
+
+
+@pytest.mark.parametrize("end", ["{end}\n", "mbed assertation failed: x\r"])
+def test_host_test_output_end(end):
+    """
+    Test that the output is collected up to the end of the test, and one
+    character more
+    """
+    lines = "".join("line %d\n" % i for i in range(2000))
+    output, _, _ = host_test_output(lines + end + "after")
+    if end.startswith("{end}"):
+        assert output == lines + end + "a"
+    else:
+        assert output == lines + end + "{{mbed_assert}}a"
+
+
+def test_host_test_output_properties():
+    """
+    Test the detection of the timeout property, and the filtering of non
+    ASCII characters
+    """
+    output, _, duration = host_test_output(
+        "HOST: Reset target...\n"
+        "HOST: Property 'timeout' = '20'\n"
+        "HOST: Property 'timeout' = '30'\n"
+        "caf\xe9\n{end}")
+    assert duration == 20
+    assert "caf \n" in output
+    assert output.endswith("{end}")
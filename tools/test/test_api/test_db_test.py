@@ -0,0 +1,163 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import sqlite3
+from tools.test_api import factory_db_logger
+from tools.test_sqlite import SQLiteDBAccess
+
+"""
+Tests for the buffered test database logger, with the SQLite backend
+"""
+
+
+class CountingCursor(object):
+    """A cursor that counts the statements executed through it"""
+    def __init__(self, cursor, counts):
+        self._cursor = cursor
+        self._counts = counts
+
+    def execute(self, query, *args):
+        self._counts.append(query.split()[0].upper())
+        return self._cursor.execute(query, *args)
+
+    def executemany(self, query, rows):
+        self._counts.append("EXECUTEMANY")
+        return self._cursor.executemany(query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection(object):
+    """A connection whose cursors count the statements executed"""
+    def __init__(self, connection):
+        self._connection = connection
+        self.statements = []
+
+    def cursor(self):
+        return CountingCursor(self._connection.cursor(), self.statements)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def make_logger(tmpdir):
+    db = SQLiteDBAccess()
+    db.connect_url("sqlite://%s" % tmpdir.join("results.db"))
+    assert db.is_connected()
+    db.db_object = CountingConnection(db.db_object)
+    return db
+
+
+def insert_entries(db, build_id, count, test_result="OK"):
+    for index in range(count):
+        db.insert_test_entry(build_id, "K64F", "GCC_ARM", "SingleTest",
+                             "MBED_A%d" % (index % 3), test_result,
+                             "output %d" % index, 1.234, 10, index)
+
+
+def count_entries(db):
+    return db.select_all("SELECT COUNT(*) AS count FROM mtest_test_entry")[0]["count"]
+
+
+def test_entries_are_written_in_one_batch(tmpdir):
+    """Test entries are buffered until TEST_ENTRY_BUFFER_SIZE, and then written
+    with a single multi-row INSERT"""
+    db = make_logger(tmpdir)
+    db.TEST_ENTRY_BUFFER_SIZE = 10
+    build_id = db.get_next_build_id("host")
+    insert_entries(db, build_id, 9)
+    assert count_entries(db) == 0
+    insert_entries(db, build_id, 1)
+    assert count_entries(db) == 10
+    assert db.db_object.statements.count("EXECUTEMANY") == 1
+    assert not db.test_entries
+
+
+def test_entries_are_written_after_the_interval(tmpdir):
+    """Test entries older than TEST_ENTRY_FLUSH_INTERVAL are written with the
+    next entry"""
+    db = make_logger(tmpdir)
+    db.TEST_ENTRY_FLUSH_INTERVAL = 60.0
+    build_id = db.get_next_build_id("host")
+    insert_entries(db, build_id, 2)
+    assert count_entries(db) == 0
+    db.test_entries_time -= 60.0
+    insert_entries(db, build_id, 1)
+    assert count_entries(db) == 3
+
+
+def test_table_entries_are_cached(tmpdir):
+    """The primary key of a name is read or inserted once"""
+    db = make_logger(tmpdir)
+    build_id = db.get_next_build_id("host")
+    insert_entries(db, build_id, 30)
+    db.flush_test_entries()
+    del db.db_object.statements[:]
+    insert_entries(db, build_id, 30)
+    db.flush_test_entries()
+    assert db.db_object.statements == ["EXECUTEMANY"]
+    rows = db.select_all("""SELECT mtest_test_id_name AS name, COUNT(*) AS count
+                              FROM mtest_test_entry JOIN mtest_test_id
+                                ON mtest_test_id_fk = mtest_test_id_pk
+                          GROUP BY mtest_test_id_name""")
+    assert sorted((row["name"], row["count"]) for row in rows) == [
+        ("MBED_A0", 20), ("MBED_A1", 20), ("MBED_A2", 20)]
+
+
+def test_existing_table_entries_are_reused(tmpdir):
+    """A name inserted by another logger is not inserted again"""
+    first = make_logger(tmpdir)
+    second = make_logger(tmpdir)
+    pk = first.get_table_entry_pk("mtest_target", "mtest_target_name", "K64F")
+    assert second.update_table_entry("mtest_target", "mtest_target_name",
+                                     "K64F") == pk
+    assert second.get_table_entry_pk("mtest_target", "mtest_target_name",
+                                     "K64F") == pk
+    assert len(first.select_all("SELECT * FROM mtest_target")) == 1
+
+
+def test_disconnect_writes_buffered_entries(tmpdir):
+    """Entries still buffered are written when disconnecting, and when
+    writing while disconnected"""
+    db = make_logger(tmpdir)
+    build_id = db.get_next_build_id("host")
+    insert_entries(db, build_id, 5)
+    db.disconnect()
+    assert not db.is_connected()
+    insert_entries(db, build_id, 5)
+    db.flush_test_entries()
+    assert not db.is_connected()
+    db.reconnect()
+    assert count_entries(db) == 10
+
+
+def test_factory_db_logger(tmpdir):
+    """sqlite:// connection strings log to a SQLite file"""
+    path = str(tmpdir.join("factory.db"))
+    db = factory_db_logger("sqlite://%s" % path)
+    assert isinstance(db, SQLiteDBAccess)
+    db.connect_url("sqlite://%s" % path)
+    build_id = db.get_next_build_id("host", desc="it's")
+    insert_entries(db, build_id, 3, test_result="FAIL")
+    db.update_build_id_info(build_id, _status_fk=db.BUILD_ID_STATUS_COMPLETED)
+    db.disconnect()
+    rows = sqlite3.connect(path).execute(
+        """SELECT mtest_build_id_desc, mtest_build_id_status_fk, mtest_test_result_name
+             FROM mtest_test_entry
+             JOIN mtest_build_id ON mtest_build_id_fk = mtest_build_id_pk
+             JOIN mtest_test_result ON mtest_test_result_fk = mtest_test_result_pk""").fetchall()
+    assert rows == [("it's", db.BUILD_ID_STATUS_COMPLETED, "FAIL")] * 3
@@ -1,6 +1,9 @@
 """Tests for the toolchain sub-system"""
 import sys
 import os
+import json
+import time
+import pytest
 from string import printable
 from copy import deepcopy
 from mock import MagicMock, patch
@@ -14,6 +17,10 @@ sys.path.insert(0, ROOT)
 from tools.toolchains import TOOLCHAIN_CLASSES, LEGACY_TOOLCHAIN_NAMES,\
     Resources, TOOLCHAIN_PATHS, mbedToolchain
 from tools.targets import TARGET_MAP
+from tools.toolchains.compile_cache import CompileCache
+from tools.toolchains.dependency_db import DependencyDB
+from tools.toolchains.build_timer import BuildTimer
+from tools.utils import ToolException
 
 def test_instantiation():
     """Test that all exported toolchain may be instantiated"""
@@ -194,3 +201,284 @@ def test_path_specified_gcc(gcc_loc, exists_at_loc, exists_in_path):
                 assert TOOLCHAIN_PATHS['GCC_ARM'] == gcc_loc
             elif exists_in_path:
                 assert TOOLCHAIN_PATHS['GCC_ARM'] == ''
+
+
+def test_scan_cache(tmpdir):
+    """Test that a second scan of an unchanged tree is served from the scan
+    cache, and that only changed directories are listed again"""
+    src = tmpdir.mkdir("src")
+    src.join("main.cpp").write("")
+    src.join(".mbedignore").write("ignored/*\n")
+    src.mkdir("ignored").join("ignored.c").write("")
+    src.mkdir("TARGET_K64F").join("k64f.c").write("")
+    src.mkdir("TARGET_NOT_A_TARGET").join("nope.c").write("")
+    src.mkdir("FEATURE_FOO").join("foo.h").write("")
+    lib = src.mkdir("lib")
+    lib.join("lib.h").write("")
+    build = tmpdir.mkdir("build")
+
+    def scan():
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"],
+                                                 build_dir=str(build))
+        toolchain.progress = MagicMock()
+        return toolchain.scan_resources(str(src))
+
+    def fields(res):
+        return (sorted(res.inc_dirs), sorted(res.headers),
+                sorted(res.c_sources), sorted(res.cpp_sources),
+                sorted(res.file_basepath.items()), sorted(res.features),
+                sorted(res.features["FOO"].headers))
+
+    expected = fields(scan())
+    assert build.join(mbedToolchain.SCAN_CACHE_FILE_NAME).check()
+    assert os.path.join(str(src), "main.cpp") in expected[3]
+    assert os.path.join(str(src), "TARGET_K64F", "k64f.c") in expected[2]
+    assert len(expected[2]) == 1
+
+    with patch('tools.toolchains.scan_cache.listdir') as _listdir:
+        assert fields(scan()) == expected
+        assert not _listdir.called
+
+    lib.join("new.h").write("")
+    with patch('tools.toolchains.scan_cache.listdir',
+               side_effect=os.listdir) as _listdir:
+        res = scan()
+        _listdir.assert_called_once_with(str(lib))
+        assert os.path.join(str(lib), "new.h") in res.headers
+
+
+def _compile_jobs(count):
+    return [{'source': 'file%d.c' % i, 'object': 'file%d.o' % i,
+             'commands': [['cc', 'file%d.c' % i]], 'work_dir': None,
+             'chroot': None} for i in range(count)]
+
+
+def _slow_run_cmd(command, work_dir=None, chroot=None):
+    if command[-1] == 'file0.c':
+        time.sleep(30)
+    return "", "", 0
+
+
+def test_compile_queue():
+    """Test that compile_queue handles every job, in completion order"""
+    with patch('tools.utils.run_cmd', return_value=("", "", 0)):
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"],
+                                                 notify=MagicMock())
+        toolchain.jobs = 4
+        toolchain.compiled = 0
+        toolchain.to_be_compiled = 20
+        objects = toolchain.compile_queue(_compile_jobs(20), [])
+        assert sorted(objects) == sorted('file%d.o' % i for i in range(20))
+        assert toolchain.compiled == 20
+        assert sorted(job['name'] for job in toolchain.timer.compiles) == \
+            sorted('file%d.c' % i for i in range(20))
+
+
+def test_compile_queue_error():
+    """Test that compile_queue aborts on the first failed compile"""
+    with patch('tools.utils.run_cmd', return_value=("", "error", 1)):
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"],
+                                                 notify=MagicMock())
+        toolchain.jobs = 4
+        toolchain.compiled = 0
+        toolchain.to_be_compiled = 20
+        with pytest.raises(ToolException):
+            toolchain.compile_queue(_compile_jobs(20), [])
+        assert toolchain.compiled == 1
+
+
+def test_compile_queue_timeout():
+    """Test that compile_queue enforces the wall clock compile timeout"""
+    with patch('tools.utils.run_cmd', side_effect=_slow_run_cmd):
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"],
+                                                 notify=MagicMock())
+        toolchain.jobs = 2
+        toolchain.compiled = 0
+        toolchain.to_be_compiled = 4
+        toolchain.compile_timeout = 0.5
+        start = time.time()
+        with pytest.raises(ToolException):
+            toolchain.compile_queue(_compile_jobs(4), [])
+        assert time.time() - start < 10
+
+
+def test_compile_cache(tmpdir):
+    """Test that objects in the compile cache are shared between build
+    directories and invalidated by changes to their dependencies"""
+    src = tmpdir.mkdir("src")
+    source = src.join("main.c")
+    source.write("#include \"main.h\"\n")
+    header = src.join("main.h")
+    header.write("#define FOO 1\n")
+    cache = CompileCache(str(tmpdir.join("cache")), 1024 * 1024)
+
+    def compile_in(build_dir):
+        obj = os.path.join(build_dir, "main.o")
+        dep_path = os.path.join(build_dir, "main.d")
+        config = os.path.join(build_dir, "mbed_config.h")
+        with open(config, "w") as config_file:
+            config_file.write("#define BAR 1\n")
+        commands = [["cc", "-DMBED_BUILD_TIMESTAMP=%s" % time.time(),
+                     "-include", config, "-o", obj, str(source)]]
+        return cache.get_key(commands, str(source), build_dir), obj, dep_path
+
+    first = str(tmpdir.mkdir("build1"))
+    key, obj, dep_path = compile_in(first)
+    assert not cache.fetch(key, obj, dep_path, first)
+    with open(obj, "w") as obj_file:
+        obj_file.write("object")
+    deps = [str(source), str(header), os.path.join(first, "mbed_config.h")]
+    with open(dep_path, "w") as dep_file:
+        dep_file.write("%s: %s\n" % (obj, " ".join(deps)))
+    cache.store(key, obj, dep_path, deps, first)
+
+    second = str(tmpdir.mkdir("build2"))
+    other_key, obj, dep_path = compile_in(second)
+    assert other_key == key
+    assert cache.fetch(key, obj, dep_path, second)
+    assert open(obj).read() == "object"
+    assert os.path.join(second, "mbed_config.h") in open(dep_path).read()
+    assert first not in open(dep_path).read()
+
+    header.write("#define FOO 2\n")
+    cache = CompileCache(cache.path, cache.max_size)
+    assert not cache.fetch(key, obj, dep_path, second)
+    assert cache.report == {"hits": 0, "misses": 1, "stored": 0}
+
+    cache.max_size = 0
+    cache.cleanup()
+    assert not any(files for _, _, files in
+                   os.walk(os.path.join(cache.path, "objects")))
+
+def test_dependency_db(tmpdir):
+    """Test that dependency files are only parsed again when they change,
+    and that the parsed dependencies persist between builds"""
+    dep_path = str(tmpdir.join("main.d"))
+    with open(dep_path, "w") as dep_file:
+        dep_file.write("main.o: main.c main.h\n")
+    db_file = str(tmpdir.join(".dependencies.json"))
+    parse = MagicMock(return_value=["main.c", "main.h"])
+
+    db = DependencyDB(db_file)
+    assert db.get(dep_path, parse) == ["main.c", "main.h"]
+    assert db.get(dep_path, parse) == ["main.c", "main.h"]
+    assert parse.call_count == 1
+    assert db.get(str(tmpdir.join("missing.d")), parse) == []
+    db.save()
+
+    db = DependencyDB(db_file)
+    assert db.get(dep_path, parse) == ["main.c", "main.h"]
+    assert parse.call_count == 1
+
+    mtime = os.stat(dep_path).st_mtime
+    os.utime(dep_path, (mtime + 10, mtime + 10))
+    parse.return_value = ["main.c"]
+    assert db.get(dep_path, parse) == ["main.c"]
+    assert parse.call_count == 2
+
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+    toolchain.build_dir = str(tmpdir)
+    toolchain.stat_cache = {}
+    assert toolchain.need_update(dep_path, [dep_path])
+    assert toolchain.need_update(dep_path, [str(tmpdir.join("missing.h"))])
+    assert not toolchain.need_update(dep_path, [db_file])
+
+def test_mbedignore_scope(tmpdir):
+    """Test that patterns of an .mbedignore file apply to its own directory
+    only, and that patterns found later are merged with earlier ones"""
+    for path in ["a/x.c", "a/y.c", "a/sub/x.c", "b/x.c", "b/sub/z.c", "c/x.c"]:
+        tmpdir.join(path).ensure()
+    tmpdir.join("a", ".mbedignore").write("x.c\n# comment\n\nsub/*\n")
+    tmpdir.join("b", ".mbedignore").write("*/z.c\n")
+    tmpdir.join(".mbedignore").write("c/*\n")
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+    res = toolchain.scan_resources(str(tmpdir))
+    assert sorted(os.path.relpath(f, str(tmpdir)) for f in res.c_sources) == \
+        [os.path.join("a", "y.c"), os.path.join("b", "x.c")]
+    assert toolchain.is_ignored(os.path.join("a", "x.c"))
+    assert not toolchain.is_ignored(os.path.join("b", "x.c"))
+    assert toolchain.is_ignored(os.path.join("b", "sub", "z.c"))
+    assert not toolchain.is_ignored(os.path.join("b", "z.c"))
+
+def test_scan_trees(tmpdir):
+    """Test that trees and features scanned at the same time give the same
+    resources as scanning them one after another"""
+    for root in ["lib1", "lib2", "lib3"]:
+        for path in ["x.c", "inc/x.h", "FEATURE_A/a.c", "FEATURE_B/b.c",
+                     "TARGET_K64F/k.c", "TARGET_LPC1768/l.c"]:
+            tmpdir.join(root, path).ensure()
+    tmpdir.join("lib2", "private", "p.h").ensure()
+    tmpdir.join("lib2", ".mbedignore").write("private/*\n")
+    paths = [str(tmpdir.join(root)) for root in ["lib1", "lib2", "lib3"]]
+
+    def scan(parallel):
+        toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+        if parallel:
+            resources = toolchain.scan_trees(
+                [(path, None, False) for path in paths], 3)
+            for res in resources:
+                toolchain.scan_features(res, ["A", "B", "C"], 2)
+                assert not res.features.lazy
+        else:
+            resources = [toolchain.scan_resources(path) for path in paths]
+        return toolchain, [(res.c_sources, res.headers, res.inc_dirs,
+                            sorted((name, res.features[name].c_sources)
+                                   for name in sorted(res.features)))
+                           for res in resources]
+
+    sequential, expected = scan(False)
+    parallel, result = scan(True)
+    assert result == expected
+    assert parallel.ignore_patterns == sequential.ignore_patterns
+
+def test_resources_copy(tmpdir):
+    """Test that a copy of resources, including its features, is independent
+    of the original and that add merges every list"""
+    for path in ["a.c", "b.h", "FEATURE_X/x.c"]:
+        tmpdir.join(path).ensure()
+    toolchain = TOOLCHAIN_CLASSES["GCC_ARM"](TARGET_MAP["K64F"])
+    res = toolchain.scan_resources(str(tmpdir))
+    res.features["X"]
+    other = deepcopy(res)
+    other.c_sources.append("new.c")
+    other.features["X"].c_sources.append("new.c")
+    other.file_basepath["new.c"] = "."
+    assert "new.c" not in res.c_sources
+    assert "new.c" not in res.features["X"].c_sources
+    assert "new.c" not in res.file_basepath
+
+    merged = Resources()
+    merged.add(res)
+    merged.add(other)
+    assert merged.c_sources == res.c_sources + other.c_sources
+    assert merged.headers == res.headers * 2
+    assert "new.c" in merged.file_basepath
+
+def test_build_timer(tmpdir):
+    """Test that nested spans and compiles are exported as a Chrome trace and
+    summarized by phase"""
+    timer = BuildTimer()
+    with timer.span("compile"):
+        with timer.span("post-binary hook"):
+            pass
+        timer.add_compile("main.c", time.time(), 0.5, 1234)
+    with pytest.raises(ValueError):
+        with timer.span("link"):
+            raise ValueError
+    assert sorted(timer.totals()) == ["compile", "link"]
+
+    trace = str(tmpdir.join("trace.json"))
+    timer.write_trace(trace)
+    events = json.load(open(trace))["traceEvents"]
+    complete = dict((e["name"], e) for e in events if e["ph"] == "X")
+    assert sorted(complete) == ["compile", "link", "main.c",
+                                "post-binary hook"]
+    assert complete["main.c"]["tid"] == 1234
+    assert complete["main.c"]["dur"] == 500000
+    outer, inner = complete["compile"], complete["post-binary hook"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+    summary = timer.summary()
+    assert "  post-binary hook" in summary
+    assert "main.c" in summary
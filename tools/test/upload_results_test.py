@@ -0,0 +1,184 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import gzip
+import json
+import threading
+from argparse import Namespace
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import pytest
+from tools.upload_results import create_session, upload_project_runs
+
+"""
+Tests for uploading project runs, against a local server
+"""
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.lock = threading.Lock()
+        self.parts = []
+        self.clients = set()
+        self.api_keys = set()
+        # Number of error responses to send before accepting a part, by name
+        self.failures = {}
+        self.failure_status = 503
+        # Content-Encoding of every part received
+        self.encodings = []
+        # Whether gzipped parts are answered with 415 responses
+        self.reject_gzip = False
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        part = json.loads(body)
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            server.api_keys.add(self.headers.get("X-Api-Key"))
+            server.encodings.append(encoding)
+            name = part["names"][0]
+            if encoding and server.reject_gzip:
+                status = 415
+            elif server.failures.get(name):
+                server.failures[name] -= 1
+                status = server.failure_status
+            else:
+                server.parts.append(part)
+                status = 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write("ok")
+
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    server.url = "http://127.0.0.1:%d/api/projectRuns" % server.server_address[1]
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_parts(count):
+    return [{"projectRuns": [{"project": "TEST_%d" % index}],
+             "names": ["TEST_%d" % index]} for index in range(count)]
+
+
+def upload(server, parts, **kwargs):
+    session = create_session(Namespace(api_key="key"), 4)
+    kwargs.setdefault("backoff", 0)
+    return upload_project_runs(session, server.url, parts, jobs=4, **kwargs)
+
+
+def names(server):
+    return sorted(part["names"][0] for part in server.parts)
+
+
+def test_upload_parts(server):
+    """Every part is uploaded uncompressed, over at most one connection per
+    job"""
+    parts = make_parts(20)
+    assert upload(server, parts)
+    assert names(server) == sorted(part["names"][0] for part in parts)
+    assert server.api_keys == set(["key"])
+    assert server.encodings == [None] * 20
+    assert len(server.clients) <= 4
+
+
+def test_upload_compressed(server):
+    """Parts may be sent gzipped"""
+    assert upload(server, make_parts(3), compress=True)
+    assert names(server) == ["TEST_0", "TEST_1", "TEST_2"]
+    assert server.encodings == ["gzip"] * 3
+
+
+def test_gzip_rejected(server):
+    """Once the server rejects a gzipped part, the parts are sent
+    uncompressed"""
+    server.reject_gzip = True
+    session = create_session(Namespace(api_key="key"), 1)
+    assert upload_project_runs(session, server.url, make_parts(3), jobs=1,
+                               backoff=0, compress=True)
+    assert names(server) == ["TEST_0", "TEST_1", "TEST_2"]
+    assert server.encodings == ["gzip", None, None, None]
+
+
+def test_retry_server_errors(server):
+    """Parts are sent again after 503 responses, up to the retries given"""
+    server.failures = {"TEST_1": 2}
+    assert upload(server, make_parts(3), retries=2)
+    assert names(server) == ["TEST_0", "TEST_1", "TEST_2"]
+    server.parts = []
+    server.failures = {"TEST_1": 2}
+    assert not upload(server, make_parts(3), retries=1)
+    assert names(server) == ["TEST_0", "TEST_2"]
+
+
+def test_no_retry_after_gateway_errors(server):
+    """Parts are not sent again after a gateway error, as the server may have
+    stored them"""
+    server.failures = {"TEST_1": 1}
+    server.failure_status = 502
+    assert not upload(server, make_parts(3), retries=2)
+    assert names(server) == ["TEST_0", "TEST_2"]
+    assert server.failures == {"TEST_1": 0}
+
+
+def test_resume_from_manifest(server, tmpdir):
+    """Uploading again with a manifest only sends the parts that failed, and
+    the manifest is removed once every part is uploaded"""
+    manifest = tmpdir.join("manifest.json")
+    parts = make_parts(6)
+    server.failures = {"TEST_2": 1, "TEST_4": 1}
+    assert not upload(server, parts, retries=0, manifest=str(manifest),
+                      build_id="1")
+    assert len(json.loads(manifest.read())["uploaded"]) == 4
+    server.parts = []
+    assert upload(server, parts, retries=0, manifest=str(manifest),
+                  build_id="1")
+    assert names(server) == ["TEST_2", "TEST_4"]
+    assert not manifest.exists()
+
+
+def test_manifest_of_other_build(server, tmpdir):
+    """A manifest of another build is ignored"""
+    manifest = tmpdir.join("manifest.json")
+    parts = make_parts(3)
+    server.failures = {"TEST_0": 1}
+    assert not upload(server, parts, retries=0, manifest=str(manifest),
+                      build_id="1")
+    server.parts = []
+    assert upload(server, parts, manifest=str(manifest), build_id="2")
+    assert names(server) == ["TEST_0", "TEST_1", "TEST_2"]
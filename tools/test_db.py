@@ -19,6 +19,7 @@ Author: Przemyslaw Wirkus <Przemyslaw.Wirkus@arm.com>
 
 import re
 import json
+from time import time
 
 
 class BaseDBAccess():
@@ -163,3 +164,210 @@ class BaseDBAccess():
             If some data is missing DB will be updated
         """
         pass
+
+
+class SQLDBAccess(BaseDBAccess):
+    """ Test database access through a DB-API 2.0 connection, shared by the
+        database backends
+
+        Test entries are buffered and written with one multi-row INSERT once
+        TEST_ENTRY_BUFFER_SIZE entries are buffered, or TEST_ENTRY_FLUSH_INTERVAL
+        seconds after the first of them. The connection is opened for the
+        write if needed. The primary keys of targets, toolchains, test types,
+        test ids and test results are cached once read. New names are added
+        by the insert_table_entry() of the backend: SQLite upserts them, and
+        MySQL upserts them only when the name column is a unique key (see
+        MySQLDBAccess.has_unique_key), locking the table otherwise. The
+        --db-add-unique-keys option of singletest.py adds the missing keys.
+
+        Backends set PARAM to the placeholder of their paramstyle, and
+        implement connect() and insert_table_entry().
+    """
+    def __init__(self):
+        BaseDBAccess.__init__(self)
+        self.PARAM = '%s'
+        # Test entries written at once, and seconds they may stay buffered
+        self.TEST_ENTRY_BUFFER_SIZE = 200
+        self.TEST_ENTRY_FLUSH_INTERVAL = 30.0
+        self.test_entries = []
+        self.test_entries_time = None
+        # Cached primary keys, by (table, value)
+        self.table_entry_pks = {}
+
+    def is_connected(self):
+        """ Returns True if we are connected to database
+        """
+        return self.db_object is not None
+
+    def reconnect(self):
+        """ Reconnects to DB and returns DB object using stored host name,
+            database name and credentials (user name and password)
+        """
+        self.connect(self.host, self.user, self.passwd, self.db)
+
+    def disconnect(self):
+        """ Writes the buffered test entries and closes DB connection
+        """
+        if self.db_object:
+            self.flush_test_entries()
+            self.db_object.close()
+        self.db_object = None
+        self.db_type = None
+
+    def execute(self, cur, query, args=None):
+        """ Execute query, with its PARAM placeholders replaced by args
+        """
+        if args is None:
+            # Queries without arguments may contain a literal %
+            cur.execute(query)
+        else:
+            cur.execute(query, args)
+
+    def select_all(self, query, args=None):
+        """ Execute SELECT query and get all results
+        """
+        cur = self.db_object.cursor()
+        self.execute(cur, query, args)
+        columns = [column[0] for column in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def insert(self, query, commit=True, args=None):
+        """ Execute INSERT query, define if you want to commit
+        """
+        con = self.db_object
+        cur = con.cursor()
+        self.execute(cur, query, args)
+        if commit:
+            con.commit()
+        return cur.lastrowid
+
+    def get_next_build_id(self, name, desc='', location='', type=None, status=None):
+        """ Insert new build_id (DB unique build like ID number to send all test results)
+        """
+        if status is None:
+            status = self.BUILD_ID_STATUS_STARTED
+
+        if type is None:
+            type = self.BUILD_ID_TYPE_TEST
+
+        table = self.TABLE_BUILD_ID
+        query = """INSERT INTO `%s` (%s_name, %s_desc, %s_location, %s_type_fk, %s_status_fk)
+                        VALUES (%s)"""% (table, table, table, table, table,
+                                         table, ', '.join([self.PARAM] * 5))
+        return self.insert(query, args=(name, desc, location, type, status))
+
+    def get_table_entry_pk(self, table, column, value, update_db=True):
+        """ Checks for entries in tables with two columns (<TABLE_NAME>_pk, <column>)
+            If update_db is True updates table entry if value in specified column doesn't exist
+        """
+        result = self.table_entry_pks.get((table, value))
+        if result is None:
+            table_pk = '%s_pk'% table
+            query = """SELECT `%s`
+                         FROM `%s`
+                        WHERE `%s`=%s"""% (table_pk, table, column, self.PARAM)
+            rows = self.select_all(query, (value,))
+            if rows:
+                result = rows[0][table_pk]
+            elif update_db:
+                # Update DB with new value
+                result = self.update_table_entry(table, column, value)
+            if result is not None:
+                self.table_entry_pks[(table, value)] = result
+        return result
+
+    def update_table_entry(self, table, column, value):
+        """ Inserts table entry if value in specified column doesn't exist, and
+            returns its primary key
+        """
+        con = self.db_object
+        cur = con.cursor()
+        result = self.insert_table_entry(cur, table, column, value)
+        con.commit()
+        return result
+
+    def insert_table_entry(self, cur, table, column, value):
+        """ Upsert of the entry with value in the column of table, returning
+            its primary key whether it was inserted or existed
+        """
+        pass
+
+    def update_build_id_info(self, build_id, **kw):
+        """ Update additional data inside build_id table
+            Examples:
+            db.update_build_id_info(build_id, _status_fk=self.BUILD_ID_STATUS_COMPLETED, _shuffle_seed=0.0123456789):
+        """
+        if len(kw):
+            con = self.db_object
+            cur = con.cursor()
+            # Prepare UPDATE query
+            # ["`mtest_build_id_pk`=[value-1]", "`mtest_build_id_name`=[value-2]", "`mtest_build_id_desc`=[value-3]"]
+            columns = sorted(kw)
+            set_str = ', '.join("`%s%s`=%s"% (self.TABLE_BUILD_ID, col_sufix, self.PARAM)
+                                for col_sufix in columns)
+            query = """UPDATE `%s`
+                          SET %s
+                        WHERE `mtest_build_id_pk`=%s"""% (self.TABLE_BUILD_ID,
+                                                          set_str,
+                                                          self.PARAM)
+            cur.execute(query, [str(kw[col_sufix]) for col_sufix in columns] + [build_id])
+            con.commit()
+
+    def insert_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_output, test_time, test_timeout, test_loop, test_extra=''):
+        """ Buffers test result entry for database. All checks regarding existing
+            toolchain names in DB are performed when entries are written.
+            If some data is missing DB will be updated
+        """
+        if not self.test_entries:
+            self.test_entries_time = time()
+        self.test_entries.append((build_id, target, toolchain, test_type,
+                                  test_id, test_result, test_output,
+                                  round(test_time, 2), round(test_timeout, 2),
+                                  test_loop, test_extra))
+        if (len(self.test_entries) >= self.TEST_ENTRY_BUFFER_SIZE or
+                time() - self.test_entries_time >= self.TEST_ENTRY_FLUSH_INTERVAL):
+            self.flush_test_entries()
+
+    def flush_test_entries(self):
+        """ Writes the buffered test entries with one INSERT, connecting to DB
+            if not connected. Entries are dropped if DB can not be reached
+        """
+        if not self.test_entries:
+            return
+        connected = self.is_connected()
+        if not connected:
+            self.reconnect()
+        if self.is_connected():
+            con = self.db_object
+            rows = []
+            for entry in self.test_entries:
+                (build_id, target, toolchain, test_type, test_id, test_result) = entry[:6]
+                # Get all table FK and if entry is new try to insert new value
+                rows.append((build_id,
+                             self.get_table_entry_pk(self.TABLE_TARGET, self.TABLE_TARGET + '_name', target),
+                             self.get_table_entry_pk(self.TABLE_TOOLCHAIN, self.TABLE_TOOLCHAIN + '_name', toolchain),
+                             self.get_table_entry_pk(self.TABLE_TEST_TYPE, self.TABLE_TEST_TYPE + '_name', test_type),
+                             self.get_table_entry_pk(self.TABLE_TEST_ID, self.TABLE_TEST_ID + '_name', test_id),
+                             self.get_table_entry_pk(self.TABLE_TEST_RESULT, self.TABLE_TEST_RESULT + '_name', test_result)) +
+                            entry[6:])
+            query = """ INSERT INTO `%s` (`mtest_build_id_fk`,
+                                          `mtest_target_fk`,
+                                          `mtest_toolchain_fk`,
+                                          `mtest_test_type_fk`,
+                                          `mtest_test_id_fk`,
+                                          `mtest_test_result_fk`,
+                                          `mtest_test_output`,
+                                          `mtest_test_time`,
+                                          `mtest_test_timeout`,
+                                          `mtest_test_loop_no`,
+                                          `mtest_test_result_extra`)
+                             VALUES (%s)"""% (self.TABLE_TEST_ENTRY,
+                                              ', '.join([self.PARAM] * 11))
+            cur = con.cursor()
+            cur.executemany(query, rows)
+            con.commit()
+        self.test_entries = []
+        if not connected and self.db_object:
+            self.db_object.close()
+            self.db_object = None
+            self.db_type = None
@@ -18,7 +18,6 @@ Author: Przemyslaw Wirkus <Przemyslaw.wirkus@arm.com>
 """
 
 from tools.utils import construct_enum, mkdir
-from prettytable import PrettyTable
 import os
 
 ResultExporterType = construct_enum(HTML='Html_Exporter',
@@ -363,6 +362,7 @@ class ReportExporter():
         """
         success_code = 0    # Success code that can be leter returned to
         # Pretty table package is used to print results
+        from prettytable import PrettyTable
         pt = PrettyTable(["Result", "Target", "Toolchain", "Test ID", "Test Description",
                           "Elapsed Time", "Timeout"])
         pt.align["Result"] = "l" # Left align
@@ -21,15 +21,22 @@ import re
 import MySQLdb as mdb
 
 # Imports from TEST API
-from tools.test_db import BaseDBAccess
+from tools.test_db import BaseDBAccess, SQLDBAccess
 
 
-class MySQLDBAccess(BaseDBAccess):
+class MySQLDBAccess(SQLDBAccess):
     """ Wrapper for MySQL DB access for common test suite interface
+
+        New names of targets, toolchains, test types, test ids and test
+        results are inserted with an upsert when their name column has a
+        unique key, and under a table lock otherwise. add_unique_keys()
+        adds the keys to an existing database.
     """
     def __init__(self):
-        BaseDBAccess.__init__(self)
+        SQLDBAccess.__init__(self)
         self.DB_TYPE = 'mysql'
+        # Whether the name column has a unique key, by (table, column)
+        self.unique_keys = {}
 
     def detect_database(self, verbose=False):
         """ detect database and return VERION data structure or string (verbose=True)
@@ -58,11 +65,6 @@ class MySQLDBAccess(BaseDBAccess):
                 result = None
         return result
 
-    def is_connected(self):
-        """ Returns True if we are connected to database
-        """
-        return self.db_object is not None
-
     def connect(self, host, user, passwd, db):
         """ Connects to DB and returns DB object
         """
@@ -93,20 +95,6 @@ class MySQLDBAccess(BaseDBAccess):
             if db_type == self.DB_TYPE:
                 self.connect(host, username, password, db_name)
 
-    def reconnect(self):
-        """ Reconnects to DB and returns DB object using stored host name,
-            database name and credentials (user name and password)
-        """
-        self.connect(self.host, self.user, self.passwd, self.db)
-
-    def disconnect(self):
-        """ Close DB connection
-        """
-        if self.db_object:
-            self.db_object.close()
-        self.db_object = None
-        self.db_type = None
-
     def escape_string(self, str):
         """ Escapes string so it can be put in SQL query between quotes
         """
@@ -114,158 +102,70 @@ class MySQLDBAccess(BaseDBAccess):
         result = con.escape_string(str)
         return result if result else ''
 
-    def select_all(self, query):
-        """ Execute SELECT query and get all results
+    def has_unique_key(self, cur, table, column):
+        """ Returns True if column alone is a unique key of table
         """
-        con = self.db_object
-        cur = con.cursor(mdb.cursors.DictCursor)
-        cur.execute(query)
-        rows = cur.fetchall()
-        return rows
-
-    def insert(self, query, commit=True):
-        """ Execute INSERT query, define if you want to commit
+        if (table, column) not in self.unique_keys:
+            cur.execute("SHOW INDEX FROM `%s`"% table)
+            names = [description[0] for description in cur.description]
+            keys = {}
+            for row in cur.fetchall():
+                index = dict(zip(names, row))
+                if not int(index['Non_unique']):
+                    keys.setdefault(index['Key_name'], []).append(index['Column_name'])
+            self.unique_keys[(table, column)] = [column] in keys.values()
+        return self.unique_keys[(table, column)]
+
+    def add_unique_keys(self):
+        """ Adds unique keys to the name columns of the tables of names, so
+            that new names are inserted with an upsert. The tables must not
+            hold the same name twice
         """
         con = self.db_object
         cur = con.cursor()
-        cur.execute(query)
-        if commit:
-            con.commit()
-        return cur.lastrowid
-
-    def get_next_build_id(self, name, desc='', location='', type=None, status=None):
-        """ Insert new build_id (DB unique build like ID number to send all test results)
-        """
-        if status is None:
-            status = self.BUILD_ID_STATUS_STARTED
-
-        if type is None:
-            type = self.BUILD_ID_TYPE_TEST
-
-        query = """INSERT INTO `%s` (%s_name, %s_desc, %s_location, %s_type_fk, %s_status_fk)
-                        VALUES ('%s', '%s', '%s', %d, %d)"""% (self.TABLE_BUILD_ID,
-                                                               self.TABLE_BUILD_ID,
-                                                               self.TABLE_BUILD_ID,
-                                                               self.TABLE_BUILD_ID,
-                                                               self.TABLE_BUILD_ID,
-                                                               self.TABLE_BUILD_ID,
-                                                               self.escape_string(name),
-                                                               self.escape_string(desc),
-                                                               self.escape_string(location),
-                                                               type,
-                                                               status)
-        index = self.insert(query) # Provide inserted record PK
-        return index
+        for table in (self.TABLE_TARGET, self.TABLE_TOOLCHAIN,
+                      self.TABLE_TEST_TYPE, self.TABLE_TEST_ID,
+                      self.TABLE_TEST_RESULT):
+            column = '%s_name'% table
+            if not self.has_unique_key(cur, table, column):
+                cur.execute("ALTER TABLE `%s` ADD UNIQUE KEY `%s_unique` (`%s`)"% (table,
+                                                                                column,
+                                                                                column))
+                self.unique_keys[(table, column)] = True
+        con.commit()
 
-    def get_table_entry_pk(self, table, column, value, update_db=True):
-        """ Checks for entries in tables with two columns (<TABLE_NAME>_pk, <column>)
-            If update_db is True updates table entry if value in specified column doesn't exist
+    def insert_table_entry(self, cur, table, column, value):
+        """ Inserts the entry with value in the column of table if it doesn't
+            exist, returning its primary key whether it was inserted or existed.
+            Without a unique key on column, locks table to perform atomic
+            read + update
         """
-        # TODO: table buffering
-        result = None
         table_pk = '%s_pk'% table
-        query = """SELECT `%s`
-                     FROM `%s`
-                    WHERE `%s`='%s'"""% (table_pk,
-                                         table,
-                                         column,
-                                         self.escape_string(value))
-        rows = self.select_all(query)
-        if len(rows) == 1:
-            result = rows[0][table_pk]
-        elif len(rows) == 0 and update_db:
-            # Update DB with new value
-            result = self.update_table_entry(table, column, value)
-        return result
+        if self.has_unique_key(cur, table, column):
+            query = """INSERT INTO `%s` (`%s`)
+                            VALUES (%%s)
+           ON DUPLICATE KEY UPDATE `%s`=LAST_INSERT_ID(`%s`)"""% (table,
+                                                                 column,
+                                                                 table_pk,
+                                                                 table_pk)
+            cur.execute(query, (value,))
+            return cur.lastrowid
 
-    def update_table_entry(self, table, column, value):
-        """ Updates table entry if value in specified column doesn't exist
-            Locks table to perform atomic read + update
-        """
-        result = None
-        con = self.db_object
-        cur = con.cursor()
         cur.execute("LOCK TABLES `%s` WRITE"% table)
-        table_pk = '%s_pk'% table
-        query = """SELECT `%s`
-                     FROM `%s`
-                    WHERE `%s`='%s'"""% (table_pk,
-                                         table,
-                                         column,
-                                         self.escape_string(value))
-        cur.execute(query)
-        rows = cur.fetchall()
-        if len(rows) == 0:
-            query = """INSERT INTO `%s` (%s)
-                            VALUES ('%s')"""% (table,
-                                               column,
-                                               self.escape_string(value))
-            cur.execute(query)
-            result = cur.lastrowid
-        con.commit()
-        cur.execute("UNLOCK TABLES")
+        try:
+            query = """SELECT `%s`
+                         FROM `%s`
+                        WHERE `%s`=%%s"""% (table_pk, table, column)
+            cur.execute(query, (value,))
+            rows = cur.fetchall()
+            if rows:
+                result = rows[0][0]
+            else:
+                query = """INSERT INTO `%s` (`%s`)
+                                VALUES (%%s)"""% (table, column)
+                cur.execute(query, (value,))
+                result = cur.lastrowid
+            self.db_object.commit()
+        finally:
+            cur.execute("UNLOCK TABLES")
         return result
-
-    def update_build_id_info(self, build_id, **kw):
-        """ Update additional data inside build_id table
-            Examples:
-            db.update_build_id_info(build_id, _status_fk=self.BUILD_ID_STATUS_COMPLETED, _shuffle_seed=0.0123456789):
-        """
-        if len(kw):
-            con = self.db_object
-            cur = con.cursor()
-            # Prepare UPDATE query
-            # ["`mtest_build_id_pk`=[value-1]", "`mtest_build_id_name`=[value-2]", "`mtest_build_id_desc`=[value-3]"]
-            set_list = []
-            for col_sufix in kw:
-                assign_str = "`%s%s`='%s'"% (self.TABLE_BUILD_ID, col_sufix, self.escape_string(str(kw[col_sufix])))
-                set_list.append(assign_str)
-            set_str = ', '.join(set_list)
-            query = """UPDATE `%s`
-                          SET %s
-                        WHERE `mtest_build_id_pk`=%d"""% (self.TABLE_BUILD_ID,
-                                                          set_str,
-                                                          build_id)
-            cur.execute(query)
-            con.commit()
-
-    def insert_test_entry(self, build_id, target, toolchain, test_type, test_id, test_result, test_output, test_time, test_timeout, test_loop, test_extra=''):
-        """ Inserts test result entry to database. All checks regarding existing
-            toolchain names in DB are performed.
-            If some data is missing DB will be updated
-        """
-        # Get all table FK and if entry is new try to insert new value
-        target_fk = self.get_table_entry_pk(self.TABLE_TARGET, self.TABLE_TARGET + '_name', target)
-        toolchain_fk = self.get_table_entry_pk(self.TABLE_TOOLCHAIN, self.TABLE_TOOLCHAIN + '_name', toolchain)
-        test_type_fk = self.get_table_entry_pk(self.TABLE_TEST_TYPE, self.TABLE_TEST_TYPE + '_name', test_type)
-        test_id_fk = self.get_table_entry_pk(self.TABLE_TEST_ID, self.TABLE_TEST_ID + '_name', test_id)
-        test_result_fk = self.get_table_entry_pk(self.TABLE_TEST_RESULT, self.TABLE_TEST_RESULT + '_name', test_result)
-
-        con = self.db_object
-        cur = con.cursor()
-
-        query = """ INSERT INTO `%s` (`mtest_build_id_fk`,
-                                      `mtest_target_fk`,
-                                      `mtest_toolchain_fk`,
-                                      `mtest_test_type_fk`,
-                                      `mtest_test_id_fk`,
-                                      `mtest_test_result_fk`,
-                                      `mtest_test_output`,
-                                      `mtest_test_time`,
-                                      `mtest_test_timeout`,
-                                      `mtest_test_loop_no`,
-                                      `mtest_test_result_extra`)
-                         VALUES (%d, %d, %d, %d, %d, %d, '%s', %.2f, %.2f, %d, '%s')"""% (self.TABLE_TEST_ENTRY,
-                                                                                          build_id,
-                                                                                          target_fk,
-                                                                                          toolchain_fk,
-                                                                                          test_type_fk,
-                                                                                          test_id_fk,
-                                                                                          test_result_fk,
-                                                                                          self.escape_string(test_output),
-                                                                                          test_time,
-                                                                                          test_timeout,
-                                                                                          test_loop,
-                                                                                          self.escape_string(test_extra))
-        cur.execute(query)
-        con.commit()
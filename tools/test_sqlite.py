@@ -0,0 +1,127 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+import sqlite3
+
+# Imports from TEST API
+from tools.test_db import SQLDBAccess
+
+
+class SQLiteDBAccess(SQLDBAccess):
+    """ Wrapper for SQLite DB access for common test suite interface, storing
+        test results in a local file with the scheme of the MySQL test
+        database. Tables are created when missing.
+    """
+    def __init__(self):
+        SQLDBAccess.__init__(self)
+        self.DB_TYPE = 'sqlite'
+        self.PARAM = '?'
+
+    def detect_database(self, verbose=False):
+        """ detect database and return VERION data structure or string (verbose=True)
+        """
+        rows = self.select_all('SELECT sqlite_version() AS version')
+        if verbose:
+            return "\tversion: %s"% rows[0]['version']
+        return rows
+
+    def parse_db_connection_string(self, str):
+        """ Parsing SQLite DB connection string, which only contains the
+            database file. Function returns tuple (db_type, None, None, None, db)
+            or None if error
+            E.g. connection string: 'sqlite:///tmp/test_results.db'
+        """
+        result = None
+        if type(str) == type(''):
+            result = re.match('^(sqlite)://(.+)$', str)
+            if result is not None:
+                (db_type, db_name) = result.groups()
+                result = (db_type, None, None, None, db_name)
+        return result
+
+    def connect(self, host, user, passwd, db):
+        """ Connects to DB file db and returns DB object. Other credentials
+            are ignored
+        """
+        try:
+            # Test results of parallel tests are written under a lock
+            self.db_object = sqlite3.connect(db, check_same_thread=False)
+            self.create_tables()
+            self.db_type = self.DB_TYPE
+            self.db = db
+        except sqlite3.Error, e:
+            print "Error: %s"% e
+            self.db_object = None
+            self.db_type = None
+            self.db = None
+
+    def connect_url(self, db_url):
+        """ Connects to database using db_url (database url parsing),
+            store db_name
+        """
+        result = self.parse_db_connection_string(db_url)
+        if result is not None:
+            (db_type, username, password, host, db_name) = result
+            self.connect(host, username, password, db_name)
+
+    def escape_string(self, str):
+        """ Escapes string so it can be put in SQL query between quotes
+        """
+        return str.replace("'", "''") if str else ''
+
+    def create_tables(self):
+        """ Creates the tables of the test database that do not exist
+        """
+        con = self.db_object
+        for table in (self.TABLE_TARGET, self.TABLE_TOOLCHAIN,
+                      self.TABLE_TEST_TYPE, self.TABLE_TEST_ID,
+                      self.TABLE_TEST_RESULT, self.TABLE_BUILD_ID_STATUS,
+                      self.TABLE_BUILD_ID_TYPE):
+            con.execute("""CREATE TABLE IF NOT EXISTS `%s` (
+                               `%s_pk` INTEGER PRIMARY KEY,
+                               `%s_name` TEXT NOT NULL UNIQUE)"""% (table, table, table))
+        con.execute("""CREATE TABLE IF NOT EXISTS `%s` (
+                           `%s_pk` INTEGER PRIMARY KEY,
+                           `%s_name` TEXT, `%s_desc` TEXT, `%s_location` TEXT,
+                           `%s_type_fk` INTEGER, `%s_status_fk` INTEGER,
+                           `%s_shuffle_seed` TEXT, `%s_muts` TEXT,
+                           `%s_test_spec` TEXT, `%s_extra` TEXT)"""% ((self.TABLE_BUILD_ID,) * 11))
+        con.execute("""CREATE TABLE IF NOT EXISTS `%s` (
+                           `mtest_test_entry_pk` INTEGER PRIMARY KEY,
+                           `mtest_build_id_fk` INTEGER,
+                           `mtest_target_fk` INTEGER,
+                           `mtest_toolchain_fk` INTEGER,
+                           `mtest_test_type_fk` INTEGER,
+                           `mtest_test_id_fk` INTEGER,
+                           `mtest_test_result_fk` INTEGER,
+                           `mtest_test_output` TEXT,
+                           `mtest_test_time` REAL,
+                           `mtest_test_timeout` REAL,
+                           `mtest_test_loop_no` INTEGER,
+                           `mtest_test_result_extra` TEXT)"""% self.TABLE_TEST_ENTRY)
+        con.commit()
+
+    def insert_table_entry(self, cur, table, column, value):
+        """ Upsert of the entry with value in the column of table, returning
+            its primary key whether it was inserted or existed
+        """
+        cur.execute("INSERT OR IGNORE INTO `%s` (`%s`) VALUES (?)"% (table, column),
+                    (value,))
+        cur.execute("SELECT `%s_pk` FROM `%s` WHERE `%s`=?"% (table, table, column),
+                    (value,))
+        return cur.fetchone()[0]
@@ -19,7 +19,7 @@ import re
 import sys
 from os import stat, walk, getcwd, sep, remove
 from copy import copy
-from time import time, sleep
+from time import time
 from types import ListType
 from shutil import copyfile
 from os.path import join, splitext, exists, relpath, dirname, basename, split, abspath, isfile, isdir, normcase
@@ -29,11 +29,17 @@ from copy import deepcopy
 from abc import ABCMeta, abstractmethod
 from distutils.spawn import find_executable
 
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Pool, TimeoutError, cpu_count
+from threading import Thread
+from Queue import Queue, Empty
 from tools.utils import run_cmd, mkdir, rel_path, ToolException, NotSupportedException, split_path, compile_worker
-from tools.settings import MBED_ORG_USER
+from tools.settings import MBED_ORG_USER, COMPILE_CACHE_DIR, COMPILE_CACHE_SIZE
 import tools.hooks as hooks
 from tools.memap import MemapParser
+from tools.toolchains.scan_cache import ScanCache
+from tools.toolchains.compile_cache import CompileCache
+from tools.toolchains.dependency_db import DependencyDB
+from tools.toolchains.build_timer import BuildTimer
 from hashlib import md5
 import fnmatch
 
@@ -42,6 +48,10 @@ import fnmatch
 CPU_COUNT_MIN = 1
 CPU_COEF = 1
 
+# Longest time, in seconds, to block waiting for a compile result. Waiting
+# in slices keeps the build interruptible by Ctrl+C
+COMPILE_WAIT_SLICE = 1.0
+
 class LazyDict(dict):
     def __init__(self):
         self.eager = {}
@@ -90,6 +100,13 @@ class LazyDict(dict):
         else:
             self.eager.update(other)
 
+    def __deepcopy__(self, memo):
+        other = LazyDict()
+        other.eager = dict((k, deepcopy(v, memo))
+                           for k, v in self.eager.iteritems())
+        other.lazy = dict(self.lazy)
+        return other
+
     def iteritems(self):
         """Warning: This forces the evaluation all of the items in this LazyDict
         that are iterated over."""
@@ -114,7 +131,23 @@ class LazyDict(dict):
         self.lazy = new_lazy
         self.eager = {}
 
-class Resources:
+def intern_path(path):
+    """Intern a byte string path, so that all Resources listing the same file
+    share a single copy of its path"""
+    return intern(path) if type(path) is str else path
+
+
+class Resources(object):
+    # Lists of paths. Resources.add concatenates them, and the path
+    # rewriting methods below rewrite each of them
+    PATH_LISTS = ('inc_dirs', 'headers', 's_sources', 'c_sources',
+                  'cpp_sources', 'objects', 'libraries', 'lib_builds',
+                  'lib_refs', 'repo_dirs', 'repo_files', 'hex_files',
+                  'bin_files', 'json_files', 'ignored_dirs')
+
+    __slots__ = PATH_LISTS + ('base_path', 'collect_ignores', 'file_basepath',
+                              'lib_dirs', 'linker_script', 'features')
+
     def __init__(self, base_path=None, collect_ignores=False):
         self.base_path = base_path
         self.collect_ignores = collect_ignores
@@ -150,6 +183,27 @@ class Resources:
         self.features = LazyDict()
         self.ignored_dirs = []
 
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+    def __deepcopy__(self, memo):
+        """Copy the containers and share the paths; the paths are immutable
+        strings, so this is as deep as a copy can be"""
+        other = Resources.__new__(Resources)
+        for name in self.PATH_LISTS:
+            setattr(other, name, list(getattr(self, name)))
+        other.base_path = self.base_path
+        other.collect_ignores = self.collect_ignores
+        other.file_basepath = dict(self.file_basepath)
+        other.lib_dirs = set(self.lib_dirs)
+        other.linker_script = self.linker_script
+        other.features = deepcopy(self.features, memo)
+        return other
+
     def __add__(self, resources):
         if resources is None:
             return self
@@ -167,47 +221,28 @@ class Resources:
             self.ignored_dirs.append(directory)
 
     def add(self, resources):
-        for f,p in resources.file_basepath.items():
-            self.file_basepath[f] = p
-
-        self.inc_dirs += resources.inc_dirs
-        self.headers += resources.headers
+        self.file_basepath.update(resources.file_basepath)
 
-        self.s_sources += resources.s_sources
-        self.c_sources += resources.c_sources
-        self.cpp_sources += resources.cpp_sources
+        for name in self.PATH_LISTS:
+            getattr(self, name).extend(getattr(resources, name))
 
         self.lib_dirs |= resources.lib_dirs
-        self.objects += resources.objects
-        self.libraries += resources.libraries
-
-        self.lib_builds += resources.lib_builds
-        self.lib_refs += resources.lib_refs
-
-        self.repo_dirs += resources.repo_dirs
-        self.repo_files += resources.repo_files
 
         if resources.linker_script is not None:
             self.linker_script = resources.linker_script
 
-        self.hex_files += resources.hex_files
-        self.bin_files += resources.bin_files
-        self.json_files += resources.json_files
-
         self.features.update(resources.features)
-        self.ignored_dirs += resources.ignored_dirs
 
         return self
 
     def _collect_duplicates(self, dupe_dict, dupe_headers):
-        for filename in self.s_sources + self.c_sources + self.cpp_sources:
+        for filename in chain(self.s_sources, self.c_sources,
+                              self.cpp_sources):
             objname, _ = splitext(basename(filename))
-            dupe_dict.setdefault(objname, set())
-            dupe_dict[objname] |= set([filename])
+            dupe_dict.setdefault(objname, set()).add(filename)
         for filename in self.headers:
             headername = basename(filename)
-            dupe_headers.setdefault(headername, set())
-            dupe_headers[headername] |= set([headername])
+            dupe_headers.setdefault(headername, set()).add(headername)
         for res in self.features.values():
             res._collect_duplicates(dupe_dict, dupe_headers)
         return dupe_dict, dupe_headers
@@ -343,6 +378,15 @@ class mbedToolchain:
 
     PROFILE_FILE_NAME = ".profile"
 
+    SCAN_CACHE_FILE_NAME = ".scan_cache.json"
+
+    DEPENDENCY_DB_FILE_NAME = ".dependencies.json"
+
+    # Scan caches and dependency databases kept in memory between builds, by
+    # class and file name, or None to read them from their files in every
+    # build. The build server keeps them. See open_cache()
+    shared_caches = None
+
     __metaclass__ = ABCMeta
 
     profile_template = {'common':[], 'c':[], 'cxx':[], 'asm':[], 'ld':[]}
@@ -393,9 +437,16 @@ class mbedToolchain:
         # Number of concurrent build jobs. 0 means auto (based on host system cores)
         self.jobs = 0
 
+        # Wall clock time, in seconds, that a parallel compile may take.
+        # None means no limit
+        self.compile_timeout = None
+
         # Ignore patterns from .mbedignore files
         self.ignore_patterns = []
-        self._ignore_regex = re.compile("$^")
+        # The same patterns, grouped by their literal directory prefix and
+        # compiled per group. See add_ignore_patterns()
+        self._ignore_groups = {}
+        self._ignore_matchers = []
 
         # Pre-mbed 2.0 ignore dirs
         self.legacy_ignore_dirs = (LEGACY_IGNORE_DIRS | TOOLCHAINS) - set([target.name, LEGACY_TOOLCHAIN_NAMES[self.name]])
@@ -430,6 +481,29 @@ class mbedToolchain:
         # header files during dependency change. See need_update()
         self.stat_cache = {}
 
+        # Parsed dependency files of the build directory, created on first use.
+        # See get_dependencies()
+        self.dependency_db = None
+
+        # Time spent, in seconds, deciding which sources need to be compiled
+        self.dependency_check_time = 0
+
+        # Timing of the phases of the build and of every compile
+        self.timer = BuildTimer()
+
+        # Persistent cache of directory scans. It lives in the build directory
+        # and is created on the first call to scan_resources(). Set to False
+        # to always walk the file system. See get_scan_cache()
+        self.scan_cache = None
+
+        # Compile cache shared between build directories, if configured
+        self.compile_cache = None
+        if COMPILE_CACHE_DIR:
+            self.compile_cache = CompileCache(COMPILE_CACHE_DIR,
+                                              COMPILE_CACHE_SIZE)
+        # Compile cache keys of the objects that are waiting to be compiled
+        self.compile_cache_keys = {}
+
         # Used by the mbed Online Build System to build in chrooted environment
         self.CHROOT = None
 
@@ -579,28 +653,61 @@ class mbedToolchain:
         if self.build_all:
             return True
 
-        if not exists(target):
+        try:
+            target_mod_time = stat(target).st_mtime
+        except OSError:
             return True
 
-        target_mod_time = stat(target).st_mtime
-
+        stat_cache = self.stat_cache
         for d in dependencies:
             # Some objects are not provided with full path and here we do not have
             # information about the library paths. Safe option: assume an update
-            if not d or not exists(d):
+            if not d:
                 return True
 
-            if not self.stat_cache.has_key(d):
-                self.stat_cache[d] = stat(d).st_mtime
+            # A single stat per dependency and build; missing files are
+            # cached as None
+            if d not in stat_cache:
+                try:
+                    stat_cache[d] = stat(d).st_mtime
+                except OSError:
+                    stat_cache[d] = None
 
-            if self.stat_cache[d] >= target_mod_time:
+            mod_time = stat_cache[d]
+            if mod_time is None or mod_time >= target_mod_time:
                 return True
 
         return False
 
     def is_ignored(self, file_path):
         """Check if file path is ignored by any .mbedignore thus far"""
-        return self._ignore_regex.match(normcase(file_path))
+        return self._match_ignored(self._ignore_matchers, normcase(file_path))
+
+    @staticmethod
+    def _match_ignored(matchers, file_path):
+        """Check a normcased path against a list of (prefix, regex) matchers"""
+        for prefix, regex in matchers:
+            if file_path.startswith(prefix) and regex.match(file_path):
+                return True
+        return False
+
+    def _ignore_matchers_within(self, prefix):
+        """The ignore matchers that may match a path starting with *prefix*.
+        Used to check all the entries of a directory against only the
+        patterns of the .mbedignore files that apply to it."""
+        return [(p, regex) for p, regex in self._ignore_matchers
+                if p.startswith(prefix) or prefix.startswith(p)]
+
+    @staticmethod
+    def _ignore_pattern_prefix(pattern):
+        """The directory part of *pattern* before its first wildcard. Only
+        paths starting with it can match the pattern."""
+        wildcard = len(pattern)
+        for char in "*?[":
+            index = pattern.find(char)
+            if index != -1:
+                wildcard = min(wildcard, index)
+        return pattern[:pattern.rfind(sep, 0, wildcard) + 1]
 
     def add_ignore_patterns(self, root, base_path, patterns):
         """Add a series of patterns to the ignored paths
@@ -612,11 +719,27 @@ class mbedToolchain:
         """
         real_base = relpath(root, base_path)
         if real_base == ".":
-            self.ignore_patterns.extend(normcase(p) for p in patterns)
+            self._extend_ignore_patterns(normcase(p) for p in patterns)
         else:
-            self.ignore_patterns.extend(normcase(join(real_base, pat)) for pat in patterns)
-        if self.ignore_patterns:
-            self._ignore_regex = re.compile("|".join(fnmatch.translate(p) for p in self.ignore_patterns))
+            self._extend_ignore_patterns(normcase(join(real_base, pat))
+                                         for pat in patterns)
+
+    def _extend_ignore_patterns(self, patterns):
+        """Add already normalized patterns to the ignored paths. Only the
+        groups of patterns that changed are compiled again."""
+        changed = set()
+        for pattern in patterns:
+            self.ignore_patterns.append(pattern)
+            prefix = self._ignore_pattern_prefix(pattern)
+            self._ignore_groups.setdefault(prefix, []).append(
+                fnmatch.translate(pattern))
+            changed.add(prefix)
+        if not changed:
+            return
+        compiled = dict(self._ignore_matchers)
+        for prefix in changed:
+            compiled[prefix] = re.compile("|".join(self._ignore_groups[prefix]))
+        self._ignore_matchers = sorted(compiled.iteritems())
 
     # Create a Resources object from the path pointed to by *path* by either traversing a
     # a directory structure, when *path* is a directory, or adding *path* to the resources,
@@ -634,18 +757,200 @@ class mbedToolchain:
                 base_path = dirname(path)
             else:
                 base_path = path
+        base_path = intern_path(base_path)
         resources.base_path = base_path
 
         if isfile(path):
             self._add_file(path, resources, base_path, exclude_paths=exclude_paths)
-        else:
+            return resources
+
+        cache = self.get_scan_cache()
+        if not cache:
             self._add_dir(path, resources, base_path, exclude_paths=exclude_paths)
+            return resources
+
+        labels = self.get_labels()
+        key = cache.make_key(getcwd(), path, base_path, exclude_paths,
+                             self.build_dir, collect_ignores,
+                             [labels[k] for k in sorted(labels)],
+                             self.ignore_patterns,
+                             sorted(self.legacy_ignore_dirs),
+                             self.LIBRARY_EXT, self.LINKER_EXT)
+        cached = cache.get_scan(key)
+        if cached is not None:
+            self._resources_from_cache(resources, cached)
+        else:
+            scan_record = {'dirs': {}, 'ignore_files': {}}
+            self._add_dir(path, resources, base_path,
+                          exclude_paths=exclude_paths, scan_record=scan_record)
+            cache.put_scan(key, scan_record['dirs'],
+                           scan_record['ignore_files'],
+                           self._resources_to_cache(resources))
+        cache.save()
         return resources
 
+    def get_scan_cache(self):
+        """Get the persistent scan cache of this toolchain, or None if there is
+        no build directory to keep it in"""
+        if (self.scan_cache is None and self.build_dir and
+                isdir(self.build_dir)):
+            self.scan_cache = self.open_cache(
+                ScanCache, join(self.build_dir, self.SCAN_CACHE_FILE_NAME))
+        return self.scan_cache
+
+    @staticmethod
+    def open_cache(cache_class, filename):
+        """Open the scan cache or dependency database *filename*, or reuse
+        the one kept in shared_caches"""
+        caches = mbedToolchain.shared_caches
+        if caches is None:
+            return cache_class(filename)
+        key = (cache_class, filename)
+        if key not in caches:
+            caches[key] = cache_class(filename)
+        return caches[key]
+
+    CACHED_RESOURCE_FIELDS = Resources.PATH_LISTS
+
+    def _resources_to_cache(self, resources):
+        """Convert the result of a directory scan into a JSON serializable
+        dict. All files of a single scan share the same base path, so only
+        the keys of file_basepath are stored."""
+        result = dict((field, getattr(resources, field))
+                      for field in self.CACHED_RESOURCE_FIELDS)
+        result['lib_dirs'] = sorted(resources.lib_dirs)
+        result['linker_script'] = resources.linker_script
+        result['file_basepath'] = resources.file_basepath.keys()
+        result['features'] = [(name, thunk.dir_path) for name, thunk
+                              in resources.features.lazy.iteritems()]
+        result['ignore_patterns'] = self.ignore_patterns
+        return result
+
+    def _resources_from_cache(self, resources, cached):
+        """Recreate the result of a directory scan from the cache"""
+        base_path = resources.base_path
+        for field in self.CACHED_RESOURCE_FIELDS:
+            setattr(resources, field, map(intern_path, cached[field]))
+        resources.lib_dirs = set(map(intern_path, cached['lib_dirs']))
+        resources.linker_script = cached['linker_script']
+        resources.file_basepath = dict.fromkeys(
+            map(intern_path, cached['file_basepath']), base_path)
+        for name, dir_path in cached['features']:
+            self._add_feature(resources, name, dir_path, base_path)
+        # The cached patterns extend the patterns known when the scan began
+        known = len(self.ignore_patterns)
+        if cached['ignore_patterns'][:known] == self.ignore_patterns:
+            self._extend_ignore_patterns(cached['ignore_patterns'][known:])
+        else:
+            self.ignore_patterns = []
+            self._ignore_groups = {}
+            self._ignore_matchers = []
+            self._extend_ignore_patterns(cached['ignore_patterns'])
+
+    def _add_feature(self, resources, name, dir_path, base_path):
+        """Add the feature directory *dir_path* to the resources, to be scanned
+        only if the config system enables the feature *name*"""
+        def closure (dir_path=dir_path, base_path=base_path):
+            return self.scan_resources(dir_path, base_path=base_path,
+                                       collect_ignores=resources.collect_ignores)
+        closure.dir_path = dir_path
+        closure.base_path = base_path
+        resources.features.add_lazy(name, closure)
+
+    def _scanner(self):
+        """A copy of this toolchain that scans with its own .mbedignore
+        patterns, so that it may scan at the same time as other copies"""
+        # Create the scan cache first, so that all copies share it
+        self.get_scan_cache()
+        scanner = copy(self)
+        scanner.ignore_patterns = list(self.ignore_patterns)
+        scanner._ignore_groups = dict((prefix, list(group)) for prefix, group
+                                      in self._ignore_groups.iteritems())
+        scanner._ignore_matchers = list(self._ignore_matchers)
+        return scanner
+
+    def scan_trees(self, scans, jobs):
+        """Scan independent directory trees at the same time
+
+        Positional arguments:
+        scans - a list of (path, base_path, collect_ignores), the arguments of
+                scan_resources for every tree
+        jobs - the number of threads to scan with
+
+        Every scan starts from the .mbedignore patterns known to this
+        toolchain, and does not see the patterns found by the other scans.
+        The patterns found are added to this toolchain afterwards, in the
+        order of *scans*.
+
+        Return value:
+        The list of Resources, in the order of *scans*
+        """
+        if not scans:
+            return []
+        known = len(self.ignore_patterns)
+        scanners = [self._scanner() for _ in scans]
+
+        results = [None] * len(scans)
+        errors = []
+        tasks = Queue()
+        for index in range(len(scans)):
+            tasks.put(index)
+
+        def worker():
+            while not errors:
+                try:
+                    index = tasks.get_nowait()
+                except Empty:
+                    return
+                path, base_path, collect_ignores = scans[index]
+                try:
+                    results[index] = scanners[index].scan_resources(
+                        path, base_path=base_path,
+                        collect_ignores=collect_ignores)
+                except Exception:
+                    errors.append(sys.exc_info())
+
+        threads = [Thread(target=worker)
+                   for _ in range(max(1, min(jobs, len(scans))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        for scanner in scanners:
+            self._extend_ignore_patterns(scanner.ignore_patterns[known:])
+        return results
+
+    def scan_features(self, resources, names, jobs):
+        """Scan the not yet scanned feature directories *names* of resources
+        at the same time. Features which can not be scanned in the
+        background are left to be scanned on first use.
+
+        Positional arguments:
+        resources - the resources that contain the features
+        names - the names of the features to scan
+        jobs - the number of threads to scan with
+        """
+        lazy = resources.features.lazy
+        names = sorted(name for name in names
+                       if hasattr(lazy.get(name), "dir_path"))
+        if not names:
+            return
+        results = self.scan_trees(
+            [(lazy[name].dir_path, lazy[name].base_path,
+              resources.collect_ignores) for name in names], jobs)
+        for name, result in zip(names, results):
+            del resources.features[name]
+            resources.features[name] = result
+
     # A helper function for scan_resources. _add_dir traverses *path* (assumed to be a
     # directory) and heeds the ".mbedignore" files along the way. _add_dir calls _add_file
     # on every file it considers adding to the resources object.
-    def _add_dir(self, path, resources, base_path, exclude_paths=None):
+    # When *scan_record* is given, the walk uses the scan cache and records the
+    # directories and ".mbedignore" files it visits in it.
+    def _add_dir(self, path, resources, base_path, exclude_paths=None,
+                 scan_record=None):
         """ os.walk(top[, topdown=True[, onerror=None[, followlinks=False]]])
         When topdown is True, the caller can modify the dirnames list in-place
         (perhaps using del or slice assignment), and walk() will only recurse into
@@ -657,9 +962,20 @@ class mbedToolchain:
         itself is generated.
         """
         labels = self.get_labels()
-        for root, dirs, files in walk(path, followlinks=True):
+        target_labels = set(labels['TARGET'])
+        toolchain_labels = set(labels['TOOLCHAIN'])
+        excluded = [join(abspath(p), "") for p in exclude_paths or []]
+        if scan_record is not None:
+            walker = self.scan_cache.walk(path, scan_record['dirs'])
+        else:
+            walker = walk(path, followlinks=True)
+        for root, dirs, files in walker:
             # Check if folder contains .mbedignore
             if ".mbedignore" in files:
+                if scan_record is not None:
+                    ignore_file = join(root, ".mbedignore")
+                    scan_record['ignore_files'][ignore_file] = \
+                        stat(ignore_file).st_mtime
                 with open (join(root,".mbedignore"), "r") as f:
                     lines=f.readlines()
                     lines = [l.strip() for l in lines] # Strip whitespaces
@@ -668,12 +984,21 @@ class mbedToolchain:
                     # Append root path to glob patterns and append patterns to ignore_patterns
                     self.add_ignore_patterns(root, base_path, lines)
 
+            # Only the patterns of the .mbedignore files that apply to this
+            # directory are checked against its entries
+            root_path = relpath(root, base_path)
+            dir_prefix = normcase(join(root_path, ""))
+            dir_matchers = self._ignore_matchers_within(dir_prefix)
+
             # Skip the whole folder if ignored, e.g. .mbedignore containing '*'
-            root_path =join(relpath(root, base_path))
-            if  (self.is_ignored(join(root_path,"")) or
+            if  (self._match_ignored(dir_matchers, dir_prefix) or
                  self.build_dir == root_path):
                 resources.ignore_dir(root_path)
                 dirs[:] = []
+                # The build directory changes with every build; it must not
+                # invalidate the cached scan
+                if scan_record is not None and self.build_dir == root_path:
+                    del scan_record['dirs'][root]
                 continue
 
             for d in copy(dirs):
@@ -684,11 +1009,12 @@ class mbedToolchain:
 
                 if ((d.startswith('.') or d in self.legacy_ignore_dirs) or
                     # Ignore targets that do not match the TARGET in extra_labels list
-                    (d.startswith('TARGET_') and d[7:] not in labels['TARGET']) or
+                    (d.startswith('TARGET_') and d[7:] not in target_labels) or
                     # Ignore toolchain that do not match the current TOOLCHAIN
-                    (d.startswith('TOOLCHAIN_') and d[10:] not in labels['TOOLCHAIN']) or
+                    (d.startswith('TOOLCHAIN_') and d[10:] not in toolchain_labels) or
                     # Ignore .mbedignore files
-                    self.is_ignored(join(relpath(root, base_path), d,"")) or
+                    self._match_ignored(dir_matchers,
+                                        dir_prefix + normcase(join(d, ""))) or
                     # Ignore TESTS dir
                     (d == 'TESTS')):
                         resources.ignore_dir(dir_path)
@@ -696,28 +1022,30 @@ class mbedToolchain:
                 elif d.startswith('FEATURE_'):
                     # Recursively scan features but ignore them in the current scan.
                     # These are dynamically added by the config system if the conditions are matched
-                    def closure (dir_path=dir_path, base_path=base_path):
-                        return self.scan_resources(dir_path, base_path=base_path,
-                                                   collect_ignores=resources.collect_ignores)
-                    resources.features.add_lazy(d[8:], closure)
+                    self._add_feature(resources, d[8:], dir_path, base_path)
                     resources.ignore_dir(dir_path)
                     dirs.remove(d)
-                elif exclude_paths:
-                    for exclude_path in exclude_paths:
-                        rel_path = relpath(dir_path, exclude_path)
-                        if not (rel_path.startswith('..')):
-                            resources.ignore_dir(dir_path)
-                            dirs.remove(d)
-                            break
+                elif excluded:
+                    abs_dir_path = join(abspath(dir_path), "")
+                    if any(abs_dir_path.startswith(e) for e in excluded):
+                        resources.ignore_dir(dir_path)
+                        dirs.remove(d)
 
             # Add root to include paths
-            root = root.rstrip("/")
+            root = intern_path(root.rstrip("/"))
             resources.inc_dirs.append(root)
             resources.file_basepath[root] = base_path
 
+            # Files directly in the base path are matched without "./"
+            file_prefix = "" if root_path == "." else dir_prefix
+            if file_prefix != dir_prefix:
+                dir_matchers = self._ignore_matchers_within(file_prefix)
             for file in files:
-                file_path = join(root, file)
-                self._add_file(file_path, resources, base_path)
+                file_path = intern_path(join(root, file))
+                resources.file_basepath[file_path] = base_path
+                if not self._match_ignored(dir_matchers,
+                                           file_prefix + normcase(file)):
+                    self._add_file_by_type(file_path, resources)
 
     # A helper function for both scan_resources and _add_dir. _add_file adds one file
     # (*file_path*) to the resources object based on the file type.
@@ -727,6 +1055,10 @@ class mbedToolchain:
         if self.is_ignored(relpath(file_path, base_path)):
             return
 
+        self._add_file_by_type(file_path, resources)
+
+    def _add_file_by_type(self, file_path, resources):
+        """Add a file, known not to be ignored, to the resources"""
         _, ext = splitext(file_path)
         ext = ext.lower()
 
@@ -899,40 +1231,93 @@ class mbedToolchain:
         self.prev_dir = None
 
         # Generate configuration header (this will update self.build_all if needed)
-        self.get_config_header()
-        self.dump_build_profile()
+        with self.timer.span("config header"):
+            self.get_config_header()
+            self.dump_build_profile()
 
         # Sort compile queue for consistency
         files_to_compile.sort()
-        for source in files_to_compile:
-            object = self.relative_object_path(
-                self.build_dir, resources.file_basepath[source], source)
-
-            # Queue mode (multiprocessing)
-            commands = self.compile_command(source, object, inc_paths)
-            if commands is not None:
-                queue.append({
-                    'source': source,
-                    'object': object,
-                    'commands': commands,
-                    'work_dir': work_dir,
-                    'chroot': self.CHROOT
-                })
-            else:
-                self.compiled += 1
-                objects.append(object)
+        check_start = time()
+        with self.timer.span("dependency check"):
+            for source in files_to_compile:
+                object = self.relative_object_path(
+                    self.build_dir, resources.file_basepath[source], source)
+
+                # Queue mode (multiprocessing)
+                commands = self.compile_command(source, object, inc_paths)
+                if commands and self.fetch_compiled(source, object, commands):
+                    commands = None
+                if commands is not None:
+                    queue.append({
+                        'source': source,
+                        'object': object,
+                        'commands': commands,
+                        'work_dir': work_dir,
+                        'chroot': self.CHROOT
+                    })
+                else:
+                    self.compiled += 1
+                    objects.append(object)
+
+            if self.dependency_db:
+                self.dependency_db.save()
+        check_time = time() - check_start
+        self.dependency_check_time += check_time
+        self.debug("Dependency check: %d of %d sources are up to date (%.3fs)"
+                   % (len(files_to_compile) - len(queue),
+                      len(files_to_compile), check_time))
 
         # Use queues/multiprocessing if cpu count is higher than setting
         jobs = self.jobs if self.jobs else cpu_count()
-        if jobs > CPU_COUNT_MIN and len(queue) > jobs:
-            return self.compile_queue(queue, objects)
-        else:
-            return self.compile_seq(queue, objects)
+        with self.timer.span("compile", sources=len(queue)):
+            if jobs > CPU_COUNT_MIN and len(queue) > jobs:
+                objects = self.compile_queue(queue, objects)
+            else:
+                objects = self.compile_seq(queue, objects)
+
+        if self.compile_cache and self.compile_cache.stored:
+            self.compile_cache.cleanup()
+        return objects
+
+    def fetch_compiled(self, source, object, commands):
+        """Try to satisfy a compile from the compile cache
+
+        Return value:
+        True if the object (and its dependency file) were taken from the cache
+        """
+        if not self.compile_cache:
+            return False
+        _, ext = splitext(source)
+        if ext.lower() not in ['.c', '.cpp']:
+            return False
+        key = self.compile_cache.get_key(commands, source, self.build_dir)
+        if key is None:
+            return False
+        dep_path = splitext(object)[0] + '.d'
+        if self.compile_cache.fetch(key, object, dep_path, self.build_dir):
+            return True
+        self.compile_cache_keys[object] = key
+        return False
+
+    def store_compiled(self, object):
+        """Add a successfully compiled object to the compile cache"""
+        key = self.compile_cache_keys.pop(object, None)
+        if key is None:
+            return
+        dep_path = splitext(object)[0] + '.d'
+        try:
+            dependencies = self.parse_dependencies(dep_path)
+        except (IOError, IndexError):
+            return
+        self.compile_cache.store(key, object, dep_path, dependencies,
+                                 self.build_dir)
 
     # Compile source files queue in sequential order
     def compile_seq(self, queue, objects):
         for item in queue:
             result = compile_worker(item)
+            self.timer.add_compile(result['source'], result['start'],
+                                   result['duration'], result['worker'])
 
             self.compiled += 1
             self.progress("compile", item['source'], build_update=True)
@@ -943,6 +1328,7 @@ class mbedToolchain:
                     res['output'],
                     res['command']
                 ])
+            self.store_compiled(result['object'])
             objects.append(result['object'])
         return objects
 
@@ -951,54 +1337,54 @@ class mbedToolchain:
         jobs_count = int(self.jobs if self.jobs else cpu_count() * CPU_COEF)
         p = Pool(processes=jobs_count)
 
-        results = []
-        for i in range(len(queue)):
-            results.append(p.apply_async(compile_worker, [queue[i]]))
-        p.close()
+        deadline = None
+        if self.compile_timeout:
+            deadline = time() + self.compile_timeout
 
-        itr = 0
-        while len(results):
-            itr += 1
-            if itr > 180000:
-                p.terminate()
-                p.join()
-                raise ToolException("Compile did not finish in 5 minutes")
-
-            sleep(0.01)
-            pending = 0
-            for r in results:
-                if r._ready is True:
-                    try:
-                        result = r.get()
-                        results.remove(r)
-
-                        self.compiled += 1
-                        self.progress("compile", result['source'], build_update=True)
-                        for res in result['results']:
-                            self.cc_verbose("Compile: %s" % ' '.join(res['command']), result['source'])
-                            self.compile_output([
-                                res['code'],
-                                res['output'],
-                                res['command']
-                            ])
-                        objects.append(result['object'])
-                    except ToolException, err:
-                        if p._taskqueue.queue:
-                            p._taskqueue.queue.clear()
-                            sleep(0.5)
-                        p.terminate()
-                        p.join()
-                        raise ToolException(err)
-                else:
-                    pending += 1
-                    if pending >= jobs_count:
-                        break
+        try:
+            # Results are handled in the order in which they complete
+            results = p.imap_unordered(compile_worker, queue)
+            for _ in range(len(queue)):
+                result = self._next_compile_result(results, deadline)
+                self.timer.add_compile(result['source'], result['start'],
+                                       result['duration'], result['worker'])
+
+                self.compiled += 1
+                self.progress("compile", result['source'], build_update=True)
+                for res in result['results']:
+                    self.cc_verbose("Compile: %s" % ' '.join(res['command']), result['source'])
+                    self.compile_output([
+                        res['code'],
+                        res['output'],
+                        res['command']
+                    ])
+                self.store_compiled(result['object'])
+                objects.append(result['object'])
+        except:
+            # Abort all outstanding jobs on the first error
+            p.terminate()
+            p.join()
+            raise
 
-        results = None
+        p.close()
         p.join()
 
         return objects
 
+    def _next_compile_result(self, results, deadline):
+        """Wait for the next result of an imap_unordered iterator, raising a
+        ToolException once the *deadline* (as returned by time()) passes"""
+        while True:
+            wait = COMPILE_WAIT_SLICE
+            if deadline is not None:
+                wait = max(min(wait, deadline - time()), 0)
+            try:
+                return results.next(wait)
+            except TimeoutError:
+                if deadline is not None and time() >= deadline:
+                    raise ToolException("Compile did not finish in %s seconds"
+                                        % self.compile_timeout)
+
     # Determine the compile command based on type of source file
     def compile_command(self, source, object, includes):
         # Check dependencies
@@ -1009,8 +1395,8 @@ class mbedToolchain:
             base, _ = splitext(object)
             dep_path = base + '.d'
             try:
-                deps = self.parse_dependencies(dep_path) if (exists(dep_path)) else []
-            except IOError, IndexError:
+                deps = self.get_dependencies(dep_path)
+            except (IOError, IndexError):
                 deps = []
             config_file = ([self.config.app_config_location]
                            if self.config.app_config_location else [])
@@ -1034,6 +1420,24 @@ class mbedToolchain:
 
         return None
 
+    def get_dependencies(self, dep_path):
+        """Get the dependencies listed in a dependency file, using the
+        dependency database of the build directory when there is one.
+
+        Positional arguments:
+        dep_path -- the path to a file generated by a previous run of the compiler
+
+        Return value:
+        A list of all source files that the dependency file indicated were
+        dependencies, or an empty list if the file does not exist
+        """
+        if self.dependency_db is None and self.build_dir and isdir(self.build_dir):
+            self.dependency_db = self.open_cache(
+                DependencyDB, join(self.build_dir, self.DEPENDENCY_DB_FILE_NAME))
+        if self.dependency_db:
+            return self.dependency_db.get(dep_path, self.parse_dependencies)
+        return self.parse_dependencies(dep_path) if exists(dep_path) else []
+
     def parse_dependencies(self, dep_path):
         """Parse the dependency information generated by the compiler.
 
@@ -1138,15 +1542,19 @@ class mbedToolchain:
         if self.need_update(elf, dependencies):
             needed_update = True
             self.progress("link", name)
-            self.link(elf, r.objects, r.libraries, r.lib_dirs, r.linker_script)
+            with self.timer.span("link"):
+                self.link(elf, r.objects, r.libraries, r.lib_dirs,
+                          r.linker_script)
 
         if bin and self.need_update(bin, [elf]):
             needed_update = True
             self.progress("elf2bin", name)
-            self.binary(r, elf, bin)
+            with self.timer.span("elf2bin"):
+                self.binary(r, elf, bin)
 
         # Initialize memap and process map file. This doesn't generate output.
-        self.mem_stats(map)
+        with self.timer.span("memap"):
+            self.mem_stats(map)
 
         self.var("compile_succeded", True)
         self.var("binary", filename)
@@ -1565,6 +1973,10 @@ class mbedToolchain:
         to_ret['assembler'] = {'flags': copy(self.flags['asm']),
                                'symbols': self.get_symbols(True)}
         to_ret['linker'] = {'flags': copy(self.flags['ld'])}
+        to_ret['dependency_check_time'] = self.dependency_check_time
+        to_ret['build_phases'] = self.timer.totals()
+        if self.compile_cache:
+            to_ret['compile_cache'] = self.compile_cache.report
         to_ret.update(self.config.report)
         return to_ret
 
@@ -0,0 +1,136 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+from os import getpid
+from time import time
+from contextlib import contextmanager
+
+
+class BuildTimer(object):
+    """Timing of the phases of a build, and of every compile within it
+
+    Phases are recorded as nested spans. Compiles are reported by the
+    compile workers, which may be other processes. Everything can be
+    written as a Chrome trace (load it in chrome://tracing) or as a
+    summary table.
+    """
+    # Number of compiles listed in the summary
+    SLOWEST_COMPILES = 10
+
+    def __init__(self):
+        self.start = time()
+        self.spans = []
+        self.compiles = []
+        self._depth = 0
+
+    @contextmanager
+    def span(self, name, **args):
+        """Time the body of a with statement as the phase *name*. Any keyword
+        arguments are shown with the span in the trace."""
+        start = time()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.spans.append({"name": name, "start": start,
+                               "duration": time() - start,
+                               "depth": self._depth, "args": args})
+
+    def add_compile(self, source, start, duration, worker):
+        """Record the compile of *source*, which took *duration* seconds from
+        *start* in the process *worker*"""
+        self.compiles.append({"name": source, "start": start,
+                              "duration": duration, "worker": worker})
+
+    def totals(self):
+        """The total time spent in every top level phase, by name"""
+        totals = {}
+        for span in self.spans:
+            if span["depth"] == 0:
+                totals[span["name"]] = (totals.get(span["name"], 0) +
+                                        span["duration"])
+        return totals
+
+    def trace_events(self):
+        """All spans and compiles in the Chrome trace event format"""
+        pid = getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": pid,
+                   "args": {"name": "build"}}]
+        for worker in sorted(set(c["worker"] for c in self.compiles) -
+                             set([pid])):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                           "tid": worker,
+                           "args": {"name": "compile worker %d" % worker}})
+        for span in self.spans:
+            events.append({"name": span["name"], "cat": "build", "ph": "X",
+                           "ts": self._microseconds(span["start"]),
+                           "dur": int(span["duration"] * 1000000),
+                           "pid": pid, "tid": pid, "args": span["args"]})
+        for job in self.compiles:
+            events.append({"name": job["name"], "cat": "compile", "ph": "X",
+                           "ts": self._microseconds(job["start"]),
+                           "dur": int(job["duration"] * 1000000),
+                           "pid": pid, "tid": job["worker"]})
+        return events
+
+    def _microseconds(self, timestamp):
+        return int((timestamp - self.start) * 1000000)
+
+    def write_trace(self, filename):
+        """Write a Chrome trace event file"""
+        with open(filename, "w") as fd:
+            json.dump({"traceEvents": self.trace_events(),
+                       "displayTimeUnit": "ms"}, fd)
+
+    def summary(self):
+        """A table of the time spent in every phase, and the slowest compiles"""
+        from prettytable import PrettyTable
+        elapsed = time() - self.start
+        phases = PrettyTable(["Phase", "Count", "Time (s)", "% of build"])
+        phases.align["Phase"] = "l"
+        stats = {}
+        order = []
+        for span in sorted(self.spans, key=lambda s: s["start"]):
+            name = "  " * span["depth"] + span["name"]
+            if name not in stats:
+                stats[name] = [0, 0]
+                order.append(name)
+            stats[name][0] += 1
+            stats[name][1] += span["duration"]
+        for name in order:
+            count, duration = stats[name]
+            phases.add_row([name, count, "%.3f" % duration,
+                            "%.1f" % (100.0 * duration / elapsed
+                                      if elapsed else 0)])
+        phases.add_row(["Total", "", "%.3f" % elapsed, "100.0"])
+        output = [phases.get_string()]
+
+        if self.compiles:
+            slowest = PrettyTable(["Source", "Time (s)"])
+            slowest.align["Source"] = "l"
+            jobs = sorted(self.compiles, key=lambda job: -job["duration"])
+            for job in jobs[:self.SLOWEST_COMPILES]:
+                slowest.add_row([job["name"], "%.3f" % job["duration"]])
+            output.append("Slowest of %d compiles:" % len(self.compiles))
+            output.append(slowest.get_string())
+        return "\n".join(output) + "\n"
+
+    def write_summary(self, filename):
+        """Write the summary table to a file"""
+        with open(filename, "w") as fd:
+            fd.write(self.summary())
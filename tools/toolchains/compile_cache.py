@@ -0,0 +1,231 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import re
+import json
+from os import stat, walk, remove, rename, utime, getpid
+from os.path import join, exists, isabs, dirname
+from shutil import copyfile
+from hashlib import md5
+from distutils.spawn import find_executable
+
+from tools.utils import mkdir
+
+# The build timestamp macro is different for every build; it must not be
+# part of the cache key
+TIMESTAMP_PATTERN = re.compile(r"MBED_BUILD_TIMESTAMP=[\d.]+")
+
+
+class CompileCache(object):
+    """A content addressed cache of compiled objects, shared between build
+    directories (similar to ccache in "direct mode")
+
+    Objects are looked up in two steps. The command line, the compiler
+    executable and the contents of the source file give the manifest key.
+    The manifest lists the objects compiled with that key, together with the
+    contents hash of every dependency (from the .d file) they were compiled
+    with. An object is used when all of its dependencies are unchanged.
+
+    Paths within the build directory are stored relative to it, so objects
+    may be shared by any build directory of the same source tree.
+    """
+    VERSION = 1
+
+    # Number of objects remembered per manifest
+    MANIFEST_ENTRIES = 8
+
+    BUILD_DIR_TOKEN = "<BUILD_DIR>"
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._hashes = {}
+        self._tools = {}
+
+    def file_hash(self, path):
+        """Hash of the contents of a file, or None if it can not be read.
+        Files are only read once per instance of the cache."""
+        if path not in self._hashes:
+            try:
+                with open(path, "rb") as fd:
+                    self._hashes[path] = md5(fd.read()).hexdigest()
+            except IOError:
+                self._hashes[path] = None
+        return self._hashes[path]
+
+    def tool_id(self, executable):
+        """Identify the compiler executable by its location, size and
+        modification time"""
+        if executable not in self._tools:
+            location = (executable if isabs(executable)
+                        else find_executable(executable))
+            try:
+                info = stat(location)
+                self._tools[executable] = [location, info.st_size,
+                                           info.st_mtime]
+            except (OSError, TypeError):
+                self._tools[executable] = [executable]
+        return self._tools[executable]
+
+    def _to_token(self, text, build_dir):
+        if not build_dir:
+            return text
+        return text.replace(build_dir, self.BUILD_DIR_TOKEN)
+
+    def _from_token(self, text, build_dir):
+        return text.replace(self.BUILD_DIR_TOKEN, build_dir or "")
+
+    def get_key(self, commands, source, build_dir):
+        """Create the manifest key of a compile
+
+        Positional arguments:
+        commands - the commands, as returned by compile_c or compile_cpp
+        source - the file being compiled
+        build_dir - the build directory that the object is placed in
+        """
+        source_hash = self.file_hash(source)
+        if source_hash is None:
+            return None
+        normalized = [[TIMESTAMP_PATTERN.sub("MBED_BUILD_TIMESTAMP",
+                                             self._to_token(arg, build_dir))
+                       for arg in command] for command in commands]
+        parts = [self.VERSION, [self.tool_id(c[0]) for c in commands],
+                 normalized, source_hash]
+        return md5(json.dumps(parts)).hexdigest()
+
+    def _manifest_path(self, key):
+        return join(self.path, "manifests", key[:2], key + ".json")
+
+    def _object_path(self, object_key):
+        return join(self.path, "objects", object_key[:2], object_key)
+
+    def _read_manifest(self, key):
+        try:
+            with open(self._manifest_path(key)) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return []
+
+    @staticmethod
+    def _write_file(path, content):
+        """Write to a temporary file first, so that a concurrent build never
+        sees a partially written file"""
+        mkdir(dirname(path))
+        tmp_path = "%s.%d.tmp" % (path, getpid())
+        with open(tmp_path, "wb") as fd:
+            fd.write(content)
+        if exists(path):
+            remove(path)
+        rename(tmp_path, path)
+
+    def fetch(self, key, object, dep_path, build_dir):
+        """Copy a cached object and its dependency file into place
+
+        Return value:
+        True when the object was found in the cache
+        """
+        for entry in self._read_manifest(key):
+            if all(self.file_hash(self._from_token(dep, build_dir)) == digest
+                   for dep, digest in entry["deps"]):
+                cached = self._object_path(entry["object"])
+                try:
+                    with open(cached + ".d", "rb") as fd:
+                        deps_content = fd.read()
+                    copyfile(cached + ".o", object)
+                    # Mark the object as recently used
+                    utime(cached + ".o", None)
+                except (IOError, OSError):
+                    continue
+                with open(dep_path, "wb") as fd:
+                    fd.write(self._from_token(deps_content, build_dir))
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def store(self, key, object, dep_path, dependencies, build_dir):
+        """Add a freshly compiled object to the cache
+
+        Positional arguments:
+        key - the manifest key, as returned by get_key
+        object - the object file
+        dep_path - the dependency file generated with the object
+        dependencies - the files listed in the dependency file
+        build_dir - the build directory that the object was placed in
+        """
+        deps = []
+        for dep in sorted(set(dependencies)):
+            digest = self.file_hash(dep)
+            if digest is None:
+                return
+            deps.append([self._to_token(dep, build_dir), digest])
+        object_key = md5(key + json.dumps(deps)).hexdigest()
+        try:
+            with open(object, "rb") as fd:
+                object_content = fd.read()
+            with open(dep_path, "rb") as fd:
+                deps_content = self._to_token(fd.read(), build_dir)
+            cached = self._object_path(object_key)
+            self._write_file(cached + ".o", object_content)
+            self._write_file(cached + ".d", deps_content)
+            manifest = [entry for entry in self._read_manifest(key)
+                        if entry["object"] != object_key]
+            manifest.insert(0, {"deps": deps, "object": object_key})
+            self._write_file(self._manifest_path(key),
+                             json.dumps(manifest[:self.MANIFEST_ENTRIES]))
+        except (IOError, OSError):
+            # The cache is an optimization only; never fail a build over it
+            return
+        self.stored += 1
+
+    def cleanup(self):
+        """Evict the least recently used objects until the cache is smaller
+        than its maximum size"""
+        objects = []
+        total = 0
+        for root, _, files in walk(join(self.path, "objects")):
+            for name in files:
+                if name.endswith(".o"):
+                    path = join(root, name)
+                    try:
+                        info = stat(path)
+                        dep_info = stat(path[:-2] + ".d")
+                    except OSError:
+                        continue
+                    size = info.st_size + dep_info.st_size
+                    objects.append((info.st_mtime, size, path))
+                    total += size
+        if total <= self.max_size:
+            return
+        objects.sort()
+        for _, size, path in objects:
+            for to_remove in (path, path[:-2] + ".d"):
+                try:
+                    remove(to_remove)
+                except OSError:
+                    pass
+            total -= size
+            # Leave some headroom, so that eviction does not run every build
+            if total <= self.max_size * 0.8:
+                break
+
+    @property
+    def report(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "stored": self.stored}
@@ -0,0 +1,103 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+from os import stat, rename, remove
+from os.path import exists
+
+
+class DependencyDB(object):
+    """The parsed contents of all dependency (.d) files of a build directory,
+    stored in a single file
+
+    An entry is reused for as long as the modification time of its .d file
+    is unchanged. Dependency paths are shared between entries through a
+    table of unique paths, which keeps the file small.
+    """
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Read the database, silently starting from scratch if it does not
+        exist or was written by another version of the tools"""
+        if not exists(self.filename):
+            return
+        try:
+            with open(self.filename) as fd:
+                data = json.load(fd)
+            if data["version"] != self.VERSION:
+                return
+            paths = [str(p) for p in data["paths"]]
+            self.entries = dict(
+                (str(dep_path), (mtime, [paths[i] for i in indices]))
+                for dep_path, (mtime, indices)
+                in data["entries"].iteritems())
+        except (IOError, ValueError, KeyError, IndexError, TypeError):
+            self.entries = {}
+
+    def save(self):
+        """Write the database if any entry changed since it was loaded"""
+        if not self.dirty:
+            return
+        paths = []
+        indices = {}
+        entries = {}
+        for dep_path, (mtime, dependencies) in self.entries.iteritems():
+            entry = []
+            for dep in dependencies:
+                if dep not in indices:
+                    indices[dep] = len(paths)
+                    paths.append(dep)
+                entry.append(indices[dep])
+            entries[dep_path] = (mtime, entry)
+        tmp_file = self.filename + ".tmp"
+        try:
+            with open(tmp_file, "w") as fd:
+                json.dump({"version": self.VERSION, "paths": paths,
+                           "entries": entries}, fd, separators=(",", ":"))
+            if exists(self.filename):
+                remove(self.filename)
+            rename(tmp_file, self.filename)
+        except (IOError, OSError):
+            # The database is an optimization only; never fail a build over it
+            return
+        self.dirty = False
+
+    def get(self, dep_path, parse):
+        """Get the dependencies listed in the file *dep_path*
+
+        Positional arguments:
+        dep_path - the dependency file generated by the compiler
+        parse - the function that parses *dep_path* when it changed
+
+        Return value:
+        The list of dependencies, or an empty list if there is no such file
+        """
+        try:
+            mtime = stat(dep_path).st_mtime
+        except OSError:
+            return []
+        entry = self.entries.get(dep_path)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, parse(dep_path))
+            self.entries[dep_path] = entry
+            self.dirty = True
+        return list(entry[1])
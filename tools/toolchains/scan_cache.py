@@ -0,0 +1,199 @@
+"""
+mbed SDK
+Copyright (c) 2017 ARM Limited
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import json
+import sys
+from os import listdir, stat, rename, remove
+from os.path import join, isdir, exists
+from hashlib import md5
+from threading import RLock
+
+FS_ENCODING = sys.getfilesystemencoding() or "utf-8"
+
+
+def _encode(obj):
+    """Convert the unicode strings produced by the JSON decoder back into
+    the byte strings that os.walk produces for byte string paths"""
+    if isinstance(obj, dict):
+        return dict((_encode(k), _encode(v)) for k, v in obj.iteritems())
+    elif isinstance(obj, list):
+        return [_encode(e) for e in obj]
+    elif isinstance(obj, unicode):
+        return obj.encode(FS_ENCODING)
+    else:
+        return obj
+
+
+class ScanCache(object):
+    """A persistent cache for mbedToolchain.scan_resources
+
+    The cache is kept as a single JSON file (usually in the build directory)
+    and works at two levels:
+     - directory listings, which are reused for as long as the modification
+       time of the directory is unchanged. A directory's mtime changes when
+       entries are added, removed or renamed, so only those directories are
+       listed again.
+     - complete scan results, stored under a key that describes everything
+       a scan depends on (labels, ignore patterns, exclude paths, ...).
+       A scan result is only reused when none of the directories or
+       .mbedignore files visited by the scan have changed.
+
+    A cache may be shared by several threads scanning at the same time.
+    """
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.listings = {}
+        self.scans = {}
+        self.dirty = False
+        # Entries used during this session. Anything else is dropped the
+        # next time the cache is saved, so that the file does not grow
+        # without bound as the tree changes.
+        self._used_listings = set()
+        self._used_scans = set()
+        self._lock = RLock()
+        self.load()
+
+    def load(self):
+        """Read the cache file, silently starting from scratch if it does not
+        exist or was written by another version of the tools"""
+        if not exists(self.filename):
+            return
+        try:
+            with open(self.filename) as fd:
+                data = json.load(fd)
+        except (IOError, ValueError):
+            return
+        if data.get("version") != self.VERSION:
+            return
+        self.listings = _encode(data.get("listings", {}))
+        self.scans = _encode(data.get("scans", {}))
+
+    def save(self):
+        """Write the cache file if anything changed since it was loaded"""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.dirty:
+            return
+        data = {
+            "version": self.VERSION,
+            "listings": dict((k, v) for k, v in self.listings.iteritems()
+                             if k in self._used_listings),
+            "scans": dict((k, v) for k, v in self.scans.iteritems()
+                          if k in self._used_scans),
+        }
+        tmp_file = self.filename + ".tmp"
+        try:
+            with open(tmp_file, "w") as fd:
+                json.dump(data, fd)
+            if exists(self.filename):
+                remove(self.filename)
+            rename(tmp_file, self.filename)
+        except (IOError, OSError):
+            # The cache is an optimization only; never fail a build over it
+            return
+        self.dirty = False
+
+    @staticmethod
+    def make_key(*parts):
+        """Create a cache key from any JSON serializable arguments"""
+        return md5(json.dumps(parts, sort_keys=True)).hexdigest()
+
+    def listdir(self, path):
+        """List a directory, returning a tuple of its mtime, the
+        subdirectories and the other files within it, or None if the
+        directory could not be read.
+        """
+        try:
+            mtime = stat(path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            self._used_listings.add(path)
+            cached = self.listings.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached
+        try:
+            names = listdir(path)
+        except OSError:
+            return None
+        dirs, files = [], []
+        for name in names:
+            if isdir(join(path, name)):
+                dirs.append(name)
+            else:
+                files.append(name)
+        listing = [mtime, dirs, files]
+        with self._lock:
+            self.listings[path] = listing
+            self.dirty = True
+        return listing
+
+    def walk(self, top, visited):
+        """A drop in replacement for os.walk(top, followlinks=True) that uses
+        cached listings where possible. The mtime of every directory yielded
+        is recorded in the dict *visited*.
+        """
+        listing = self.listdir(top)
+        if listing is None:
+            return
+        mtime, dirs, files = listing
+        visited[top] = mtime
+        # Copy the lists, as the caller may prune dirs in place
+        dirs = list(dirs)
+        yield top, dirs, list(files)
+        for name in dirs:
+            for entry in self.walk(join(top, name), visited):
+                yield entry
+
+    def get_scan(self, key):
+        """Return the scan result stored with *key* if everything it was
+        created from is unchanged, or None otherwise"""
+        entry = self.scans.get(key)
+        if entry is None:
+            return None
+        for paths in (entry["dirs"], entry["ignore_files"]):
+            for path, mtime in paths.iteritems():
+                try:
+                    if stat(path).st_mtime != mtime:
+                        return None
+                except OSError:
+                    return None
+        with self._lock:
+            self._used_scans.add(key)
+            self._used_listings.update(entry["dirs"])
+        return entry["result"]
+
+    def put_scan(self, key, dirs, ignore_files, result):
+        """Store the scan result *result* with *key*
+
+        Positional arguments:
+        key - the key created with make_key
+        dirs - a dict of all the directories visited by the scan to their mtime
+        ignore_files - a dict of all .mbedignore files read to their mtime
+        result - the JSON serializable result of the scan
+        """
+        with self._lock:
+            self.scans[key] = {
+                "dirs": dirs,
+                "ignore_files": ignore_files,
+                "result": result,
+            }
+            self._used_scans.add(key)
+            self.dirty = True
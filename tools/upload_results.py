@@ -15,14 +15,43 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import sys
+import json
+import gzip
 import argparse
 import xml.etree.ElementTree as ET
 import requests
 import urlparse
+from StringIO import StringIO
+from hashlib import sha1
+from time import sleep
+from os import rename, remove
+from os.path import exists
+
+# Responses after which a part is sent again: the server did not store it.
+# After a gateway error or a timeout, it may have, and the part is not sent
+# again so that its project runs are not added twice.
+RETRY_STATUSES = frozenset([500, 503])
+
+# Seconds to wait for the server to respond to a part
+REQUEST_TIMEOUT = 300
+# Responses of servers that do not accept gzip request bodies
+GZIP_REJECTED_STATUSES = frozenset([400, 415])
 
 def create_headers(args):
     return { 'X-Api-Key':  args.api_key }
 
+def create_session(args, pool_size=10):
+    '''
+    Session sending the API key, keeping up to pool_size connections to the
+    site open between requests
+    '''
+    session = requests.Session()
+    session.headers.update(create_headers(args))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 def finish_command(command, response):
     print(command, response.status_code, response.reason)
     print(response.text)
@@ -132,19 +161,13 @@ def add_project_runs(args):
         add_report(project_run_data, args.test_report, False, args.build_id, args.host_os)
 
     ts_data = format_project_run_data(project_run_data, args.limit)
-    total_result = True
-    
-    total_parts = len(ts_data)
-    print "Uploading project runs in %d parts" % total_parts
-    
-    for index, data in enumerate(ts_data):
-        r = requests.post(urlparse.urljoin(args.url, "api/projectRuns"), headers=create_headers(args), json=data)
-        print("add-project-runs part %d/%d" % (index + 1, total_parts), r.status_code, r.reason)
-        print(r.text)
-    
-        if r.status_code >= 400:
-            total_result = False
-    
+
+    session = create_session(args, args.jobs)
+    total_result = upload_project_runs(session, urlparse.urljoin(args.url, "api/projectRuns"),
+                                       ts_data, jobs=args.jobs, retries=args.retries,
+                                       compress=args.gzip, manifest=args.manifest,
+                                       build_id=args.build_id)
+
     if total_result:
         print "'add-project-runs' completed successfully"
         sys.exit(0)
@@ -152,6 +175,136 @@ def add_project_runs(args):
         print "'add-project-runs' failed"
         sys.exit(2)
 
+def encode_part(data, compress=False):
+    '''
+    JSON body of a part of the project runs, gzipped if compress is True, and
+    the headers describing it
+    '''
+    body = json.dumps(data)
+    headers = {'Content-Type': 'application/json'}
+    if compress:
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as fd:
+            fd.write(body)
+        body = buf.getvalue()
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+def part_digest(data):
+    '''
+    Identifies a part of the project runs in the resume manifest
+    '''
+    return sha1(json.dumps(data, sort_keys=True)).hexdigest()
+
+def post_part(session, url, body, headers, retries=3, backoff=1.0):
+    '''
+    POST a part, sending it again when the connection could not be made and
+    after 500 and 503 responses, waiting backoff seconds before the first
+    retry and twice as long before every next one. Parts are not sent again
+    after a timeout or another response, as the server may have stored them.
+
+    Returns the last response, or raises the last connection error
+    '''
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1))
+        try:
+            r = session.post(url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.ConnectionError:
+            if attempt == retries:
+                raise
+            continue
+        if r.status_code not in RETRY_STATUSES:
+            break
+    return r
+
+def load_manifest(path, build_id):
+    '''
+    Digests of the parts of build_id already uploaded, as recorded in the
+    manifest at path
+    '''
+    if path and exists(path):
+        with open(path) as fd:
+            manifest = json.load(fd)
+        if manifest.get('build') == build_id:
+            return set(manifest['uploaded'])
+    return set()
+
+def save_manifest(path, build_id, uploaded):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fd:
+        json.dump({'build': build_id, 'uploaded': sorted(uploaded)}, fd)
+    if exists(path):
+        remove(path)
+    rename(tmp_path, path)
+
+def upload_project_runs(session, url, ts_data, jobs=4, retries=3, backoff=1.0,
+                        compress=False, manifest=None, build_id=None):
+    '''
+    Upload the parts of the project runs made by format_project_run_data,
+    up to jobs parts at a time
+
+    When compress is True, the parts are sent gzipped until the server
+    rejects a gzipped part with a 400 or 415 response. That part and all the
+    next ones are then sent uncompressed.
+
+    When manifest is a path, the parts uploaded are recorded there, and
+    parts recorded for the same build_id by an earlier upload are skipped.
+    The manifest is removed once every part is uploaded.
+
+    Returns True if every part was uploaded
+    '''
+    from multiprocessing.pool import ThreadPool
+
+    uploaded = load_manifest(manifest, build_id)
+    total_parts = len(ts_data)
+    parts = []
+    for index, data in enumerate(ts_data):
+        digest = part_digest(data)
+        if digest not in uploaded:
+            parts.append((index, digest, data))
+
+    print "Uploading project runs in %d parts" % total_parts
+    if len(parts) < total_parts:
+        print "Skipping %d parts uploaded before" % (total_parts - len(parts))
+
+    gzip_accepted = [compress]
+
+    def upload(part):
+        index, digest, data = part
+        try:
+            compressed = gzip_accepted[0]
+            body, headers = encode_part(data, compressed)
+            r = post_part(session, url, body, headers, retries, backoff)
+            if compressed and r.status_code in GZIP_REJECTED_STATUSES:
+                if gzip_accepted[0]:
+                    gzip_accepted[0] = False
+                    print "Server rejected a gzipped part (%d), sending the parts uncompressed" % r.status_code
+                body, headers = encode_part(data, False)
+                r = post_part(session, url, body, headers, retries, backoff)
+        except requests.exceptions.RequestException as e:
+            return index, digest, None, str(e)
+        return index, digest, r.status_code, r.reason if r.status_code < 400 else r.text
+
+    total_result = True
+    pool = ThreadPool(max(1, min(jobs, len(parts))))
+    try:
+        for index, digest, status_code, message in pool.imap_unordered(upload, parts):
+            print("add-project-runs part %d/%d" % (index + 1, total_parts), status_code, message)
+            if status_code is not None and status_code < 400:
+                uploaded.add(digest)
+                if manifest:
+                    save_manifest(manifest, build_id, uploaded)
+            else:
+                total_result = False
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if total_result and manifest and exists(manifest):
+        remove(manifest)
+    return total_result
+
 def prep_ts_data():
     ts_data = {}
     ts_data['projectRuns'] = []
@@ -364,6 +517,10 @@ def main(arguments):
     add_project_runs_parser.add_argument('-t', '--test-report', required=False, help='path to junit xml test report')
     add_project_runs_parser.add_argument('-o', '--host-os', required=True, help='host os on which test was run')
     add_project_runs_parser.add_argument('-l', '--limit', required=False, type=int, default=1000, help='Limit the number of project runs sent at a time to avoid HTTP errors (default is 1000)')
+    add_project_runs_parser.add_argument('-j', '--jobs', required=False, type=int, default=4, help='Number of parts uploaded at the same time (default is 4)')
+    add_project_runs_parser.add_argument('--retries', required=False, type=int, default=3, help='Number of times a part is sent again when the connection could not be made or after a 500 or 503 response (default is 3)')
+    add_project_runs_parser.add_argument('-m', '--manifest', required=False, help='path to a file recording the parts uploaded, so that uploading the same build again only sends the others')
+    add_project_runs_parser.add_argument('--gzip', action='store_true', help='send the parts gzipped, falling back to uncompressed parts if the server rejects them')
     add_project_runs_parser.set_defaults(func=add_project_runs)
 
     args = parser.parse_args(arguments)
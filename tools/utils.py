@@ -19,16 +19,16 @@ import inspect
 import os
 import argparse
 import math
-from os import listdir, remove, makedirs
+from os import listdir, remove, makedirs, getpid
 from shutil import copyfile
 from os.path import isdir, join, exists, split, relpath, splitext, abspath
 from os.path import commonprefix, normpath, dirname
 from subprocess import Popen, PIPE, STDOUT, call
 from math import ceil
+from time import time
 import json
 from collections import OrderedDict
 import logging
-from intelhex import IntelHex
 
 def remove_if_in(lst, thing):
     if thing in lst:
@@ -42,6 +42,7 @@ def compile_worker(job):
           to run_cmd
     """
     results = []
+    start = time()
     for command in job['commands']:
         try:
             _, _stderr, _rc = run_cmd(command, work_dir=job['work_dir'],
@@ -59,7 +60,10 @@ def compile_worker(job):
         'source': job['source'],
         'object': job['object'],
         'commands': job['commands'],
-        'results': results
+        'results': results,
+        'start': start,
+        'duration': time() - start,
+        'worker': getpid()
     }
 
 def cmd(command, check=True, verbose=False, shell=False, cwd=None):
@@ -516,16 +520,3 @@ def print_large_string(large_string):
             sys.stdout.write(large_string[start_index:
                                           start_index + string_limit])
     sys.stdout.write("\n")
-
-def intelhex_offset(filename, offset):
-    """Load a hex or bin file at a particular offset"""
-    _, inteltype = splitext(filename)
-    ih = IntelHex()
-    if inteltype == ".bin":
-        ih.loadbin(filename, offset=offset)
-    elif inteltype == ".hex":
-        ih.loadhex(filename)
-    else:
-        raise ToolException("File %s does not have a known binary file type"
-                            % filename)
-    return ih